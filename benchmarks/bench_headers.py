@@ -0,0 +1,71 @@
+"""
+Response header parsing: email.parser against HTTPHeaders.
+
+Parses a 12-field header block with two ``Set-Cookie`` lines, alone and
+followed by the :func:`~httpsec.parser.body_framing` lookups every
+response makes, and checks both parsers agree on the fields::
+
+    $ PYTHONPATH=. python benchmarks/bench_headers.py
+"""
+import argparse
+import email.parser
+import timeit
+from http.client import HTTPMessage
+
+from httpsec.headers import HTTPHeaders
+from httpsec.parser import body_framing
+
+BLOCK = (b"Date: Sat, 18 Oct 2026 10:00:00 GMT\r\n"
+         b"Server: nginx/1.25.3\r\n"
+         b"Content-Type: text/html; charset=utf-8\r\n"
+         b"Content-Length: 1234\r\n"
+         b"Connection: keep-alive\r\n"
+         b"Vary: Accept-Encoding\r\n"
+         b"Cache-Control: no-cache\r\n"
+         b"Set-Cookie: a=1; Path=/; HttpOnly\r\n"
+         b"Set-Cookie: b=2; Path=/\r\n"
+         b"X-Frame-Options: SAMEORIGIN\r\n"
+         b"X-Content-Type-Options: nosniff\r\n"
+         b"Strict-Transport-Security: max-age=31536000\r\n"
+         b"\r\n")
+
+
+def email_parse():
+    return email.parser.Parser(_class=HTTPMessage).parsestr(BLOCK.decode("iso-8859-1"))
+
+
+def headers_parse():
+    return HTTPHeaders.parse(BLOCK)
+
+
+def email_framing():
+    body_framing(11, 200, "GET", email_parse())
+
+
+def headers_framing():
+    body_framing(11, 200, "GET", headers_parse())
+
+
+def best(func, number, repeat):
+    return min(timeit.repeat(func, number=number, repeat=repeat)) / number * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("-n", "--number", type=int, default=20000)
+    parser.add_argument("-r", "--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    message, headers = email_parse(), headers_parse()
+    assert headers.items() == message.items()
+    assert headers.get_all("set-cookie") == message.get_all("set-cookie")
+
+    for label, old, new in (("parse only", email_parse, headers_parse),
+                            ("parse + body_framing()", email_framing, headers_framing)):
+        before = best(old, args.number, args.repeat)
+        after = best(new, args.number, args.repeat)
+        print("%-24s email.parser %6.2f us  HTTPHeaders %6.2f us  x%.1f" % (label, before, after, before / after))
+
+
+if __name__ == "__main__":
+    main()
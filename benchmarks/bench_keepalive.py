@@ -0,0 +1,85 @@
+"""
+Sequential keep-alive GETs over loopback.
+
+Times ``n`` requests for a 1000-byte body on one kept-alive connection,
+through :class:`~httpsec.httpclient.HTTPConnection` directly and through
+:meth:`Session.get <httpsec.sessions.Session.get>`. The server is an
+asyncio loop in its own process that answers every request head with the
+same response::
+
+    $ PYTHONPATH=. python benchmarks/bench_keepalive.py
+"""
+import argparse
+import asyncio
+import multiprocessing
+import socket
+import time
+
+from httpsec.httpclient import HTTPConnection
+from httpsec.sessions import Session
+
+BODY = b"x" * 1000
+RESPONSE = b"HTTP/1.1 200 OK\r\nContent-Length: %d\r\n\r\n%s" % (len(BODY), BODY)
+
+
+def serve(listener):
+    async def handle(reader, writer):
+        try:
+            while True:
+                await reader.readuntil(b"\r\n\r\n")
+                writer.write(RESPONSE)
+        except (asyncio.IncompleteReadError, OSError):
+            pass
+        writer.close()
+
+    async def main():
+        server = await asyncio.start_server(handle, sock=listener)
+        await server.serve_forever()
+
+    asyncio.run(main())
+
+
+def connection_loop(port, n):
+    conn = HTTPConnection("127.0.0.1", port, timeout=5)
+    conn.connect()
+    start = time.perf_counter()
+    for _ in range(n):
+        conn.request("GET", "/")
+        conn.getresponse().read()
+    elapsed = time.perf_counter() - start
+    conn.close()
+    return elapsed / n * 1e6
+
+
+def session_loop(port, n):
+    url = "http://127.0.0.1:%d/" % port
+    with Session() as s:
+        s.get(url, timeout=(5, 5))
+        start = time.perf_counter()
+        for _ in range(n):
+            s.get(url, timeout=(5, 5)).content
+        return (time.perf_counter() - start) / n * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("-n", "--requests", type=int, default=3000)
+    parser.add_argument("-r", "--repeat", type=int, default=3, help="runs per client, best is kept")
+    args = parser.parse_args()
+
+    listener = socket.socket()
+    listener.bind(("127.0.0.1", 0))
+    listener.listen(128)
+    port = listener.getsockname()[1]
+    server = multiprocessing.Process(target=serve, args=(listener,), daemon=True)
+    server.start()
+    try:
+        for label, loop in (("HTTPConnection", connection_loop), ("Session.get", session_loop)):
+            best = min(loop(port, args.requests) for _ in range(args.repeat))
+            print("%-15s %7.1f us/request  %6.0f req/s" % (label, best, 1e6 / best))
+    finally:
+        server.terminate()
+
+
+if __name__ == "__main__":
+    main()
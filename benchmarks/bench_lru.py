@@ -0,0 +1,49 @@
+"""
+RecentlyUsedContainer lookups split across threads.
+
+Fills a 1000-entry container and times 200k ``__getitem__`` calls shared by
+1, 8 and 32 threads. Compare revisions by pointing ``PYTHONPATH`` at a
+checkout of each::
+
+    $ PYTHONPATH=. python benchmarks/bench_lru.py
+    $ git worktree add /tmp/before 6c10e10~1
+    $ PYTHONPATH=/tmp/before python benchmarks/bench_lru.py
+"""
+import argparse
+import threading
+import time
+
+from httpsec.utils import RecentlyUsedContainer
+
+
+def run(container, lookups, threads):
+    def work(n):
+        get = container.__getitem__
+        for i in range(n):
+            get(i % 1000)
+
+    workers = [threading.Thread(target=work, args=(lookups // threads,)) for _ in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return lookups / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("-n", "--lookups", type=int, default=200000)
+    parser.add_argument("-r", "--repeat", type=int, default=3, help="runs per thread count, best is kept")
+    args = parser.parse_args()
+
+    container = RecentlyUsedContainer(1000)
+    for i in range(1000):
+        container[i] = i
+    for threads in (1, 8, 32):
+        best = max(run(container, args.lookups, threads) for _ in range(args.repeat))
+        print("threads=%2d  %9.0f lookups/s" % (threads, best))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+New TLS connections per second against a loopback server.
+
+Each iteration opens a connection, completes the handshake and closes it,
+with the :class:`ssl.SSLContext` built three ways:
+
+* a new default context per connection, loading the system CA store each
+  time (what every HTTPS connection did before contexts were shared)
+* the shared :func:`~httpsec.utils.create_ssl_context` context verifying
+  against a CA bundle
+* the shared context with ``verify=False``
+
+The server runs in its own process with a throwaway self-signed
+certificate made by the ``openssl`` command line tool::
+
+    $ PYTHONPATH=. python benchmarks/bench_tls_connect.py
+"""
+import argparse
+import multiprocessing
+import os
+import shutil
+import socket
+import ssl
+import subprocess
+import tempfile
+import time
+
+from httpsec.httpclient import HTTPSConnection
+from httpsec.utils import create_ssl_context
+
+
+def make_certificate(directory):
+    cert = os.path.join(directory, "cert.pem")
+    key = os.path.join(directory, "key.pem")
+    subprocess.run(["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+                    "-subj", "/CN=127.0.0.1", "-addext", "subjectAltName=IP:127.0.0.1",
+                    "-keyout", key, "-out", cert], check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return cert, key
+
+
+def serve(listener, cert, key):
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(cert, key)
+    while True:
+        sock, _ = listener.accept()
+        try:
+            context.wrap_socket(sock, server_side=True).close()
+        except (OSError, ssl.SSLError):
+            sock.close()
+
+
+def run(port, new_context, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        conn = HTTPSConnection("127.0.0.1", port, timeout=5, context=new_context())
+        conn.connect()
+        conn.close()
+    return iterations / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("-n", "--iterations", type=int, default=300)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    try:
+        cert, key = make_certificate(directory)
+        listener = socket.socket()
+        listener.bind(("127.0.0.1", 0))
+        listener.listen(128)
+        port = listener.getsockname()[1]
+        server = multiprocessing.Process(target=serve, args=(listener, cert, key), daemon=True)
+        server.start()
+
+        def per_connection():
+            context = ssl.create_default_context()
+            context.load_verify_locations(cert)
+            return context
+
+        for label, new_context in (
+                ("new default context per connection", per_connection),
+                ("shared context, verify=<bundle>", lambda: create_ssl_context(cert)),
+                ("shared context, verify=False", lambda: create_ssl_context(False)),
+        ):
+            print("%-36s %6.0f conn/s" % (label, run(port, new_context, args.iterations)))
+        server.terminate()
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
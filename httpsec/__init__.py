@@ -1,10 +1,19 @@
-from .api import delete, get, head, options, patch, post, put, request
+from .api import delete, get, head, options, patch, post, put, request, close_default_session
 
 from .url import URL, SafeURL
+from .model import Request, Result
 import requests
 
 __all__ = [
-    "delete", "get", "head", "options", "patch", "post", "put", "request", "sessions", "URL", "Session", "SafeURL"
+    "delete", "get", "head", "options", "patch", "post", "put", "request", "sessions", "URL", "Session", "SafeURL",
+    "close_default_session", "Request", "Result", "AsyncSession", "Engine", "ProcessRunner",
+    "Limiter", "AdaptiveLimiter", "HostScheduler", "DeadlineExceeded"
 ]
 
 from .sessions import Session, session
+from .aio import AsyncSession
+from .engine import Engine
+from .runner import ProcessRunner
+from .limits import AdaptiveLimiter, Limiter
+from .scheduler import HostScheduler
+from .timeouts import DeadlineExceeded
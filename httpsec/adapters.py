@@ -1,12 +1,115 @@
 import collections
+import functools
+import io
+import os
+import ssl
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from http.client import RemoteDisconnected
 from urllib.parse import urlparse
+
+from urllib3.exceptions import EmptyPoolError
+
 from httpsec.connection import HTTPConnection, HTTPSConnection, SOCKSConnection
-from httpsec.utils import RecentlyUsedContainer, parser_socket_proxy_opts
+from httpsec.connectionpool import HostConnectionPool
+from httpsec.resolver import default_resolver, HAPPY_EYEBALLS_DELAY
+from httpsec.timeouts import Deadline
+from httpsec.url import request_target
+from httpsec.utils import RecentlyUsedContainer, parser_socket_proxy_opts, create_ssl_context, TLSSessionCache
 import logging
 
 log = logging.getLogger(__file__)
 
-connection_classes_by_scheme = {"http": HTTPConnection, "https": HTTPSConnection, "socks": SOCKSConnection}
+DEFAULT_NUM_POOLS = 1000
+DEFAULT_POOLSIZE = 10
+DEFAULT_POOLBLOCK = False
+#: Seconds an idle pooled connection is kept open, and how often the reaper
+#: closes those past it, so a long-lived session does not sit on thousands
+#: of sockets.
+DEFAULT_IDLE_TIMEOUT = 30.0
+DEFAULT_REAP_INTERVAL = 10.0
+#: Seconds :meth:`HTTPAdapter.preconnect` gives each connect and handshake.
+DEFAULT_PRECONNECT_TIMEOUT = 10.0
+# upper bound of the (scheme, host, port, proxy) -> PoolKey cache
+POOL_KEY_CACHE_SIZE = 65536
+
+# Adapters whose pools are dropped in a forked child: the sockets are shared
+# with the parent.
+_fork_reset_adapters = weakref.WeakSet()
+
+
+def _reset_adapters_after_fork():
+    for adapter in list(_fork_reset_adapters):
+        adapter._after_fork()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_adapters_after_fork)
+
+
+def _reap_forever(adapter_ref, stop, interval):
+    # holds the adapter only while reaping, so an unused one can be collected
+    while not stop.wait(interval):
+        adapter = adapter_ref()
+        if adapter is None:
+            return
+        try:
+            adapter.reap()
+        except Exception:
+            log.exception("Idle connection reaper failed")
+        del adapter
+
+
+#: Methods that are resent once when a reused connection turns out to be dead.
+IDEMPOTENT_METHODS = frozenset(["GET", "HEAD", "OPTIONS", "TRACE", "PUT", "DELETE"])
+
+# Raised when the server closed a kept-alive socket before answering.
+_DROPPED_CONN_ERRORS = (ConnectionResetError, BrokenPipeError, ConnectionAbortedError, ssl.SSLEOFError)
+
+# Bodies written out the same way every time they are sent.
+_REPLAYABLE_BODIES = (bytes, bytearray, memoryview, str)
+
+
+def _body_position(body):
+    """``tell()`` of a file ``body`` before it is sent, ``None`` for other
+    bodies or a file that cannot tell."""
+    if body is None or isinstance(body, _REPLAYABLE_BODIES):
+        return None
+    tell = getattr(body, "tell", None)
+    if tell is None:
+        return None
+    try:
+        return tell()
+    except (OSError, ValueError):
+        return None
+
+
+def _can_resend(body, position):
+    """Ready ``body`` to be sent again and say whether it could be: an
+    iterator is spent after one send, a file is seeked back to ``position``."""
+    if body is None or isinstance(body, _REPLAYABLE_BODIES):
+        return True
+    if position is None:
+        return False
+    try:
+        body.seek(position)
+    except (AttributeError, OSError, ValueError):
+        return False
+    return True
+
+
+connection_classes_by_scheme = {
+    "http": HTTPConnection,
+    "https": HTTPSConnection,
+    "socks": SOCKSConnection,
+    # pools behind a SOCKS proxy are looked up by the proxy's scheme
+    "socks4": SOCKSConnection,
+    "socks4a": SOCKSConnection,
+    "socks5": SOCKSConnection,
+    "socks5h": SOCKSConnection,
+}
 
 _key_fields = (
     "scheme",  # str
@@ -79,11 +182,84 @@ def get_pool_key_normalizer(key_class: PoolKey.__class__, request_context):
 
 
 class HTTPAdapter(object):
-    def __init__(self):
-        num_pools = 4
+    """
+    Keeps a :class:`HostConnectionPool` per :class:`PoolKey`.
+
+    :param num_pools: The number of host pools to keep before the least
+        recently used is closed.
+    :param pool_maxsize: The maximum number of connections to save in each pool.
+    :param pool_block: Whether the connection pool should block for connections.
+    :param pool_timeout: Seconds to wait for a free connection when ``pool_block`` is set.
+    :param idle_timeout: Seconds an unused connection is kept open, ``None``
+        to keep it until the server closes it.
+    :param max_requests: Requests sent on one socket before it is reopened.
+    :param reap_interval: If set, a background thread closes expired idle
+        connections every ``reap_interval`` seconds; ``None`` only retires
+        them when they are next checked out.
+    :param resolver: :class:`~httpsec.resolver.Resolver` used for name
+        lookups, the shared caching resolver by default.
+    :param happy_eyeballs_delay: Seconds between staggered IPv6/IPv4
+        connection attempts, ``None`` to try addresses one at a time.
+    :param ssl_minimum_version: Lowest :class:`ssl.TLSVersion` offered to servers.
+    :param ssl_ciphers: OpenSSL cipher string for HTTPS connections.
+    :param limiter: (optional) :class:`~httpsec.limits.Limiter` every request
+        waits on before it is sent.
+    :param read_buffer_size: Bytes of receive buffer each connection keeps
+        for its lifetime.
+    """
+
+    def __init__(self, num_pools=DEFAULT_NUM_POOLS, pool_maxsize=DEFAULT_POOLSIZE, pool_block=DEFAULT_POOLBLOCK,
+                 pool_timeout=None, idle_timeout=DEFAULT_IDLE_TIMEOUT, max_requests=None,
+                 reap_interval=DEFAULT_REAP_INTERVAL, resolver=None,
+                 happy_eyeballs_delay=HAPPY_EYEBALLS_DELAY, ssl_minimum_version=None, ssl_ciphers=None,
+                 limiter=None, read_buffer_size=io.DEFAULT_BUFFER_SIZE):
+        self.num_pools = num_pools
+        self.pool_maxsize = pool_maxsize
+        self.pool_block = pool_block
+        self.pool_timeout = pool_timeout
+        self.idle_timeout = idle_timeout
+        self.max_requests = max_requests
+        self.resolver = resolver or default_resolver
+        self.happy_eyeballs_delay = happy_eyeballs_delay
+        self.ssl_minimum_version = ssl_minimum_version
+        self.ssl_ciphers = ssl_ciphers
+        self.limiter = limiter
+        self.read_buffer_size = read_buffer_size
+        #: Last TLS session per host, resumed by new HTTPS connections.
+        self.tls_sessions = TLSSessionCache()
         self.pools = RecentlyUsedContainer(num_pools, dispose_func=lambda p: p.close())
+        self._pool_keys = {}
         self.num_connections = 0
         self.connection_classes_by_scheme = connection_classes_by_scheme
+        self.reap_interval = reap_interval
+        self._start_reaper()
+        _fork_reset_adapters.add(self)
+
+    def _start_reaper(self):
+        self._reaper = None
+        self._reaper_stop = threading.Event()
+        if self.reap_interval:
+            self._reaper = threading.Thread(target=_reap_forever,
+                                            args=(weakref.ref(self), self._reaper_stop, self.reap_interval),
+                                            name="httpsec-reaper", daemon=True)
+            self._reaper.start()
+            # wake the thread when the adapter is collected without close()
+            weakref.finalize(self, self._reaper_stop.set)
+
+    def _after_fork(self):
+        """
+        Forget the pools inherited from the parent process. Their sockets are
+        shared with the parent, so they are never used here; the reaper thread
+        did not survive the fork either.
+        """
+        self.pools = RecentlyUsedContainer(self.num_pools, dispose_func=lambda p: p.close())
+        self._start_reaper()
+
+    def reap(self):
+        """
+        Close expired idle connections in every pool.
+        """
+        return sum(pool.reap() for pool in self.pools.values())
 
     def _new_conn(self, pool_key: PoolKey, connect_opts=None) -> HTTPConnection:
         """
@@ -106,27 +282,82 @@ class HTTPAdapter(object):
             if proxy_parsed.scheme.startswith("http"):
                 host = proxy_parsed.hostname
                 port = proxy_parsed.port
+            else:
+                # sock5
+                connect_opts = dict(connect_opts, socks_opts=parser_socket_proxy_opts(proxy))
+        if scheme == "https":
+            connect_opts = dict(connect_opts, tls_session_cache=self.tls_sessions)
+            if pool_key.ssl_context is not None:
+                connect_opts["context"] = pool_key.ssl_context
         connection_class = self.connection_classes_by_scheme.get(scheme)
         conn = connection_class(host=host, port=port, **connect_opts)
         return conn
 
+    def connection_from_pool_key(self, pool_key, connect_opts=None) -> HostConnectionPool:
+        """
+        Get a :class:`HostConnectionPool` based on the provided pool key.
+        """
+        pool = self.pools.get(pool_key)
+        if pool:
+            return pool
+
+        with self.pools.lock:
+            # If the scheme, host, or port doesn't match existing open
+            # connections, open a new ConnectionPool.
+            pool = self.pools.get(pool_key)
+            if pool:
+                return pool
+
+            pool = HostConnectionPool(
+                pool_key,
+                functools.partial(self._new_conn, pool_key, connect_opts=connect_opts),
+                maxsize=self.pool_maxsize,
+                block=self.pool_block,
+                idle_timeout=self.idle_timeout,
+                max_requests=self.max_requests,
+            )
+            self.pools[pool_key] = pool
+
+        return pool
+
     def get_conn(self, pool_key, connect_opts=None):
-        conn = self.pools.get(pool_key)
-        if conn is None:
-            conn = self._new_conn(pool_key, connect_opts=connect_opts)
-        return conn
+        pool = self.connection_from_pool_key(pool_key, connect_opts=connect_opts)
+        return pool, pool._get_conn(timeout=self.pool_timeout)
+
+    def _make_request(self, conn, method, url, timeout, body=None, headers=None, deadline=None):
+        """
+        Send the request on ``conn`` and read the response head.
+        """
+        # a pooled connection may have been created for another request
+        conn.timeout = timeout[0]
+        conn.deadline = deadline
+        if conn.sock is not None and deadline is None:
+            # a kept-alive socket still has the last response's read timeout
+            conn.sock.settimeout(timeout[0])
+        conn.request(method, url, body=body, headers=headers)
+        conn.sock.settimeout(timeout[1])
+        return conn.getresponse()
+
+    def ssl_context_for(self, verify=True, cert=None) -> ssl.SSLContext:
+        """
+        Return the shared :class:`ssl.SSLContext` for a TLS configuration.
+        """
+        if isinstance(cert, list):
+            cert = tuple(cert)
+        return create_ssl_context(verify, cert, self.ssl_minimum_version, self.ssl_ciphers)
+
+    def pool_key_for(self, scheme, host, port, proxy=None, ssl_context=None) -> PoolKey:
+        """
+        Return the interned :class:`PoolKey` for a target, building it once.
+        """
+        cache_key = (scheme, host, port, proxy, ssl_context)
+        pool_key = self._pool_keys.get(cache_key)
+        if pool_key is not None:
+            return pool_key
 
-    def send(self, method, url=None, proxy=None, timeout=None):
-        parsed = urlparse(url)
-        if not proxy or not urlparse(proxy).scheme.startswith('http'):
-            url = f"{parsed.path}?{parsed.query}#{parsed.fragment}"
         # conn keys
         # 这里对连接池key 进行聚合
-        context = {'scheme': parsed.scheme, 'host': parsed.hostname, 'port': parsed.port}
-        read_timeout = timeout[1]
-        connect_opts = {
-            "timeout": timeout[0]
-        }
+        context = {'scheme': scheme, 'host': host, 'port': port}
         if proxy:
             if proxy.startswith("http"):
                 proxy_parsed = urlparse(proxy)
@@ -136,19 +367,223 @@ class HTTPAdapter(object):
             else:
                 # sock5
                 context['proxy'] = proxy
-                connect_opts.update(**parser_socket_proxy_opts(proxy))
-        pool_key_constructor = get_pool_key_normalizer(PoolKey, context)
-        conn = self.get_conn(pool_key_constructor, connect_opts=connect_opts)
+        if context['scheme'] == "https":
+            context['ssl_context'] = ssl_context
+        pool_key = get_pool_key_normalizer(PoolKey, context)
+        if len(self._pool_keys) >= POOL_KEY_CACHE_SIZE:
+            self._pool_keys.clear()
+        self._pool_keys[cache_key] = pool_key
+        return pool_key
+
+    def _pool_for(self, parsed, proxy, connect_timeout, verify, cert) -> HostConnectionPool:
+        ssl_context = self.ssl_context_for(verify, cert) if parsed.scheme == "https" else None
+        pool_key = self.pool_key_for(parsed.scheme, parsed.hostname, parsed.port, proxy, ssl_context)
+        connect_opts = {
+            "timeout": connect_timeout,
+            "resolver": self.resolver,
+            "happy_eyeballs_delay": self.happy_eyeballs_delay,
+            "read_buffer_size": self.read_buffer_size,
+        }
+        return self.connection_from_pool_key(pool_key, connect_opts=connect_opts)
+
+    def preconnect(self, urls, per_host=1, proxy=None, timeout=DEFAULT_PRECONNECT_TIMEOUT, verify=True, cert=None,
+                   max_workers=32):
+        """
+        Open (and for https, handshake) up to ``per_host`` connections to
+        each target concurrently and park them in the pools.
+
+        :param urls: URLs, :class:`~httpsec.url.URL` objects or bare hosts.
+        :param timeout: Seconds for each connect and TLS handshake, ``None``
+            to wait as long as they take.
+        :return: The number of connections opened.
+        """
+        parked = []
+        seen = set()
+        for url in urls:
+            url = str(url)
+            if "://" not in url:
+                url = "http://" + url
+            pool = self._pool_for(urlparse(url), proxy, timeout, verify, cert)
+            if pool.pool_key in seen:
+                continue
+            seen.add(pool.pool_key)
+            for _ in range(min(per_host, pool.maxsize)):
+                try:
+                    parked.append((pool, pool._get_conn(timeout=self.pool_timeout)))
+                except EmptyPoolError:
+                    break
+
+        def connect(item):
+            pool, conn = item
+            try:
+                if conn.sock is None:
+                    conn.timeout = timeout
+                    conn.connect()
+                    return 1
+            except OSError as e:
+                log.debug("Preconnect to %s failed: %r", pool.pool_key.host, e)
+                conn.close()
+            finally:
+                pool._put_conn(conn)
+            return 0
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return sum(executor.map(connect, parked))
+
+    def send(self, method, url=None, proxy=None, timeout=None, verify=True, cert=None, body=None, headers=None,
+             deadline=None, min_rate=None):
+        """
+        Send a request and return the :class:`~httpsec.httpclient.HTTPResponse`
+        once its head is read.
+
+        :param timeout: ``(connect timeout, read timeout)``, the read timeout
+            applying to each socket read.
+        :param deadline: (optional) Seconds for the whole request, body
+            included; :class:`~httpsec.timeouts.DeadlineExceeded` is raised
+            past it.
+        :param min_rate: (optional) Bytes per second the response must
+            arrive at once it has started.
+        """
+        limiter = self.limiter
+        if limiter is None:
+            return self._send(method, url, proxy, timeout, verify, cert, body, headers, deadline, min_rate)
+        host = urlparse(url).hostname
+        limiter.acquire(host)
+        start = time.monotonic()
+        try:
+            try:
+                response = self._send(method, url, proxy, timeout, verify, cert, body, headers, deadline,
+                                      min_rate)
+            except Exception as e:
+                limiter.observe_error(host, e, time.monotonic() - start)
+                raise
+            limiter.observe(host, response.status, response.headers, time.monotonic() - start)
+            return response
+        finally:
+            # the slot is freed once the response head is in, the body may still be pending
+            limiter.release(host)
+
+    def _send(self, method, url, proxy, timeout, verify, cert, body, headers, deadline, min_rate):
+        if deadline is not None or min_rate is not None:
+            deadline = Deadline(deadline, min_rate)
+        parsed = urlparse(url)
+        if not proxy or not proxy.startswith('http'):
+            url = request_target(url)
+        pool = self._pool_for(parsed, proxy, timeout[0], verify, cert)
+        pool_key_constructor = pool.pool_key
+        conn = pool._get_conn(timeout=self.pool_timeout)
         assert conn is not None
-        conn.request(method, url)
-        conn.sock.settimeout(read_timeout)
-        response = conn.getresponse()
-        self.pools[pool_key_constructor] = conn
+        retried = False
+        body_position = _body_position(body)
+        while True:
+            reused = conn.sock is not None
+            try:
+                response = self._make_request(conn, method, url, timeout, body=body, headers=headers,
+                                              deadline=deadline)
+                break
+            except _DROPPED_CONN_ERRORS as e:
+                conn.close()
+                if (reused and not retried and method.upper() in IDEMPOTENT_METHODS and
+                        _can_resend(body, body_position)):
+                    # the server dropped the kept-alive socket before sending
+                    # anything back, so the request never reached it
+                    log.debug("Reused connection dropped (%r), resending: %s", e, pool_key_constructor.host)
+                    retried = True
+                    continue
+                pool._put_conn(None)
+                raise
+            except BaseException:
+                # the connection is in an unknown state, put an empty slot back
+                conn.close()
+                pool._put_conn(None)
+                raise
+        # the connection goes back to the pool once the body has been read
+        response._pool = pool
+        response._connection = conn
+        if response.isclosed():
+            response.release_conn()
         return response
 
+    def pipeline(self, requests, proxy=None, timeout=None, verify=True, cert=None):
+        """
+        Send ``requests`` to one origin with HTTP/1.1 pipelining: all are
+        written on a pooled connection before the responses are read.
+
+        Requests left unanswered because the server closed the connection
+        are sent again on a fresh one. A request is given up on after two
+        connections that answered nothing; unanswered non-idempotent
+        requests are never resent.
+
+        :param requests: ``(method, url, body, headers)`` tuples sharing
+            scheme, host and port.
+        :return: A ``(response, exception)`` pair per request, in order,
+            the response being a :class:`~httpsec.httpclient.PipelinedResponse`.
+        """
+        parsed = urlparse(requests[0][1])
+        pool = self._pool_for(parsed, proxy, timeout[0], verify, cert)
+        batch = []
+        body_positions = []
+        for method, url, body, headers in requests:
+            if not proxy or not proxy.startswith('http'):
+                url = request_target(url)
+            batch.append((method, url, body, headers))
+            body_positions.append(_body_position(body))
+
+        results = [None] * len(batch)
+        pending = list(range(len(batch)))
+        failures = collections.Counter()
+        limiter = self.limiter
+        host = parsed.hostname
+        while pending:
+            # a connection's worth of pipelined requests takes one slot, and
+            # one rate token per request written
+            if limiter is not None:
+                limiter.acquire(host, len(pending))
+            start = time.monotonic()
+            try:
+                conn = pool._get_conn(timeout=self.pool_timeout)
+                conn.timeout = timeout[0]
+                conn.deadline = None
+                try:
+                    if conn.sock is None:
+                        conn.connect()
+                    conn.sock.settimeout(timeout[1])
+                    answered = conn.pipeline([batch[i] for i in pending])
+                except Exception as e:
+                    conn.close()
+                    pool._put_conn(None)
+                    answered, error = [], e
+                else:
+                    pool._put_conn(conn)
+                    error = RemoteDisconnected("Remote end closed connection before answering pipelined request")
+                if limiter is not None:
+                    # responses are only known once the whole batch is read
+                    elapsed = time.monotonic() - start
+                    for response in answered:
+                        limiter.observe(host, response.status, response.headers, elapsed)
+                    if not answered:
+                        limiter.observe_error(host, error, elapsed)
+            finally:
+                if limiter is not None:
+                    limiter.release(host)
+            for i, response in zip(pending, answered):
+                results[i] = (response, None)
+            unanswered, pending = pending[len(answered):], []
+            for i in unanswered:
+                if not answered:
+                    failures[i] += 1
+                if (failures[i] > 1 or batch[i][0].upper() not in IDEMPOTENT_METHODS or
+                        not _can_resend(batch[i][2], body_positions[i])):
+                    results[i] = (None, error)
+                else:
+                    pending.append(i)
+            if unanswered:
+                log.debug("%d pipelined requests unanswered (%r): %s", len(unanswered), error, pool.pool_key.host)
+        return results
+
     def close(self):
         """
         Close all pooled connections and disable the pool.
         """
-        for con in self.pools.values():
-            con.close()
\ No newline at end of file
+        self._reaper_stop.set()
+        self.pools.clear()
@@ -0,0 +1,387 @@
+"""
+httpsec.aio
+~~~~~~~~~~~
+
+asyncio client. Requests are serialized by :func:`httpclient.encode_request`,
+so what goes on the wire is exactly what the blocking API would send.
+"""
+import asyncio
+import time
+from collections import OrderedDict, deque
+
+from httpsec import httpclient
+from httpsec.adapters import DEFAULT_NUM_POOLS, DEFAULT_POOLSIZE, DEFAULT_POOLBLOCK, IDEMPOTENT_METHODS, \
+    _DROPPED_CONN_ERRORS
+from httpsec.limits import LimitTimeout
+from httpsec.model import Response, CONTENT_CHUNK_SIZE
+from httpsec.parser import Data, EndOfMessage, Headers, ResponseParser
+from httpsec.resolver import default_resolver
+from httpsec.url import request_target, split_origin
+from httpsec.utils import RecentlyUsedContainer, create_ssl_context
+
+#: Bytes asked from the transport per read.
+READ_SIZE = 64 * 1024
+
+
+class AsyncConnection(object):
+    """One TCP (or TLS) stream to a host."""
+
+    def __init__(self, host, port, ssl_context=None, resolver=None):
+        self.host = host
+        self.port = port
+        self.ssl_context = ssl_context
+        self.resolver = resolver or default_resolver
+        self.reader = self.writer = None
+
+    async def connect(self, timeout=None):
+        """Open the stream, trying the host's addresses in turn; ``timeout``
+        bounds the lookup and all the attempts together."""
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        infos = await loop.run_in_executor(None, self.resolver.resolve, self.host, self.port)
+        infos = self.resolver.sorted_for_connect(self.host, infos)
+        err = OSError("getaddrinfo returns an empty list")
+        for info in infos:
+            left = None
+            if deadline is not None:
+                left = deadline - loop.time()
+                if left <= 0:
+                    raise asyncio.TimeoutError("connecting to %s timed out" % self.host)
+            try:
+                self.reader, self.writer = await asyncio.wait_for(asyncio.open_connection(
+                    info[4][0], self.port, ssl=self.ssl_context,
+                    server_hostname=self.host if self.ssl_context else None,
+                ), left)
+                self.resolver.remember_family(self.host, info[0])
+                return
+            except OSError as e:
+                err = e
+        raise err
+
+    def is_dropped(self):
+        """Whether the peer closed the idle stream (the loop already saw EOF)."""
+        return self.writer is None or self.writer.is_closing() or self.reader.at_eof()
+
+    def close(self):
+        writer, self.reader, self.writer = self.writer, None, None
+        if writer is not None:
+            writer.close()
+
+
+class AsyncHostPool(object):
+    """
+    Idle connections to one host, most recently used first.
+
+    :param maxsize: Number of idle connections kept for reuse.
+    :param block: If set, no more than ``maxsize`` connections are in use at
+        a time and further requests wait for one to be released.
+    """
+
+    def __init__(self, conn_factory, maxsize=1, block=False):
+        self.conn_factory = conn_factory
+        self.maxsize = maxsize
+        self.idle = []
+        self.closed = False
+        self._slots = asyncio.Semaphore(maxsize) if block else None
+
+    async def get(self):
+        if self._slots is not None:
+            await self._slots.acquire()
+        while self.idle:
+            conn = self.idle.pop()
+            if not conn.is_dropped():
+                return conn
+            conn.close()
+        return self.conn_factory()
+
+    def put(self, conn):
+        if self._slots is not None:
+            self._slots.release()
+        if conn.writer is not None and not self.closed and len(self.idle) < self.maxsize:
+            self.idle.append(conn)
+        else:
+            conn.close()
+
+    def close(self):
+        self.closed = True
+        for conn in self.idle:
+            conn.close()
+        self.idle.clear()
+
+
+class AsyncHTTPResponse(object):
+    """Response head plus an async body reader, the counterpart of
+    :class:`httpclient.HTTPResponse`. Parsing is done by
+    :class:`~httpsec.parser.ResponseParser`."""
+
+    def __init__(self, conn, pool, method, timeout=None):
+        self._conn = conn
+        self._pool = pool
+        self._timeout = timeout
+        self._parser = ResponseParser(method)
+        self._pending = deque()
+        self._ended = False
+        self._done = False
+        self.headers = self.msg = None
+        self.version = self.status = self.reason = httpclient._UNKNOWN
+        self.chunked = False
+        self.length = None
+        self.will_close = True
+
+    async def _receive(self):
+        data = await asyncio.wait_for(self._conn.reader.read(READ_SIZE), self._timeout)
+        events = self._parser.feed(data) if data else self._parser.feed_eof()
+        for event in events:
+            if type(event) is Data:
+                self._pending.append(event.data)
+            elif type(event) is Headers:
+                self.headers = self.msg = event.headers
+            elif type(event) is EndOfMessage:
+                self._ended = True
+
+    async def begin(self):
+        while self.headers is None:
+            await self._receive()
+        parser = self._parser
+        self.version, self.status, self.reason = parser.version, parser.status, parser.reason
+        self.chunked, self.length, self.will_close = parser.chunked, parser.length, parser.will_close
+
+    async def iter_chunks(self, chunk_size=CONTENT_CHUNK_SIZE):
+        """Yield the body in pieces of at most ``chunk_size`` bytes."""
+        if self._done:
+            return
+        try:
+            while True:
+                while self._pending:
+                    data = self._pending.popleft()
+                    for i in range(0, len(data), chunk_size):
+                        yield data[i:i + chunk_size]
+                if self._ended:
+                    break
+                await self._receive()
+        except BaseException:
+            self.close()
+            raise
+        self._release()
+
+    async def read(self):
+        return b"".join([chunk async for chunk in self.iter_chunks(READ_SIZE)])
+
+    def _release(self):
+        if self._done:
+            return
+        self._done = True
+        # anything the parser holds after the message would be read as the
+        # next response
+        if self.will_close or self._parser.trailing_data:
+            self._conn.close()
+        self._pool.put(self._conn)
+
+    def close(self):
+        """Give up on the rest of the body; the connection is not reused."""
+        if not self._done:
+            self._conn.close()
+            self._release()
+
+    def isclosed(self):
+        return self._done
+
+
+class AsyncResponse(Response):
+    """:class:`~httpsec.model.Response` whose body is read with ``await``."""
+
+    async def aread(self):
+        """Read the whole body, after which ``content`` and ``text`` work."""
+        if self._content is False:
+            self._content = await self.raw.read()
+            self._content_consumed = True
+        return self._content
+
+    async def aiter_content(self, chunk_size=CONTENT_CHUNK_SIZE):
+        if self._content is not False:
+            for i in range(0, len(self._content), chunk_size):
+                yield self._content[i:i + chunk_size]
+            return
+        async for chunk in self.raw.iter_chunks(chunk_size):
+            yield chunk
+        self._content_consumed = True
+
+    @property
+    def content(self):
+        if self._content is False:
+            raise RuntimeError("The body has not been read, await response.aread() first")
+        return self._content
+
+    def close(self):
+        self.raw.close()
+
+
+class AsyncSession(object):
+    """asyncio counterpart of :class:`~httpsec.sessions.Session`.
+
+    Basic Usage::
+
+      >>> async with httpsec.AsyncSession() as s:
+      ...     r = await s.get(SafeURL(host="testpoc.com", scheme="https", path="./../../"))
+      ...     r.status_code
+      200
+
+    :param num_pools: The number of host pools to keep open.
+    :param pool_maxsize: The maximum number of idle connections kept per host.
+    :param pool_block: Whether to wait for a free connection instead of
+        opening one beyond ``pool_maxsize``.
+    :param resolver: (optional) :class:`~httpsec.resolver.Resolver` for name lookups.
+    :param limiter: (optional) :class:`~httpsec.limits.Limiter` requests wait
+        on, which may be shared with blocking sessions.
+    """
+
+    def __init__(self, num_pools=DEFAULT_NUM_POOLS, pool_maxsize=DEFAULT_POOLSIZE, pool_block=DEFAULT_POOLBLOCK,
+                 resolver=None, limiter=None):
+        self.headers = OrderedDict()
+        self.verify = True
+        self.cert = None
+        self.stream = False
+        self.pool_maxsize = pool_maxsize
+        self.pool_block = pool_block
+        self.resolver = resolver or default_resolver
+        self.limiter = limiter
+        # set when this session frees a limiter slot; made by the first
+        # waiter, so inside the running loop
+        self._released = None
+        self.pools = RecentlyUsedContainer(num_pools, dispose_func=lambda p: p.close())
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    def _pool_for(self, scheme, host, port, ssl_context):
+        key = (scheme, host, port, ssl_context)
+        pool = self.pools.get(key)
+        if pool is None:
+            pool = AsyncHostPool(lambda: AsyncConnection(host, port, ssl_context, self.resolver),
+                                 maxsize=self.pool_maxsize, block=self.pool_block)
+            self.pools[key] = pool
+        return pool
+
+    async def request(self, method, url, data=None, headers=None, timeout=None, stream=None, verify=None,
+                      cert=None):
+        """Sends a request and returns an :class:`AsyncResponse`.
+
+        The request target is sent exactly as given in ``url``.
+
+        :param timeout: (optional) How long to wait for the server, as a
+            float, or a ``(connect timeout, read timeout)`` tuple.
+        :param stream: (optional) if ``False``, the response content will be
+            immediately downloaded.
+        """
+        if not isinstance(timeout, tuple):
+            timeout = (timeout, timeout)
+        scheme, host, port = split_origin(url)
+        https = scheme == "https"
+        default_port = httpclient.HTTPS_PORT if https else httpclient.HTTP_PORT
+        port = port or default_port
+        ssl_context = None
+        if https:
+            ssl_context = create_ssl_context(self.verify if verify is None else verify,
+                                             self.cert if cert is None else cert)
+        if self.headers:
+            headers = OrderedDict(self.headers, **(headers or {}))
+        payload = httpclient.encode_request(method, request_target(url), data, headers, host, port, default_port)
+
+        pool = self._pool_for(scheme, host.lower(), port, ssl_context)
+        limiter = self.limiter
+        if limiter is None:
+            raw = await self._send(pool, method, payload, timeout)
+        else:
+            await self._acquire(host)
+            start = time.monotonic()
+            try:
+                try:
+                    raw = await self._send(pool, method, payload, timeout)
+                except Exception as e:
+                    limiter.observe_error(host, e, time.monotonic() - start)
+                    raise
+                limiter.observe(host, raw.status, raw.headers, time.monotonic() - start)
+            finally:
+                limiter.release(host)
+                released, self._released = self._released, None
+                if released is not None:
+                    released.set()
+
+        response = AsyncResponse.from_http_response(url, raw)
+        if not (self.stream if stream is None else stream):
+            await response.aread()
+        return response
+
+    async def _acquire(self, host):
+        limiter = self.limiter
+        deadline = None if limiter.timeout is None else time.monotonic() + limiter.timeout
+        while True:
+            wait = limiter.try_acquire(host)
+            if not wait:
+                return
+            if deadline is not None:
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    raise LimitTimeout("waited %.1fs for a turn on %s" % (limiter.timeout, host))
+                wait = min(wait, left)
+            # our own releases wake us, slots freed by other threads are polled
+            if self._released is None:
+                self._released = asyncio.Event()
+            try:
+                await asyncio.wait_for(self._released.wait(), min(wait, 1.0))
+            except asyncio.TimeoutError:
+                pass
+
+    async def _send(self, pool, method, payload, timeout):
+        conn = await pool.get()
+        retried = False
+        while True:
+            reused = conn.writer is not None
+            try:
+                if not reused:
+                    await conn.connect(timeout[0])
+                conn.writer.write(payload)
+                await asyncio.wait_for(conn.writer.drain(), timeout[1])
+                raw = AsyncHTTPResponse(conn, pool, method, timeout[1])
+                await raw.begin()
+                break
+            except _DROPPED_CONN_ERRORS:
+                conn.close()
+                if reused and not retried and method.upper() in IDEMPOTENT_METHODS:
+                    retried = True
+                    continue
+                pool.put(conn)
+                raise
+            except BaseException:
+                conn.close()
+                pool.put(conn)
+                raise
+        return raw
+
+    async def get(self, url, **kwargs):
+        return await self.request("GET", url, **kwargs)
+
+    async def options(self, url, **kwargs):
+        return await self.request("OPTIONS", url, **kwargs)
+
+    async def head(self, url, **kwargs):
+        return await self.request("HEAD", url, **kwargs)
+
+    async def post(self, url, data=None, **kwargs):
+        return await self.request("POST", url, data=data, **kwargs)
+
+    async def put(self, url, data=None, **kwargs):
+        return await self.request("PUT", url, data=data, **kwargs)
+
+    async def patch(self, url, data=None, **kwargs):
+        return await self.request("PATCH", url, data=data, **kwargs)
+
+    async def delete(self, url, **kwargs):
+        return await self.request("DELETE", url, **kwargs)
+
+    async def close(self):
+        """Closes all pooled connections."""
+        self.pools.clear()
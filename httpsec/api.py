@@ -7,8 +7,58 @@ This module implements the Requests API.
 :copyright: (c) 2012 by Kenneth Reitz.
 :license: Apache2, see LICENSE for more details.
 """
+import atexit
+import os
+import threading
+
 from . import sessions, response
 
+_default_session = None
+_default_session_lock = threading.Lock()
+
+
+def get_default_session() -> sessions.Session:
+    """Returns the process-wide :class:`Session` used by the module-level API.
+
+    It is created on first use and shares its connection pools across calls,
+    so repeated ``httpsec.get`` calls to a host reuse keep-alive connections.
+    """
+    global _default_session
+    session = _default_session
+    if session is None:
+        with _default_session_lock:
+            if _default_session is None:
+                _default_session = sessions.Session()
+            session = _default_session
+    return session
+
+
+def close_default_session():
+    """Closes the shared session and its pooled connections.
+
+    The next module-level call transparently starts a new one.
+    """
+    global _default_session
+    with _default_session_lock:
+        session, _default_session = _default_session, None
+    if session is not None:
+        session.close()
+
+
+atexit.register(close_default_session)
+
+
+def _forget_default_session():
+    # A forked child must not use the parent's sockets; drop them unclosed
+    # and start over with a fresh session.
+    global _default_session, _default_session_lock
+    _default_session = None
+    _default_session_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_forget_default_session)
+
 
 def request(method, url, **kwargs) -> response.Response:
     """Constructs and sends a :class:`Request <Request>`.
@@ -51,11 +101,9 @@ def request(method, url, **kwargs) -> response.Response:
       <Response [200]>
     """
 
-    # By using the 'with' statement we are sure the session is closed, thus we
-    # avoid leaving sockets open which can trigger a ResourceWarning in some
-    # cases, and look like a memory leak in others.
-    with sessions.Session() as session:
-        return session.request(method=method, url=url, **kwargs)
+    # The shared session keeps its pools between calls; they are released by
+    # close_default_session(), which also runs at interpreter exit.
+    return get_default_session().request(method=method, url=url, **kwargs)
 
 
 def get(url, params=None, **kwargs) -> response.Response:
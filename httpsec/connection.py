@@ -1,17 +1,70 @@
+import functools
+import io
 import socket
 
 import socks
 
 from httpsec import httpclient
+from httpsec.resolver import create_connection, default_resolver, HAPPY_EYEBALLS_DELAY
 
 
 class HTTPConnection(httpclient.HTTPConnection):
-    pass
+    """
+    :param resolver: (optional) :class:`~httpsec.resolver.Resolver` used to
+        look up the host, the shared caching resolver by default.
+    :param happy_eyeballs_delay: (optional) Seconds between staggered
+        connection attempts to the host's addresses, ``None`` to try them in
+        turn.
+    """
+
+    def __init__(self, host, port=None, timeout=getattr(socket, "_GLOBAL_DEFAULT_TIMEOUT"),
+                 source_address=None, blocksize=8192, resolver=None, happy_eyeballs_delay=HAPPY_EYEBALLS_DELAY,
+                 **kwargs):
+        super(HTTPConnection, self).__init__(host, port, timeout=timeout, source_address=source_address,
+                                             blocksize=blocksize, **kwargs)
+        self.resolver = resolver
+        self._create_connection = functools.partial(create_connection, resolver=resolver,
+                                                    happy_eyeballs_delay=happy_eyeballs_delay)
+
+
+class HTTPSConnection(HTTPConnection, httpclient.HTTPSConnection):
+    """
+    :param context: (optional) :class:`ssl.SSLContext` to wrap the socket
+        with, usually one shared from :func:`~httpsec.utils.create_ssl_context`.
+    :param tls_session_cache: (optional) :class:`~httpsec.utils.TLSSessionCache`
+        to resume TLS sessions from.
+    """
+
+    def __init__(self, host, port=None, tls_session_cache=None, **kwargs):
+        super(HTTPSConnection, self).__init__(host, port, **kwargs)
+        self.tls_session_cache = tls_session_cache
+        self._tls_session_saved = False
+
+    def _tls_session_key(self):
+        return self.host, self.port, self._tunnel_host or self.host
 
+    def connect(self):
+        "Connect to a host on a given (SSL) port, resuming a cached session."
+        cache = self.tls_session_cache
+        if cache is None:
+            return super(HTTPSConnection, self).connect()
 
+        httpclient.HTTPConnection.connect(self)
+        key = self._tls_session_key()
+        with self._handshake_deadline():
+            self.sock = self._context.wrap_socket(self.sock, server_hostname=key[2],
+                                                  session=cache.get(self._context, key))
+        cache.update(self._context, key, self.sock)
+        self._tls_session_saved = self.sock.session is not None and self.sock.session.has_ticket
 
-class HTTPSConnection(httpclient.HTTPConnection):
-    pass
+    def getresponse(self):
+        response = super(HTTPSConnection, self).getresponse()
+        # TLS 1.3 tickets arrive after the handshake, keep the session once
+        # some application data has been read
+        if self.tls_session_cache is not None and not self._tls_session_saved and self.sock is not None:
+            self.tls_session_cache.save(self._context, self._tls_session_key(), self.sock)
+            self._tls_session_saved = True
+        return response
 
 
 class SOCKSConnection(HTTPConnection):
@@ -20,14 +73,24 @@ class SOCKSConnection(HTTPConnection):
     """
 
     def __init__(self, host, port=None, timeout=getattr(socket, "_GLOBAL_DEFAULT_TIMEOUT"),
-                 source_address=None, blocksize=8192, **kwargs):
+                 source_address=None, blocksize=8192, resolver=None, happy_eyeballs_delay=HAPPY_EYEBALLS_DELAY,
+                 read_buffer_size=io.DEFAULT_BUFFER_SIZE, **kwargs):
         super(SOCKSConnection, self).__init__(host, port, timeout=timeout, source_address=source_address,
-                                              blocksize=blocksize)
+                                              blocksize=blocksize, resolver=resolver,
+                                              happy_eyeballs_delay=happy_eyeballs_delay,
+                                              read_buffer_size=read_buffer_size)
         socks_options = kwargs.get('socks_opts')
         self.socks_options = socks_options
         self._create_connection = self.fork_create_connection
 
     def fork_create_connection(self, address, *args, **extra_kw):
+        if not self.socks_options["rDNS"]:
+            # resolve the target locally through the cache instead of PySocks
+            host, port = address
+            # SOCKS4 can only carry an IPv4 address
+            socks4 = self.socks_options["socks_version"] == socks.PROXY_TYPE_SOCKS4
+            family = socket.AF_INET if socks4 else socket.AF_UNSPEC
+            address = ((self.resolver or default_resolver).resolve(host, port, family)[0][4][0], port)
         conn = socks.create_connection(
             address,
             proxy_type=self.socks_options["socks_version"],
@@ -1,14 +1,18 @@
+import queue
 import re
+import ssl
 import sys
+import time
 from http.client import HTTPException
 
 from urllib3 import Retry
 from urllib3.connection import BaseSSLError
 from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool, ProtocolError, SSLError, CertificateError, \
     ProxyError, log, MaxRetryError
-from urllib3.exceptions import HostChangedError, EmptyPoolError, NewConnectionError
+from urllib3.exceptions import HostChangedError, EmptyPoolError, NewConnectionError, ClosedPoolError
 
 from socket import error as socket_error
+from urllib3.util.wait import wait_for_read
 from httpsec.response import Response
 
 _Default = object()
@@ -386,3 +390,212 @@ class HttpConnectionPool(HTTPConnectionPool):
 
 class HttpsConnectionPool(HttpConnectionPool, HTTPSConnectionPool):
     ResponseCls = Response
+
+
+def _is_dropped(sock):
+    """
+    Whether the idle ``sock`` was closed by the peer, or got bytes nobody
+    asked for.
+    """
+    if not wait_for_read(sock, timeout=0.0):
+        return False
+    if not isinstance(sock, ssl.SSLSocket):
+        return True
+    # TLS 1.3 session tickets arrive after the handshake and make a socket
+    # that has not been used yet readable: let ssl take them in
+    timeout = sock.gettimeout()
+    sock.settimeout(0.0)
+    try:
+        sock.recv(1)
+    except ssl.SSLWantReadError:
+        return False
+    except OSError:
+        pass
+    finally:
+        sock.settimeout(timeout)
+    return True
+
+
+class HostConnectionPool(object):
+    """
+    Thread-safe pool of connections to a single host.
+
+    Connections are checked out with :meth:`_get_conn` and handed back with
+    :meth:`_put_conn` once their response has been fully read, so every
+    caller gets a socket of its own.
+
+    :param pool_key:
+        The :class:`~httpsec.adapters.PoolKey` this pool serves.
+
+    :param conn_factory:
+        Callable returning a fresh, unconnected connection.
+
+    :param maxsize:
+        Number of connections to save that can be reused. More than 1 is
+        useful in multithreaded situations. If ``block`` is set to False,
+        more connections will be created but they will not be saved once
+        they've been used.
+
+    :param block:
+        If set to True, no more than ``maxsize`` connections will be used at
+        a time. When no free connections are available, the call will block
+        until a connection has been released.
+
+    :param idle_timeout:
+        Seconds a connection may sit unused in the pool before its socket is
+        closed. A shorter ``Keep-Alive: timeout=N`` sent by the server wins.
+
+    :param max_requests:
+        Number of requests after which a socket is closed and reopened.
+        ``Keep-Alive: max=M`` from the server is honoured as well.
+    """
+
+    QueueCls = queue.LifoQueue
+
+    #: Seconds taken off the server's keep-alive timeout so that the socket is
+    #: retired before the server drops it.
+    keep_alive_grace = 1.0
+
+    def __init__(self, pool_key, conn_factory, maxsize=1, block=False, idle_timeout=None, max_requests=None):
+        self.pool_key = pool_key
+        self.conn_factory = conn_factory
+        self.maxsize = maxsize
+        self.block = block
+        self.idle_timeout = idle_timeout
+        self.max_requests = max_requests
+        self.pool = self.QueueCls(maxsize)
+        self.num_connections = 0
+
+        # Fill the queue up so that doing get() on it will block properly
+        for _ in range(maxsize):
+            self.pool.put(None)
+
+    def _new_conn(self):
+        self.num_connections += 1
+        return self.conn_factory()
+
+    def _get_conn(self, timeout=None):
+        """
+        Get a connection. Will return a pooled connection if one is available.
+
+        If no connections are available and :prop:`.block` is ``False``, then a
+        fresh connection is returned.
+
+        :param timeout:
+            Seconds to wait before giving up and raising
+            :class:`urllib3.exceptions.EmptyPoolError` if the pool is empty and
+            :prop:`.block` is ``True``.
+        """
+        conn = None
+        if self.pool is None:
+            raise ClosedPoolError(self, "Pool is closed.")
+
+        try:
+            conn = self.pool.get(block=self.block, timeout=timeout)
+        except AttributeError:  # self.pool is None
+            raise ClosedPoolError(self, "Pool is closed.")
+        except queue.Empty:
+            if self.block:
+                raise EmptyPoolError(
+                    self,
+                    "Pool reached maximum size and no more connections are allowed.",
+                )
+            pass  # Oh well, we'll create a new connection then
+
+        # If this is a persistent connection, check if it got disconnected
+        if conn and self._is_expired(conn, time.monotonic()):
+            log.debug("Retiring expired connection: %s", self.pool_key.host)
+            conn.close()
+        elif conn and conn.sock is not None and _is_dropped(conn.sock):
+            log.debug("Resetting dropped connection: %s", self.pool_key.host)
+            conn.close()
+
+        return conn or self._new_conn()
+
+    def _put_conn(self, conn):
+        """
+        Put a connection back into the pool.
+
+        If the pool is already full or closed, the connection is closed and
+        discarded because we exceeded maxsize. If connections are discarded
+        frequently, then maxsize should be increased.
+        """
+        if conn:
+            conn.idle_since = time.monotonic()
+        if self.pool is not None:
+            try:
+                self.pool.put(conn, block=False)
+                return  # Everything is dandy, done.
+            except AttributeError:
+                # self.pool is None.
+                pass
+            except queue.Full:
+                log.warning(
+                    "Connection pool is full, discarding connection: %s",
+                    self.pool_key.host,
+                )
+
+        # Connection never got put back into the pool, close it.
+        if conn:
+            conn.close()
+
+    def _is_expired(self, conn, now):
+        """
+        Whether the socket of an idle ``conn`` should be closed before reuse.
+        """
+        if conn.sock is None:
+            return False
+
+        if self.max_requests is not None and conn.num_requests >= self.max_requests:
+            return True
+        # Keep-Alive: max= is the number of requests the server still accepts
+        if conn.keep_alive_max is not None and conn.keep_alive_max <= 0:
+            return True
+
+        idle_timeout = self.idle_timeout
+        if conn.keep_alive_timeout is not None:
+            server_timeout = max(conn.keep_alive_timeout - self.keep_alive_grace, conn.keep_alive_timeout / 2)
+            if idle_timeout is None or server_timeout < idle_timeout:
+                idle_timeout = server_timeout
+        if idle_timeout is None or conn.idle_since is None:
+            return False
+        return now - conn.idle_since >= idle_timeout
+
+    def reap(self):
+        """
+        Close the sockets of idle connections that have expired.
+
+        The connection objects stay in the pool and reconnect on next use.
+        Returns the number of sockets closed.
+        """
+        pool = self.pool
+        if pool is None:
+            return 0
+        now = time.monotonic()
+        reaped = 0
+        # Hold the queue lock so no connection is checked out while we look.
+        with pool.mutex:
+            for conn in pool.queue:
+                if conn and self._is_expired(conn, now):
+                    conn.close()
+                    reaped += 1
+        if reaped:
+            log.debug("Reaped %d idle connections: %s", reaped, self.pool_key.host)
+        return reaped
+
+    def close(self):
+        """
+        Close all pooled connections and disable the pool.
+        """
+        if self.pool is None:
+            return
+        # Disable access to the pool
+        old_pool, self.pool = self.pool, None
+
+        try:
+            while True:
+                conn = old_pool.get(block=False)
+                if conn:
+                    conn.close()
+        except queue.Empty:
+            pass  # Done.
@@ -0,0 +1,537 @@
+"""
+httpsec.engine
+~~~~~~~~~~~~~~
+
+Scan engine: thousands of non-blocking connections multiplexed on one
+thread with :mod:`selectors`, no thread per request.
+
+Requests are serialized by :func:`httpclient.encode_request` and parsed by
+:class:`~httpsec.parser.ResponseParser`, so the bytes on the wire are the
+ones :class:`~httpsec.sessions.Session` would send.
+"""
+import heapq
+import itertools
+import os
+import selectors
+import socket
+import ssl
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+from urllib3.util.wait import wait_for_read
+
+from httpsec import httpclient
+from httpsec.adapters import IDEMPOTENT_METHODS, _DROPPED_CONN_ERRORS
+from httpsec.model import Request, Response, Result
+from httpsec.parser import Data, EndOfMessage, ResponseParser
+from httpsec.resolver import default_resolver, _CONNECT_IN_PROGRESS
+from httpsec.url import request_target, split_origin
+from httpsec.utils import REORDER_WINDOW, ReorderBuffer, create_ssl_context
+
+#: Bytes asked from a socket per read.
+READ_SIZE = 64 * 1024
+
+# connection states
+_ES_RESOLVING = "Resolving"
+_ES_CONNECTING = "Connecting"
+_ES_HANDSHAKE = "Handshake"
+_ES_SENDING = "Sending"
+_ES_RECEIVING = "Receiving"
+_ES_IDLE = "Idle"
+_ES_CLOSED = "Closed"
+
+_CONNECT_STATES = (_ES_RESOLVING, _ES_CONNECTING, _ES_HANDSHAKE)
+
+_Null = object()
+
+
+class _Job(object):
+    """One request on its way through the engine."""
+    __slots__ = ("index", "request", "method", "url", "payload", "key", "host", "port", "ssl_context",
+                 "connect_timeout", "read_timeout", "retried", "body")
+
+    def __init__(self, index, request):
+        self.index = index
+        self.request = request
+        self.method = request.method
+        self.url = request.url
+        self.retried = False
+        self.body = []
+
+
+class _Conn(object):
+    """A socket, its TLS state and the job it is serving."""
+    __slots__ = ("key", "host", "port", "ssl_context", "sock", "infos", "tls", "incoming", "outgoing", "out",
+                 "events", "state", "deadline", "job", "parser", "reused")
+
+    def __init__(self, key, host, port, ssl_context):
+        self.key = key
+        self.host = host
+        self.port = port
+        self.ssl_context = ssl_context
+        self.sock = None
+        self.infos = None
+        self.tls = self.incoming = self.outgoing = None
+        self.out = bytearray()
+        self.events = 0
+        self.state = _ES_RESOLVING
+        self.deadline = None
+        self.job = None
+        self.parser = None
+        self.reused = False
+
+
+class Engine(object):
+    """
+    Sends batches of requests from a single thread over non-blocking sockets.
+
+    Basic Usage::
+
+      >>> with httpsec.Engine(max_connections=2000, timeout=5) as engine:
+      ...     for result in engine.imap(urls):
+      ...         print(result.request.url, result.response and result.response.status_code)
+
+    Bodies are read completely. Names missing from the resolver cache are
+    looked up on a small thread pool. Proxies are not supported, use
+    :meth:`Session.imap <httpsec.sessions.Session.imap>` for those. Every
+    connection is a file descriptor: keep ``max_connections`` plus
+    ``max_idle`` below ``ulimit -n``.
+
+    :param max_connections: Number of requests in flight at once.
+    :param timeout: ``(connect timeout, read timeout)`` in seconds, or one
+        number for both. The connect timeout covers DNS, TCP and TLS.
+    :param verify: Verify TLS certificates.
+    :param cert: (optional) Client certificate, as for :class:`Session`.
+    :param headers: (optional) Headers sent with every request.
+    :param max_idle: Keep-alive connections kept open between requests
+        (``max_connections`` by default).
+    :param resolver: (optional) :class:`~httpsec.resolver.Resolver` for name lookups.
+    :param resolver_workers: Threads for lookups that miss the cache.
+    """
+
+    def __init__(self, max_connections=1000, timeout=(10, 30), verify=True, cert=None, headers=None,
+                 max_idle=None, resolver=None, resolver_workers=16):
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.verify = verify
+        self.cert = cert
+        self.headers = headers
+        self.max_idle = max_connections if max_idle is None else max_idle
+        self.resolver = resolver or default_resolver
+        self._selector = selectors.DefaultSelector()
+        self._executor = ThreadPoolExecutor(max_workers=resolver_workers)
+        # lookups finish on executor threads and wake the selector
+        self._resolved = deque()
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+        self._wake_w.setblocking(False)
+        self._selector.register(self._wake_r, selectors.EVENT_READ, None)
+        self._deadlines = []
+        self._seq = itertools.count()
+        self._active = set()
+        self._results = deque()
+        # key -> deque of idle connections, plus their global LRU order
+        self._idle = {}
+        self._idle_lru = OrderedDict()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def imap(self, requests, ordered=False):
+        """Sends ``requests`` and yields a :class:`~httpsec.model.Result` for
+        each as it completes.
+
+        ``requests`` is consumed lazily, so it may be an arbitrarily long
+        iterator.
+
+        :param requests: Iterable of :class:`~httpsec.model.Request` objects,
+            dicts of their arguments, or bare URLs (sent as ``GET``). Of the
+            request keyword arguments, ``timeout``, ``verify`` and ``cert``
+            are honoured.
+        :param ordered: Yield results in input order rather than as they
+            complete. Input stops being read while ``REORDER_WINDOW *
+            max_connections`` results wait on an earlier one.
+        """
+        requests = iter(requests)
+        exhausted = False
+        index = itertools.count()
+        order = ReorderBuffer(max_held=REORDER_WINDOW * self.max_connections)
+        try:
+            while True:
+                while not exhausted and len(self._active) < self.max_connections and not order.full:
+                    spec = next(requests, _Null)
+                    if spec is _Null:
+                        exhausted = True
+                        break
+                    self._start(_Job(next(index), Request.from_spec(spec)))
+                if not self._results:
+                    if not self._active:
+                        return
+                    self._poll()
+                while self._results:
+                    result_index, result = self._results.popleft()
+                    if not ordered:
+                        yield result
+                        continue
+                    yield from order.add(result_index, result)
+        finally:
+            for conn in list(self._active):
+                self._close(conn)
+                conn.job = None
+            self._active.clear()
+            self._results.clear()
+
+    def map(self, requests):
+        """Like :meth:`imap`, but returns the list of results in input order.
+
+        :rtype: list
+        """
+        return list(self.imap(requests, ordered=True))
+
+    def close(self):
+        """Closes idle connections and stops the resolver threads."""
+        for conn in list(self._idle_lru):
+            self._close(conn)
+        self._idle.clear()
+        self._idle_lru.clear()
+        self._executor.shutdown(wait=False)
+        self._selector.close()
+        self._wake_r.close()
+        self._wake_w.close()
+
+    # -- scheduling
+
+    def _start(self, job):
+        request = job.request
+        try:
+            timeout = request.kwargs.get("timeout", self.timeout)
+            if not isinstance(timeout, tuple):
+                timeout = (timeout, timeout)
+            job.connect_timeout, job.read_timeout = timeout
+            scheme, host, port = split_origin(job.url)
+            https = scheme == "https"
+            default_port = httpclient.HTTPS_PORT if https else httpclient.HTTP_PORT
+            job.host = host
+            job.port = port or default_port
+            job.ssl_context = None
+            if https:
+                job.ssl_context = create_ssl_context(request.kwargs.get("verify", self.verify),
+                                                     request.kwargs.get("cert", self.cert))
+            headers = request.headers
+            if self.headers:
+                headers = OrderedDict(self.headers, **(headers or {}))
+            job.payload = httpclient.encode_request(job.method, request_target(job.url), request.data, headers,
+                                                    host, port, default_port)
+            job.key = (scheme, host.lower(), job.port, job.ssl_context)
+        except Exception as e:
+            self._results.append((job.index, Result(request, None, e)))
+            return
+        self._dispatch(job)
+
+    def _dispatch(self, job, fresh=False):
+        conn = None if fresh else self._take_idle(job.key)
+        if conn is not None:
+            conn.job = job
+            conn.reused = True
+            self._active.add(conn)
+            self._set_deadline(conn, job.read_timeout)
+            try:
+                self._send(conn)
+            except Exception as e:
+                # a kept-alive socket the server has just closed: _fail
+                # sends the request again on a new connection
+                self._fail(conn, e)
+            return
+        conn = _Conn(job.key, job.host, job.port, job.ssl_context)
+        conn.job = job
+        self._active.add(conn)
+        self._set_deadline(conn, job.connect_timeout)
+        try:
+            infos = self.resolver.cached(job.host, job.port)
+            if infos is None:
+                future = self._executor.submit(self.resolver.resolve, job.host, job.port)
+                future.add_done_callback(lambda f, c=conn: self._on_resolved(c, f))
+            else:
+                self._connect(conn, infos)
+        except Exception as e:
+            self._fail(conn, e)
+
+    def _complete(self, conn, response, exception):
+        job = conn.job
+        conn.job = None
+        conn.deadline = None
+        self._active.discard(conn)
+        self._results.append((job.index, Result(job.request, response, exception)))
+
+    def _finish(self, conn):
+        job, parser = conn.job, conn.parser
+        response = Response.from_http_response(job.url, parser)
+        response.raw = None
+        response._content = b"".join(job.body)
+        response._content_consumed = True
+        self._complete(conn, response, None)
+        # bytes past the end of the response mean the stream is out of step
+        if parser.will_close or parser.trailing_data or not self.max_idle:
+            self._close(conn)
+        else:
+            self._put_idle(conn)
+
+    def _fail(self, conn, exception):
+        job = conn.job
+        self._close(conn)
+        if job is None:
+            return
+        # a kept-alive connection the server dropped before answering
+        if (conn.reused and not job.retried and isinstance(exception, _DROPPED_CONN_ERRORS) and
+                (conn.parser is None or conn.parser.status is None) and
+                job.method.upper() in IDEMPOTENT_METHODS):
+            job.retried = True
+            job.body = []
+            self._active.discard(conn)
+            conn.job = None
+            self._dispatch(job, fresh=True)
+            return
+        self._complete(conn, None, exception)
+
+    # -- keep-alive
+
+    def _take_idle(self, key):
+        idle = self._idle.get(key)
+        while idle:
+            conn = idle.pop()
+            del self._idle_lru[conn]
+            # readable while idle: closed by the peer, or out of step
+            if not wait_for_read(conn.sock, timeout=0.0):
+                return conn
+            self._close(conn)
+        return None
+
+    def _put_idle(self, conn):
+        conn.state = _ES_IDLE
+        conn.parser = None
+        self._watch(conn, 0)
+        self._idle.setdefault(conn.key, deque()).append(conn)
+        self._idle_lru[conn] = conn.key
+        if len(self._idle_lru) > self.max_idle:
+            oldest, key = self._idle_lru.popitem(last=False)
+            self._idle[key].remove(oldest)
+            if not self._idle[key]:
+                del self._idle[key]
+            self._close(oldest)
+
+    # -- I/O
+
+    def _poll(self):
+        for key, mask in self._selector.select(self._next_timeout()):
+            conn = key.data
+            if conn is None:
+                self._drain_wakeups()
+                continue
+            try:
+                if mask & selectors.EVENT_WRITE:
+                    self._on_writable(conn)
+                if mask & selectors.EVENT_READ and conn.job is not None and conn.sock is not None:
+                    self._on_readable(conn)
+            except Exception as e:
+                self._fail(conn, e)
+        while self._resolved:
+            conn, future = self._resolved.popleft()
+            if conn.state != _ES_RESOLVING or conn.job is None:
+                continue  # timed out meanwhile
+            try:
+                self._connect(conn, future.result())
+            except Exception as e:
+                self._fail(conn, e)
+        self._expire()
+
+    def _on_resolved(self, conn, future):
+        # runs on a resolver thread
+        self._resolved.append((conn, future))
+        try:
+            self._wake_w.send(b"\0")
+        except (BlockingIOError, OSError):
+            pass
+
+    def _drain_wakeups(self):
+        try:
+            while self._wake_r.recv(4096):
+                pass
+        except (BlockingIOError, InterruptedError):
+            pass
+
+    def _watch(self, conn, events):
+        if events == conn.events:
+            return
+        if not conn.events:
+            self._selector.register(conn.sock, events, conn)
+        elif not events:
+            self._selector.unregister(conn.sock)
+        else:
+            self._selector.modify(conn.sock, events, conn)
+        conn.events = events
+
+    def _close(self, conn):
+        if conn.events:
+            self._selector.unregister(conn.sock)
+            conn.events = 0
+        if conn.sock is not None:
+            conn.sock.close()
+            conn.sock = None
+        conn.tls = conn.incoming = conn.outgoing = None
+        conn.deadline = None
+        conn.state = _ES_CLOSED
+
+    def _connect(self, conn, infos=None):
+        if infos is not None:
+            conn.infos = deque(self.resolver.sorted_for_connect(conn.host, infos))
+        err = None
+        while conn.infos:
+            af, socktype, proto, canonname, sa = conn.infos.popleft()
+            sock = socket.socket(af, socktype, proto)
+            sock.setblocking(False)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            code = sock.connect_ex(sa)
+            if code == 0 or code in _CONNECT_IN_PROGRESS:
+                conn.sock = sock
+                conn.state = _ES_CONNECTING
+                self._watch(conn, selectors.EVENT_WRITE)
+                return
+            sock.close()
+            err = OSError(code, os.strerror(code))
+        raise err or OSError("getaddrinfo returns an empty list")
+
+    def _on_writable(self, conn):
+        if conn.state != _ES_CONNECTING:
+            self._flush(conn)
+            return
+        code = conn.sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+        if code:
+            self._watch(conn, 0)
+            conn.sock.close()
+            conn.sock = None
+            if conn.infos:
+                self._connect(conn)
+                return
+            raise OSError(code, os.strerror(code))
+        self.resolver.remember_family(conn.host, conn.sock.family)
+        if conn.ssl_context is None:
+            self._send(conn)
+            return
+        conn.incoming = ssl.MemoryBIO()
+        conn.outgoing = ssl.MemoryBIO()
+        conn.tls = conn.ssl_context.wrap_bio(conn.incoming, conn.outgoing, server_hostname=conn.host)
+        conn.state = _ES_HANDSHAKE
+        self._handshake(conn)
+
+    def _handshake(self, conn):
+        try:
+            conn.tls.do_handshake()
+        except ssl.SSLWantReadError:
+            self._flush(conn)
+            return
+        self._send(conn)
+
+    def _send(self, conn):
+        job = conn.job
+        conn.parser = ResponseParser(job.method)
+        conn.state = _ES_SENDING
+        if conn.tls is not None:
+            conn.tls.write(job.payload)
+        else:
+            conn.out += job.payload
+        self._flush(conn)
+
+    def _flush(self, conn):
+        if conn.tls is not None and conn.outgoing.pending:
+            conn.out += conn.outgoing.read()
+        out = conn.out
+        while out:
+            try:
+                n = conn.sock.send(out)
+            except (BlockingIOError, InterruptedError):
+                break
+            del out[:n]
+        if conn.state == _ES_SENDING and not out:
+            conn.state = _ES_RECEIVING
+            self._set_deadline(conn, conn.job.read_timeout)
+        events = selectors.EVENT_WRITE if out else 0
+        if conn.state in (_ES_HANDSHAKE, _ES_RECEIVING):
+            events |= selectors.EVENT_READ
+        self._watch(conn, events)
+
+    def _on_readable(self, conn):
+        try:
+            data = conn.sock.recv(READ_SIZE)
+        except (BlockingIOError, InterruptedError):
+            return
+        eof = not data
+        if conn.tls is not None:
+            if data:
+                conn.incoming.write(data)
+            else:
+                conn.incoming.write_eof()
+            if conn.state == _ES_HANDSHAKE:
+                self._handshake(conn)
+                return
+            plain = []
+            try:
+                while True:
+                    chunk = conn.tls.read(READ_SIZE)
+                    if not chunk:
+                        eof = True
+                        break
+                    plain.append(chunk)
+            except ssl.SSLWantReadError:
+                pass
+            except (ssl.SSLZeroReturnError, ssl.SSLEOFError):
+                # close_notify, or a ragged EOF many servers send
+                eof = True
+            data = b"".join(plain)
+        if conn.state != _ES_RECEIVING:
+            if eof:
+                raise ConnectionResetError("connection closed while sending the request")
+            return
+        if data:
+            self._set_deadline(conn, conn.job.read_timeout)
+            events = conn.parser.feed(data)
+        else:
+            events = []
+        if eof:
+            events.extend(conn.parser.feed_eof())
+        for event in events:
+            if type(event) is Data:
+                conn.job.body.append(event.data)
+            elif type(event) is EndOfMessage:
+                self._finish(conn)
+                return
+
+    # -- timeouts
+
+    def _set_deadline(self, conn, timeout):
+        if timeout is None:
+            conn.deadline = None
+            return
+        conn.deadline = time.monotonic() + timeout
+        heapq.heappush(self._deadlines, (conn.deadline, next(self._seq), conn))
+
+    def _next_timeout(self):
+        deadlines = self._deadlines
+        while deadlines and deadlines[0][2].deadline != deadlines[0][0]:
+            heapq.heappop(deadlines)  # superseded
+        if not deadlines:
+            return None
+        return max(0.0, deadlines[0][0] - time.monotonic())
+
+    def _expire(self):
+        now = time.monotonic()
+        deadlines = self._deadlines
+        while deadlines and deadlines[0][0] <= now:
+            deadline, _, conn = heapq.heappop(deadlines)
+            if conn.deadline != deadline or conn.job is None:
+                continue
+            phase = "connect" if conn.state in _CONNECT_STATES else "read"
+            self._fail(conn, socket.timeout("%s timed out" % phase))
@@ -0,0 +1,172 @@
+"""
+httpsec.headers
+~~~~~~~~~~~~~~~
+
+Response header fields parsed straight from the bytes on the wire.
+"""
+from http.client import HTTPException
+
+# header name -> the same name, so every response holding a common name
+# shares one bytes object, and its lowered form for lookups
+_NAMES = {}
+_KEYS = {}
+# names are chosen by servers: stop sharing new ones past this many
+_MAX_NAMES = 4096
+
+
+def _intern(name):
+    if len(_NAMES) < _MAX_NAMES:
+        _NAMES[name] = name
+        _KEYS[name] = name.lower()
+    return name
+
+
+class HTTPHeaders(object):
+    """
+    The header fields of a response, in the order and casing they arrived
+    in, duplicates included.
+
+    Names and values stay bytes until asked for, then are decoded as
+    latin-1. Lookups are case-insensitive and go through an index built on
+    the first one; they return the first field of that name, :meth:`getall`
+    returns every one.
+
+    Basic Usage::
+
+      >>> r = s.get("https://example.com/")
+      >>> r.headers["content-type"]
+      'text/html; charset=UTF-8'
+      >>> r.headers.getall("Set-Cookie")
+      ['a=1; Path=/', 'b=2; Path=/']
+      >>> r.headers.raw
+      b'Content-Type: text/html; charset=UTF-8\\r\\n...'
+
+    :ivar raw: The header block exactly as received.
+    :ivar defects: Lines that are not ``name: value`` fields, skipped in
+        lenient mode.
+    """
+    __slots__ = ("raw", "defects", "_fields", "_index")
+
+    def __init__(self, raw=b"", fields=None, defects=()):
+        self.raw = raw
+        # name, value, name, value, ... as bytes
+        self._fields = fields if fields is not None else []
+        self.defects = defects
+        self._index = None
+
+    @classmethod
+    def parse(cls, block, strict=False):
+        """
+        Parse a header block, status line excluded.
+
+        Folded lines are joined to the field they continue with a space.
+        In lenient mode (the default) lines without a colon are set aside
+        in :attr:`defects` and whitespace before the colon is dropped; with
+        ``strict`` both raise :class:`~http.client.HTTPException`.
+        """
+        fields = []
+        defects = []
+        append = fields.append
+        names = _NAMES
+        for line in block.splitlines():
+            if not line:
+                continue
+            if line[0] in b" \t":
+                # obs-fold, the value goes on
+                if fields:
+                    fields[-1] = fields[-1] + b" " + line.strip(b" \t")
+                    continue
+            else:
+                name, colon, value = line.partition(b":")
+                if colon and name and name[-1] not in b" \t":
+                    append(names.get(name) or _intern(name))
+                    append(value.strip(b" \t"))
+                    continue
+                name = name.rstrip(b" \t")
+                if colon and name and not strict:
+                    append(names.get(name) or _intern(name))
+                    append(value.strip(b" \t"))
+                    continue
+            if strict:
+                raise HTTPException("malformed header line %r" % line[:100])
+            defects.append(line)
+        return cls(bytes(block), fields, defects or ())
+
+    def _lookup(self):
+        index = self._index
+        if index is None:
+            index = self._index = {}
+            keys = _KEYS
+            fields = self._fields
+            # lowered name -> position of its first field: fill in from the
+            # last field so the first of a name is the one left
+            for i in range(len(fields) - 2, -1, -2):
+                name = fields[i]
+                index[keys.get(name) or name.lower()] = i
+        return index
+
+    @staticmethod
+    def _key(name):
+        return name.lower().encode("latin-1", "replace")
+
+    def get(self, name, default=None):
+        """Value of the first ``name`` field, ``default`` if there is none."""
+        i = self._lookup().get(self._key(name))
+        if i is None:
+            return default
+        return self._fields[i + 1].decode("latin-1")
+
+    def get_all(self, name, failobj=None):
+        """Values of all ``name`` fields in order, ``failobj`` if there are none."""
+        key = self._key(name)
+        i = self._lookup().get(key)
+        if i is None:
+            return failobj
+        fields = self._fields
+        return [fields[j + 1].decode("latin-1") for j in range(i, len(fields), 2) if fields[j].lower() == key]
+
+    def getall(self, name):
+        """Values of all ``name`` fields in order, empty if there are none."""
+        return self.get_all(name, [])
+
+    def __getitem__(self, name):
+        i = self._lookup().get(self._key(name))
+        if i is None:
+            raise KeyError(name)
+        return self._fields[i + 1].decode("latin-1")
+
+    def __contains__(self, name):
+        return isinstance(name, str) and self._key(name) in self._lookup()
+
+    def __len__(self):
+        return len(self._fields) // 2
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __getstate__(self):
+        return self.raw, self._fields, self.defects
+
+    def __setstate__(self, state):
+        self.raw, self._fields, self.defects = state
+        self._index = None
+
+    def keys(self):
+        """Field names in order, repeated ones included."""
+        return [name.decode("latin-1") for name in self._fields[::2]]
+
+    def values(self):
+        return [value.decode("latin-1") for value in self._fields[1::2]]
+
+    def items(self):
+        """``(name, value)`` of every field in order."""
+        fields = self._fields
+        return [(fields[i].decode("latin-1"), fields[i + 1].decode("latin-1")) for i in range(0, len(fields), 2)]
+
+    def raw_items(self):
+        """``(name, value)`` of every field as the bytes received."""
+        fields = self._fields
+        return list(zip(fields[::2], fields[1::2]))
+
+    def __repr__(self):
+        return "<HTTPHeaders %r>" % (self.items(),)
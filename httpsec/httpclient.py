@@ -1,16 +1,20 @@
 __all__ = ["HTTPResponse", "HTTPConnection"]
 
 import collections.abc
-import email.parser
+import contextlib
 import io
+from collections import namedtuple
 import re
 import socket
 import ssl
-from http.client import CannotSendRequest, ResponseNotReady, LineTooLong, UnknownProtocol, HTTPMessage, HTTPException, \
-    BadStatusLine, RemoteDisconnected, IncompleteRead, InvalidURL, NotConnected, CannotSendHeader
+from http.client import CannotSendRequest, ResponseNotReady, LineTooLong, HTTPException, BadStatusLine, \
+    IncompleteRead, InvalidURL, NotConnected, CannotSendHeader
 from http import HTTPStatus
 from urllib.parse import urlsplit
 
+from httpsec.parser import _MAX_LINE, _MAX_HEADERS, Data, ResponseParser, body_framing, connection_will_close, \
+    parse_chunk_size, parse_header_lines, parse_status_line, parse_version
+
 _UNKNOWN = 'UNKNOWN'
 HTTP_PORT = 80
 HTTPS_PORT = 443
@@ -18,12 +22,14 @@ HTTPS_PORT = 443
 _CS_IDLE = 'Idle'
 _CS_REQ_STARTED = 'Request-started'
 _CS_REQ_SENT = 'Request-sent'
+_CS_PIPELINING = 'Pipelining'
 _is_legal_header_name = re.compile(rb'[^:\s][^:\r\n]*').fullmatch
 _is_illegal_header_value = re.compile(rb'\n(?![ \t])|\r(?![ \t\n])').search
 _METHODS_EXPECTING_BODY = {'PATCH', 'POST', 'PUT'}
-# maximal line length when calling readline().
-_MAX_LINE = 65536
-_MAX_HEADERS = 100
+# chunk sizes reading a body of unknown length; also the most a declared
+# length is trusted for in a single read
+_MIN_READ = 16 * 1024
+_MAX_READ = 1024 * 1024
 
 
 def _encode(data, name='data'):
@@ -41,14 +47,33 @@ def _encode(data, name='data'):
             (name.title(), data[err.start:err.end], name)) from None
 
 
-def parse_headers(fp, _class=HTTPMessage):
-    """Parses only RFC2822 headers from a file pointer.
+#: A response read by :meth:`HTTPConnection.pipeline`, body included.
+PipelinedResponse = namedtuple("PipelinedResponse", ("version", "status", "reason", "headers", "body", "will_close"))
+
+
+def parse_keep_alive(value):
+    """Parse a ``Keep-Alive: timeout=N, max=M`` header value.
+
+    Returns a ``(timeout, max)`` tuple, with ``None`` for missing or
+    malformed parameters.
+    """
+    timeout = max_requests = None
+    for param in value.split(","):
+        name, _, arg = param.partition("=")
+        name = name.strip().lower()
+        try:
+            if name == "timeout":
+                timeout = float(arg)
+            elif name == "max":
+                max_requests = int(arg)
+        except ValueError:
+            pass
+    return timeout, max_requests
+
 
-    email Parser wants to see strings rather than bytes.
-    But a TextIOWrapper around self.rfile would buffer too many bytes
-    from the stream, bytes which we later need to read as bytes.
-    So we read the correct bytes here, as bytes, for email Parser
-    to parse.
+def parse_headers(fp, strict=False):
+    """Reads the header block from a file pointer, line by line so the
+    body stays in `fp', and parses it into :class:`HTTPHeaders`.
 
     """
     headers = []
@@ -61,12 +86,62 @@ def parse_headers(fp, _class=HTTPMessage):
             raise HTTPException("got more than %d headers" % _MAX_HEADERS)
         if line in (b'\r\n', b'\n', b''):
             break
-    h_string = b''.join(headers).decode('iso-8859-1')
-    return email.parser.Parser(_class=_class).parsestr(h_string)
+    return parse_header_lines(headers, strict)
+
+
+class _SocketReader(io.RawIOBase):
+    """Raw reader over a connection's socket, under the buffered reader the
+    connection's responses read from in turn. While a request has a
+    :class:`~httpsec.timeouts.Deadline`, every recv gets what is left of it."""
+
+    def __init__(self, sock):
+        # keeps the socket open after the connection lets go of it, like makefile()
+        self._raw = sock.makefile("rb", buffering=0)
+        self.sock = sock
+        self._deadline = None
+        self._idle_timeout = None
+        self._peeking = False
+
+    def buffered(self, reader):
+        """Whether `reader', the buffered reader over this one, holds bytes
+        nobody has read yet. Never touches the socket."""
+        self._peeking = True
+        try:
+            return bool(reader.peek(1))
+        finally:
+            self._peeking = False
+
+    def use_deadline(self, deadline):
+        """Bound the reads of the next response by `deadline', if not None."""
+        self._deadline = deadline
+        if deadline is not None:
+            self._idle_timeout = self.sock.gettimeout()
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        if self._peeking:
+            # no data "yet", as a non-blocking socket would say
+            return None
+        if self._deadline is None:
+            return self.sock.recv_into(b)
+        return self._deadline.recv_into(self.sock, b, self._idle_timeout)
+
+    def fileno(self):
+        return self._raw.fileno()
+
+    def close(self):
+        if not self.closed:
+            self._raw.close()
+        super().close()
 
 
 class HTTPResponse(io.BufferedIOBase):
-    def __init__(self, sock, method=None, url=None):
+    #: Reject malformed header lines instead of skipping them.
+    strict_headers = False
+
+    def __init__(self, sock, method=None, url=None, deadline=None, reader=None):
         # If the response includes a content-length header, we need to
         # make sure that the client doesn't read more than the
         # specified number of bytes.  If it does, it will block until
@@ -74,7 +149,17 @@ class HTTPResponse(io.BufferedIOBase):
         # happen if a self.fp.read() is done (without a size) whether
         # self.fp is buffered or not.  So, no self.fp.read() by
         # clients unless they know what they are doing.
-        self.fp = sock.makefile("rb")
+        # Reading from the connection's `reader' keeps whatever the
+        # buffer holds past this response for the next one; the response
+        # closes a reader only if it made it, or the connection handed it over.
+        self._owns_fp = reader is None
+        if reader is None:
+            reader = io.BufferedReader(_SocketReader(sock))
+        if deadline is not None:
+            deadline.phase = "headers"
+        reader.raw.use_deadline(deadline)
+        self.fp = reader
+        self._deadline = deadline
         self._method = method
 
         # The HTTPResponse object is returned via urllib.  The clients
@@ -95,38 +180,19 @@ class HTTPResponse(io.BufferedIOBase):
         self.length = _UNKNOWN  # number of bytes left in response
         self.will_close = _UNKNOWN  # conn will close at end of response
 
+        # pool the connection is handed back to once the body is read
+        self._pool = None
+        self._connection = None
+
     def _read_status(self):
         line = str(self.fp.readline(_MAX_LINE + 1), "iso-8859-1")
         if len(line) > _MAX_LINE:
             raise LineTooLong("status line")
-        if not line:
-            # Presumably, the server closed the connection before
-            # sending a valid response.
-            raise RemoteDisconnected("Remote end closed connection without"
-                                     " response")
-        status = ""
-        reason = ""
         try:
-            version, status, reason = line.split(None, 2)
-        except ValueError:
-            try:
-                version, status = line.split(None, 1)
-                reason = ""
-            except ValueError:
-                # empty version will cause next test to fail.
-                version = ""
-        if not version.startswith("HTTP/"):
+            return parse_status_line(line)
+        except BadStatusLine:
             self._close_conn()
-            raise BadStatusLine(line)
-
-        # The status code is a three-digit number
-        try:
-            status = int(status)
-            if status < 100 or status > 999:
-                raise BadStatusLine(line)
-        except ValueError:
-            raise BadStatusLine(line)
-        return version, status, reason
+            raise
 
     def begin(self):
         if self.headers is not None:
@@ -149,99 +215,48 @@ class HTTPResponse(io.BufferedIOBase):
 
         self.status = status
         self.reason = reason.strip()
-        if version in ("HTTP/1.0", "HTTP/0.9"):
-            # Some servers might still return "0.9", treat it as 1.0 anyway
-            self.version = 10
-        elif version.startswith("HTTP/1."):
-            self.version = 11  # use HTTP/1.1 code for HTTP/1.x where x>=1
-        else:
-            raise UnknownProtocol(version)
-
-        self.headers = self.msg = parse_headers(self.fp)
+        self.version = parse_version(version)
 
-        # are we using the chunked-style of transfer encoding?
-        tr_enc = self.headers.get("transfer-encoding")
-        if tr_enc and tr_enc.lower() == "chunked":
-            self.chunked = True
+        self.headers = self.msg = parse_headers(self.fp, self.strict_headers)
+        self.chunked, self.length, self.will_close = body_framing(self.version, status, self._method, self.headers)
+        if self.chunked:
             self.chunk_left = None
-        else:
-            self.chunked = False
-
-        # will the connection close at the end of the response?
-        self.will_close = self._check_close()
-
-        # do we have a Content-Length?
-        # NOTE: RFC 2616, S4.4, #3 says we ignore this if tr_enc is "chunked"
-        self.length = None
-        length = self.headers.get("content-length")
-
-        # are we using the chunked-style of transfer encoding?
-        tr_enc = self.headers.get("transfer-encoding")
-        if length and not self.chunked:
-            try:
-                self.length = int(length)
-            except ValueError:
-                self.length = None
-            else:
-                if self.length < 0:  # ignore nonsensical negative lengths
-                    self.length = None
-        else:
-            self.length = None
-
-        # does the body have a fixed length? (of zero)
-        if (status == HTTPStatus.NO_CONTENT or status == HTTPStatus.NOT_MODIFIED or
-                100 <= status < 200 or  # 1xx codes
-                self._method == "HEAD"):
-            self.length = 0
-
-        # if the connection remains open, and we aren't using chunked, and
-        # a content-length was not provided, then assume that the connection
-        # WILL close.
-        if (not self.will_close and
-                not self.chunked and
-                self.length is None):
-            self.will_close = True
+        if self._deadline is not None:
+            self._deadline.phase = "body"
 
     def _check_close(self):
-        conn = self.headers.get("connection")
-        if self.version == 11:
-            # An HTTP/1.1 proxy is assumed to stay open unless
-            # explicitly closed.
-            if conn and "close" in conn.lower():
-                return True
-            return False
-
-        # Some HTTP/1.0 implementations have support for persistent
-        # connections, using rules different than HTTP/1.1.
-
-        # For older HTTP, Keep-Alive indicates persistent connection.
-        if self.headers.get("keep-alive"):
-            return False
-
-        # At least Akamai returns a "Connection: Keep-Alive" header,
-        # which was supposed to be sent by the client.
-        if conn and "keep-alive" in conn.lower():
-            return False
-
-        # Proxy-Connection is a netscape hack.
-        pconn = self.headers.get("proxy-connection")
-        if pconn and "keep-alive" in pconn.lower():
-            return False
-
-        # otherwise, assume it will close
-        return True
+        return connection_will_close(self.version, self.headers)
 
     def _close_conn(self):
         fp = self.fp
         self.fp = None
-        fp.close()
+        if self._owns_fp:
+            fp.close()
+        elif self._connection is not None and fp.raw.buffered(fp):
+            # the server sent more than this response, the next request on
+            # the connection would take those bytes for its answer
+            self._connection.close()
+        self.release_conn()
+
+    def release_conn(self):
+        """Hand the connection back to its pool, if any."""
+        if self._pool is None or self._connection is None:
+            return
+        self._pool._put_conn(self._connection)
+        self._connection = None
 
     def close(self):
         try:
             super().close()  # set "closed" flag
         finally:
             if self.fp:
+                # the body was not read to the end, so the socket is out of
+                # sync and can't carry another request
+                conn, self._connection = self._connection, None
                 self._close_conn()
+                if conn is not None:
+                    conn.close()
+                    self._pool._put_conn(conn)
 
     # These implementations are for the benefit of io.BufferedReader.
 
@@ -278,10 +293,23 @@ class HTTPResponse(io.BufferedIOBase):
             return b""
 
         if amt is not None:
-            # Amount is given, implement using readinto
-            b = bytearray(amt)
-            n = self.readinto(b)
-            return memoryview(b)[:n].tobytes()
+            if self.chunked:
+                # Amount is given, implement using readinto
+                b = bytearray(amt)
+                n = self.readinto(b)
+                return memoryview(b)[:n].tobytes()
+            if self.length is not None and amt > self.length:
+                # clip the read to the "end of response"
+                amt = self.length
+            # the buffered reader reads straight into the bytes it returns
+            s = self.fp.read(amt)
+            if not s and amt:
+                self._close_conn()
+            elif self.length is not None:
+                self.length -= len(s)
+                if not self.length:
+                    self._close_conn()
+            return s
         else:
             # Amount is not given (unbounded read) so we must check self.length
             # and self.chunked
@@ -290,7 +318,7 @@ class HTTPResponse(io.BufferedIOBase):
                 return self._readall_chunked()
 
             if self.length is None:
-                s = self.fp.read()
+                s = self._readall_unknown()
             else:
                 try:
                     s = self._safe_read(self.length)
@@ -301,6 +329,20 @@ class HTTPResponse(io.BufferedIOBase):
             self._close_conn()  # we read everything
             return s
 
+    def _readall_unknown(self):
+        # no length, the body runs until the connection closes: read in
+        # chunks growing up to _MAX_READ, so a large body takes few reads
+        # and a small one no large allocation
+        chunks = []
+        amt = _MIN_READ
+        while True:
+            chunk = self.fp.read(amt)
+            if not chunk:
+                break
+            chunks.append(chunk)
+            amt = min(amt * 2, _MAX_READ)
+        return b"".join(chunks)
+
     def readinto(self, b):
         """Read up to len(b) bytes into bytearray b and return the number
         of bytes read.
@@ -340,15 +382,12 @@ class HTTPResponse(io.BufferedIOBase):
         line = self.fp.readline(_MAX_LINE + 1)
         if len(line) > _MAX_LINE:
             raise LineTooLong("chunk size")
-        i = line.find(b";")
-        if i >= 0:
-            line = line[:i]  # strip chunk-extensions
         try:
-            return int(line, 16)
+            return parse_chunk_size(line)
         except ValueError:
             # close the connection as protocol synchronisation is
             # probably lost
-            self._close_conn()
+            self.close()
             raise
 
     def _read_and_discard_trailer(self):
@@ -434,10 +473,22 @@ class HTTPResponse(io.BufferedIOBase):
         reading. If the bytes are truly not available (due to EOF), then the
         IncompleteRead exception can be used to detect the problem.
         """
-        data = self.fp.read(amt)
-        if len(data) < amt:
-            raise IncompleteRead(data, amt - len(data))
-        return data
+        # the amount comes from the server (Content-Length, chunk size):
+        # trust it for one read of up to _MAX_READ, past that never ask for
+        # more than has arrived so far, so memory grows only as fast as the
+        # body actually does
+        data = self.fp.read(min(amt, _MAX_READ))
+        if len(data) >= amt:
+            return data
+        chunks = [data]
+        got = len(data)
+        while data and got < amt:
+            data = self.fp.read(min(got, amt - got))
+            chunks.append(data)
+            got += len(data)
+        if got < amt:
+            raise IncompleteRead(b"".join(chunks), amt - got)
+        return b"".join(chunks)
 
     def _safe_readinto(self, b):
         """Same as _safe_read, but for reading into a buffer."""
@@ -598,12 +649,17 @@ class HTTPConnection:
         return None
 
     def __init__(self, host, port=None, timeout=getattr(socket, "_GLOBAL_DEFAULT_TIMEOUT"),
-                 source_address=None, blocksize=8192):
+                 source_address=None, blocksize=8192, read_buffer_size=io.DEFAULT_BUFFER_SIZE):
         self.timeout = timeout
         self.read_timeout = None
         self.source_address = source_address
         self.blocksize = blocksize
+        #: Size of the receive buffer kept for the life of the socket.
+        self.read_buffer_size = read_buffer_size
         self.sock = None
+        self._reader = None
+        #: :class:`~httpsec.timeouts.Deadline` of the request being sent, if any.
+        self.deadline = None
         self._buffer = []
         self.__response = None
         self.__state = _CS_IDLE
@@ -612,6 +668,12 @@ class HTTPConnection:
         self._tunnel_port = None
         self._tunnel_headers = {}
 
+        # usage of the current socket, so pools can retire it in time
+        self.num_requests = 0
+        self.idle_since = None
+        self.keep_alive_timeout = None
+        self.keep_alive_max = None
+
         (self.host, self.port) = self._get_hostport(host, port)
 
         # This is stored as an instance variable to allow unit
@@ -676,7 +738,7 @@ class HTTPConnection:
             self.send(header_bytes)
         self.send(b'\r\n')
 
-        response = self.response_class(self.sock, method=self._method)
+        response = self.response_class(self.sock, method=self._method, reader=self._get_reader())
         (version, code, message) = response._read_status()
 
         if code != HTTPStatus.OK:
@@ -695,8 +757,18 @@ class HTTPConnection:
 
     def connect(self):
         """Connect to the host and port specified in __init__."""
-        self.sock = self._create_connection(
-            (self.host, self.port), self.timeout, self.source_address)
+        self.num_requests = 0
+        self.keep_alive_timeout = self.keep_alive_max = None
+        deadline = self.deadline
+        if deadline is None:
+            self.sock = self._create_connection(
+                (self.host, self.port), self.timeout, self.source_address)
+        else:
+            with deadline.watch():
+                self.sock = self._create_connection(
+                    (self.host, self.port), deadline.timeout(self.timeout, "connect"), self.source_address)
+            # name lookups are not interruptible, catch up after the fact
+            deadline.check()
         self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
 
         if self._tunnel_host:
@@ -715,6 +787,21 @@ class HTTPConnection:
             if response:
                 self.__response = None
                 response.close()
+            reader = self._reader
+            if reader is not None:
+                self._reader = None
+                reader.close()
+
+    def _get_reader(self):
+        """The buffered reader over the current socket, which every
+        response on it reads from in turn."""
+        reader = self._reader
+        if reader is None or reader.raw.sock is not self.sock:
+            if reader is not None:
+                # TLS was set up over a tunnel, the plain socket is done with
+                reader.close()
+            reader = self._reader = io.BufferedReader(_SocketReader(self.sock), self.read_buffer_size)
+        return reader
 
     def send(self, data):
         """Send `data' to the server.
@@ -727,6 +814,14 @@ class HTTPConnection:
             else:
                 raise NotConnected()
 
+        deadline = self.deadline
+        if deadline is None:
+            return self._send_data(data)
+        self.sock.settimeout(deadline.timeout(self.timeout, "send"))
+        with deadline.watch():
+            self._send_data(data)
+
+    def _send_data(self, data):
         if hasattr(data, "read"):
             encode = self._is_textIO(data)
             while 1:
@@ -831,6 +926,11 @@ class HTTPConnection:
         if self.__response and self.__response.isclosed():
             self.__response = None
 
+        # it left bytes behind: they would be read as the next response
+        reader = self._reader
+        if self.__response is None and reader is not None and reader.raw.buffered(reader):
+            self.close()
+
         # in certain cases, we cannot issue another request on this connection.
         # this occurs when:
         #   1) we are in the process of sending a request.   (_CS_REQ_STARTED)
@@ -1069,7 +1169,11 @@ class HTTPConnection:
         if self.__state != _CS_REQ_SENT or self.__response:
             raise ResponseNotReady(self.__state)
 
-        response = self.response_class(self.sock, method=self._method)
+        if self.deadline is None:
+            response = self.response_class(self.sock, method=self._method, reader=self._get_reader())
+        else:
+            response = self.response_class(self.sock, method=self._method, deadline=self.deadline,
+                                           reader=self._get_reader())
 
         try:
             response.begin()
@@ -1082,8 +1186,15 @@ class HTTPConnection:
         assert response.will_close != _UNKNOWN
         self.__state = _CS_IDLE
 
+        self.num_requests += 1
+        keep_alive = response.headers.get("keep-alive")
+        if keep_alive:
+            self.keep_alive_timeout, self.keep_alive_max = parse_keep_alive(keep_alive)
+
         if response.will_close:
             # this effectively passes the connection to the response
+            self._reader = None
+            response._owns_fp = True
             self.close()
         else:
             # remember this, so we can tell when it is complete
@@ -1091,6 +1202,69 @@ class HTTPConnection:
 
         return response
 
+    def pipeline(self, requests):
+        """Send `requests' back to back, then read their responses in order.
+
+        `requests' is a sequence of ``(method, url, body, headers)`` tuples.
+        Returns the list of :class:`PipelinedResponse` read, bodies included.
+        It is shorter than `requests' when the server closed the connection,
+        or said it would, before answering the rest; those requests got no
+        answer and may be sent again.  Errors are raised only if not even
+        the first response arrived.
+        """
+        if self.__state != _CS_IDLE or self.__response:
+            raise CannotSendRequest(self.__state)
+        data = []
+        for method, url, body, headers in requests:
+            buf = _RequestBuffer(self.host, self.port, self.default_port)
+            buf._tunnel_host, buf._tunnel_port = self._tunnel_host, self._tunnel_port
+            buf.request(method, url, body, headers)
+            data.extend(buf.sent)
+
+        self.__state = _CS_PIPELINING
+        responses = []
+        keep = False
+        try:
+            self.send(b"".join(data))
+            reader = self._get_reader()
+            reader.raw.use_deadline(None)
+            parser = ResponseParser(requests[0][0])
+            body = []
+            while True:
+                data = reader.read1(65536)
+                events = parser.feed(data) if data else parser.feed_eof()
+                while True:
+                    for event in events:
+                        if type(event) is Data:
+                            body.append(event.data)
+                    if not parser.done:
+                        break
+                    responses.append(PipelinedResponse(parser.version, parser.status, parser.reason,
+                                                       parser.headers, b"".join(body), parser.will_close))
+                    body = []
+                    if parser.will_close or len(responses) == len(requests):
+                        # anything still buffered answers no request of ours
+                        keep = not parser.will_close and not parser.trailing_data
+                        return responses
+                    parser.next_response(requests[len(responses)][0])
+                    events = parser.feed(b"")
+                if not data:
+                    return responses
+        except Exception:
+            if not responses:
+                raise
+            return responses
+        finally:
+            self.num_requests += len(responses)
+            if responses:
+                keep_alive = responses[-1].headers.get("keep-alive")
+                if keep_alive:
+                    self.keep_alive_timeout, self.keep_alive_max = parse_keep_alive(keep_alive)
+            if keep:
+                self.__state = _CS_IDLE
+            else:
+                self.close()
+
 
 class HTTPSConnection(HTTPConnection):
     "This class allows communication via SSL."
@@ -1102,10 +1276,11 @@ class HTTPSConnection(HTTPConnection):
     def __init__(self, host, port=None, key_file=None, cert_file=None,
                  timeout=socket._GLOBAL_DEFAULT_TIMEOUT,
                  source_address=None, *, context=None,
-                 check_hostname=None, blocksize=8192):
+                 check_hostname=None, blocksize=8192, read_buffer_size=io.DEFAULT_BUFFER_SIZE):
         super(HTTPSConnection, self).__init__(host, port, timeout,
                                               source_address,
-                                              blocksize=blocksize)
+                                              blocksize=blocksize,
+                                              read_buffer_size=read_buffer_size)
         if (key_file is not None or cert_file is not None or
                 check_hostname is not None):
             import warnings
@@ -1145,13 +1320,50 @@ class HTTPSConnection(HTTPConnection):
         else:
             server_hostname = self.host
 
-        self.sock = self._context.wrap_socket(self.sock,
-                                              server_hostname=server_hostname)
+        with self._handshake_deadline():
+            self.sock = self._context.wrap_socket(self.sock,
+                                                  server_hostname=server_hostname)
+
+    def _handshake_deadline(self):
+        """Bound the TLS handshake by the request deadline, if any."""
+        deadline = self.deadline
+        if deadline is None:
+            return contextlib.nullcontext()
+        self.sock.settimeout(deadline.timeout(self.timeout, "tls"))
+        return deadline.watch()
 
 
 __all__.append("HTTPSConnection")
 
 
+class _RequestBuffer(HTTPConnection):
+    """HTTPConnection that collects what it would send instead of sending it."""
+
+    def __init__(self, host, port=None, default_port=HTTP_PORT):
+        self.default_port = default_port
+        super().__init__(host, port)
+        self.sent = []
+
+    def send(self, data):
+        if hasattr(data, "read"):
+            data = b"".join(self._read_readable(data))
+        elif not isinstance(data, (bytes, bytearray, memoryview)):
+            data = b"".join(data)
+        self.sent.append(data)
+
+
+def encode_request(method, url, body=None, headers=None, host="", port=None, default_port=HTTP_PORT):
+    """Serialize a request exactly as :meth:`HTTPConnection.request` would
+    write it to the socket, and return the bytes.
+
+    `url' is used verbatim as the request target, `host' and `port' only
+    feed the automatic Host header.
+    """
+    buf = _RequestBuffer(host, port, default_port)
+    buf.request(method, url, body, headers)
+    return b"".join(buf.sent)
+
+
 def test_connect():
     con = HTTPConnection("127.0.0.1", port=5000)
     con.request("GET", "/aaa")
@@ -0,0 +1,422 @@
+"""
+httpsec.limits
+~~~~~~~~~~~~~~
+
+Per-host concurrency caps and token-bucket rate limits, shared by every
+thread sending through one adapter, and an AIMD controller that sizes the
+per-host cap from observed latency and errors.
+"""
+import email.utils
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict, deque
+from http.client import HTTPException
+
+log = logging.getLogger(__name__)
+
+
+class LimitTimeout(TimeoutError):
+    """A request waited longer than :attr:`Limiter.timeout` for its turn."""
+
+
+def parse_retry_after(value, now=None):
+    """Seconds to wait for a ``Retry-After`` header value (delta-seconds or
+    an HTTP date), ``None`` if it cannot be parsed."""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        date = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError, IndexError):
+        return None
+    if date is None:
+        return None
+    return max(0.0, date.timestamp() - (time.time() if now is None else now))
+
+
+class TokenBucket(object):
+    """
+    ``rate`` tokens per second, holding at most ``burst``. Not thread-safe on
+    its own; :class:`Limiter` guards it.
+    """
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.tokens = self.burst
+        self.stamp = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+    def wait_time(self, now, n=1):
+        """Seconds until ``n`` tokens are available. More than ``burst``
+        only waits for a full bucket, :meth:`take` then leaves it owing."""
+        self._refill(now)
+        need = min(n, self.burst)
+        if self.tokens >= need:
+            return 0.0
+        return (need - self.tokens) / self.rate
+
+    def take(self, now, n=1):
+        self._refill(now)
+        self.tokens -= n
+
+    def full(self, now):
+        self._refill(now)
+        return self.tokens >= self.burst
+
+
+class _HostState(object):
+    __slots__ = ("in_flight", "bucket", "blocked_until", "strikes")
+
+    def __init__(self, bucket):
+        self.in_flight = 0
+        self.bucket = bucket
+        self.blocked_until = 0.0
+        self.strikes = 0
+
+
+class Limiter(object):
+    """
+    Caps requests in flight per host and requests per second per host and
+    overall. Hosts answering ``429`` or ``503`` are paused for their
+    ``Retry-After``, or for ``backoff`` seconds doubling with every refusal
+    in a row.
+
+    A request holds its host slot until the response head has arrived.
+
+    Usage::
+
+      >>> limiter = Limiter(max_per_host=4, rate_per_host=10, rate=200)
+      >>> s = Session(limiter=limiter)
+
+    :param max_per_host: Requests in flight per host, unlimited if ``None``.
+    :param rate_per_host: Requests per second per host, unlimited if ``None``.
+    :param rate: Requests per second over all hosts, unlimited if ``None``.
+    :param burst: Requests a bucket lets through at once after being idle.
+    :param backoff: Pause after a ``429``/``503`` without ``Retry-After``.
+    :param max_backoff: Longest pause honoured, whatever the server asks.
+    :param timeout: Seconds a request waits for its turn before
+        :class:`LimitTimeout` is raised, forever if ``None``.
+    """
+
+    #: Statuses that pause the host.
+    throttle_statuses = frozenset([429, 503])
+
+    def __init__(self, max_per_host=None, rate_per_host=None, rate=None, burst=1, backoff=1.0, max_backoff=300.0,
+                 timeout=None):
+        self.max_per_host = max_per_host
+        self.rate_per_host = rate_per_host
+        self.burst = burst
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self._bucket = TokenBucket(rate, burst) if rate else None
+        self._hosts = {}
+        self._cond = threading.Condition()
+
+    def _state(self, host):
+        state = self._hosts.get(host)
+        if state is None:
+            bucket = TokenBucket(self.rate_per_host, self.burst) if self.rate_per_host else None
+            state = self._hosts[host] = self._new_state(bucket)
+        return state
+
+    def _new_state(self, bucket):
+        return _HostState(bucket)
+
+    def _cap(self, state):
+        return self.max_per_host
+
+    def _prunable(self, state, now):
+        return (not state.in_flight and state.blocked_until <= now and not state.strikes and
+                (state.bucket is None or state.bucket.full(now)))
+
+    def _wait_time(self, state, now, tokens=1):
+        cap = self._cap(state)
+        if cap is not None and state.in_flight >= cap:
+            return math.inf
+        wait = state.blocked_until - now
+        if state.bucket is not None:
+            wait = max(wait, state.bucket.wait_time(now, tokens))
+        if self._bucket is not None:
+            wait = max(wait, self._bucket.wait_time(now, tokens))
+        return max(wait, 0.0)
+
+    def wait_time(self, host):
+        """
+        Seconds until a request to ``host`` could start, ``0.0`` if it could
+        start now, ``float("inf")`` while all its slots are busy.
+        """
+        with self._cond:
+            state = self._hosts.get(host)
+            now = time.monotonic()
+            if state is None:
+                # a host not seen yet has free slots and a full bucket; only
+                # the overall rate can hold it back
+                return self._bucket.wait_time(now) if self._bucket is not None else 0.0
+            return self._wait_time(state, now)
+
+    def acquire(self, host, tokens=1):
+        """Block until a request to ``host`` may start and take its slot.
+
+        :param tokens: Rate tokens to take, one per request when several are
+            pipelined on the one slot.
+        """
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        with self._cond:
+            state = self._state(host)
+            while True:
+                now = time.monotonic()
+                wait = self._wait_time(state, now, tokens)
+                if not wait:
+                    break
+                if deadline is not None:
+                    if now >= deadline:
+                        raise LimitTimeout("waited %.1fs for a turn on %s" % (self.timeout, host))
+                    wait = min(wait, deadline - now)
+                # a release or a pause change wakes us early
+                self._cond.wait(None if wait == math.inf else wait)
+                state = self._state(host)
+            self._take(state, now, tokens)
+
+    def try_acquire(self, host):
+        """Take a slot for ``host`` if a request may start now and return
+        ``0.0``, otherwise return what :meth:`wait_time` would."""
+        with self._cond:
+            state = self._state(host)
+            now = time.monotonic()
+            wait = self._wait_time(state, now)
+            if not wait:
+                self._take(state, now)
+            return wait
+
+    def _take(self, state, now, tokens=1):
+        state.in_flight += 1
+        if state.bucket is not None:
+            state.bucket.take(now, tokens)
+        if self._bucket is not None:
+            self._bucket.take(now, tokens)
+
+    def release(self, host):
+        with self._cond:
+            state = self._hosts.get(host)
+            if state is None:
+                return
+            state.in_flight -= 1
+            now = time.monotonic()
+            # forget hosts with nothing left to remember
+            if self._prunable(state, now):
+                del self._hosts[host]
+            self._cond.notify_all()
+
+    def observe(self, host, status, headers=None, elapsed=None):
+        """Feed a response status back; ``429``/``503`` pause the host.
+
+        :param elapsed: Seconds from taking the slot to the response head.
+        """
+        with self._cond:
+            state = self._hosts.get(host)
+            if status not in self.throttle_statuses:
+                if state is not None:
+                    state.strikes = 0
+                return
+            state = self._state(host)
+            state.strikes += 1
+            delay = parse_retry_after(headers.get("Retry-After")) if headers is not None else None
+            if delay is None:
+                delay = self.backoff * 2 ** (state.strikes - 1)
+            delay = min(delay, self.max_backoff)
+            state.blocked_until = max(state.blocked_until, time.monotonic() + delay)
+            self._cond.notify_all()
+
+    def observe_error(self, host, exception, elapsed=None):
+        """Feed back a request to ``host`` that failed with ``exception``."""
+
+    def paused(self):
+        """``{host: seconds left}`` for hosts currently backing off."""
+        now = time.monotonic()
+        with self._cond:
+            return {host: state.blocked_until - now for host, state in self._hosts.items()
+                    if state.blocked_until > now}
+
+
+def _percentile(ordered, q):
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class _AdaptiveState(_HostState):
+    __slots__ = ("limit", "samples", "baseline", "cut_at", "requests", "errors", "increases", "decreases",
+                 "decision")
+
+    def __init__(self, bucket, limit, window):
+        super(_AdaptiveState, self).__init__(bucket)
+        self.limit = limit
+        # (latency or None, failed) of the most recent requests
+        self.samples = deque(maxlen=window)
+        self.baseline = None
+        self.cut_at = -math.inf
+        self.requests = self.errors = self.increases = self.decreases = 0
+        self.decision = None
+
+
+class AdaptiveLimiter(Limiter):
+    """
+    A :class:`Limiter` whose per-host concurrency cap follows the host (AIMD).
+
+    Each host starts at ``initial`` requests in flight. While its recent
+    median latency stays within ``tolerance`` times the best median seen,
+    the cap grows by ``increase`` for every cap's worth of successful
+    requests. Timeouts, resets and other transport errors,
+    ``429``/``503`` answers, or a share of other 5xx answers above
+    ``error_rate``, multiply it by ``decrease``, at most once for the
+    requests that were in flight together.
+
+    Usage::
+
+      >>> limiter = AdaptiveLimiter(initial=8, max_limit=512)
+      >>> s = Session(limiter=limiter)
+      >>> results = s.map(urls, max_workers=512)
+      >>> limiter.metrics()["example.com"]["limit"]
+      137.4
+
+    :param initial: Cap a host starts with.
+    :param min_limit: Lowest cap.
+    :param max_limit: Highest cap.
+    :param increase: Added to the cap per round of successful requests.
+    :param decrease: Factor the cap is cut by.
+    :param tolerance: Latency growth over the baseline treated as queueing.
+    :param error_rate: Share of 5xx answers in the window that counts as a spike.
+    :param window: Recent requests per host the percentiles and error rate
+        are taken over.
+    :param max_hosts: Hosts remembered; the oldest idle ones are forgotten.
+    :param \\*\\*kwargs: Rate and backoff arguments of :class:`Limiter`.
+    """
+
+    def __init__(self, initial=4, min_limit=1, max_limit=256, increase=1.0, decrease=0.5, tolerance=2.0,
+                 error_rate=0.2, window=50, max_hosts=65536, **kwargs):
+        super(AdaptiveLimiter, self).__init__(**kwargs)
+        self.initial = initial
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.increase = increase
+        self.decrease = decrease
+        self.tolerance = tolerance
+        self.error_rate = error_rate
+        self.window = window
+        self.max_hosts = max_hosts
+        # least recently used first, so the hosts to forget are at the front
+        self._hosts = OrderedDict()
+
+    def _state(self, host):
+        state = self._hosts.get(host)
+        if state is None:
+            return super(AdaptiveLimiter, self)._state(host)
+        self._hosts.move_to_end(host)
+        return state
+
+    def _new_state(self, bucket):
+        if len(self._hosts) >= self.max_hosts:
+            # only hosts with a request in flight are passed over
+            for host, state in self._hosts.items():
+                if not state.in_flight:
+                    del self._hosts[host]
+                    break
+        return _AdaptiveState(bucket, self.initial, self.window)
+
+    def _cap(self, state):
+        return max(int(state.limit), self.min_limit)
+
+    def _prunable(self, state, now):
+        # the learned cap is the point, keep it
+        return False
+
+    def _cut(self, host, state, now, elapsed, reason):
+        # requests sent before the last cut saw the old cap, they do not count twice
+        if elapsed is not None and now - elapsed < state.cut_at:
+            return
+        limit = max(state.limit * self.decrease, self.min_limit)
+        log.debug("Concurrency for %s cut %.1f -> %.1f (%s)", host, state.limit, limit, reason)
+        state.limit = limit
+        state.cut_at = now
+        state.decreases += 1
+        state.decision = "decrease: %s" % reason
+
+    def observe(self, host, status, headers=None, elapsed=None):
+        super(AdaptiveLimiter, self).observe(host, status, headers, elapsed)
+        with self._cond:
+            state = self._state(host)
+            now = time.monotonic()
+            failed = status >= 500
+            state.requests += 1
+            state.errors += failed
+            state.samples.append((elapsed, failed))
+            if status in self.throttle_statuses:
+                self._cut(host, state, now, elapsed, "status %d" % status)
+                return
+            if len(state.samples) < min(10, self.window):
+                return
+            if failed:
+                errors = sum(1 for _, bad in state.samples if bad)
+                if errors > self.error_rate * len(state.samples):
+                    self._cut(host, state, now, elapsed, "%d of %d answers 5xx" % (errors, len(state.samples)))
+                return
+            if elapsed is None:
+                return
+            latencies = sorted(latency for latency, _ in state.samples if latency is not None)
+            if not latencies:
+                return
+            median = _percentile(latencies, 0.5)
+            if state.baseline is None or median < state.baseline:
+                state.baseline = median
+            if median > self.tolerance * state.baseline:
+                state.decision = "hold: latency"
+                return
+            if state.limit < self.max_limit and state.in_flight + 1 >= self._cap(state):
+                state.limit = min(state.limit + self.increase / state.limit, self.max_limit)
+                state.increases += 1
+                state.decision = "increase"
+            self._cond.notify_all()
+
+    def observe_error(self, host, exception, elapsed=None):
+        if not isinstance(exception, (OSError, HTTPException)):
+            return
+        with self._cond:
+            state = self._state(host)
+            state.requests += 1
+            state.errors += 1
+            state.samples.append((None, True))
+            self._cut(host, state, time.monotonic(), elapsed, type(exception).__name__)
+
+    def metrics(self):
+        """
+        Per-host view of the controller: ``{host: {"limit", "in_flight",
+        "requests", "errors", "error_rate", "p50", "p90", "p99", "increases",
+        "decreases", "decision"}}``. Latencies are in seconds, ``None``
+        until measured; ``decision`` is the last change or hold and its reason.
+        """
+        with self._cond:
+            metrics = {}
+            for host, state in self._hosts.items():
+                latencies = sorted(latency for latency, _ in state.samples if latency is not None)
+                errors = sum(1 for _, bad in state.samples if bad)
+                metrics[host] = {
+                    "limit": state.limit,
+                    "in_flight": state.in_flight,
+                    "requests": state.requests,
+                    "errors": state.errors,
+                    "error_rate": errors / len(state.samples) if state.samples else 0.0,
+                    "p50": _percentile(latencies, 0.5) if latencies else None,
+                    "p90": _percentile(latencies, 0.9) if latencies else None,
+                    "p99": _percentile(latencies, 0.99) if latencies else None,
+                    "increases": state.increases,
+                    "decreases": state.decreases,
+                    "decision": state.decision,
+                }
+            return metrics
@@ -1,16 +1,53 @@
 import datetime
-from collections import OrderedDict
+from collections import OrderedDict, namedtuple
+from http.client import IncompleteRead
 
 import chardet
 from requests.exceptions import ChunkedEncodingError, ContentDecodingError, SSLError, StreamConsumedError
 from requests.utils import iter_slices, stream_decode_response_unicode
 from urllib3.exceptions import DecodeError, ReadTimeoutError, ProtocolError
 
+from httpsec.headers import HTTPHeaders
 from httpsec.httpclient import HTTPResponse
 
 CONTENT_CHUNK_SIZE = 10 * 1024
 
 
+class Request(object):
+    r"""A request spec for the batch API (:meth:`Session.imap <httpsec.sessions.Session.imap>`).
+
+    :param url: :class:`SafeURL <httpsec.url.SafeURL>` or URL string.
+    :param method: HTTP method, ``GET`` by default.
+    :param headers: (optional) Dictionary of HTTP Headers to send.
+    :param data: (optional) Body to send.
+    :param \*\*kwargs: Other arguments that :meth:`Session.request` takes.
+    """
+    __slots__ = ("method", "url", "headers", "data", "kwargs")
+
+    def __init__(self, url, method="GET", headers=None, data=None, **kwargs):
+        self.url = url
+        self.method = method
+        self.headers = headers
+        self.data = data
+        self.kwargs = kwargs
+
+    @classmethod
+    def from_spec(cls, spec) -> "Request":
+        """Accepts a :class:`Request`, a mapping of its arguments or a bare URL."""
+        if isinstance(spec, cls):
+            return spec
+        if isinstance(spec, dict):
+            return cls(**spec)
+        return cls(spec)
+
+    def __repr__(self):
+        return "<Request [%s %s]>" % (self.method, self.url)
+
+
+#: Outcome of one batched request: ``response`` or ``exception`` is set.
+Result = namedtuple("Result", ("request", "response", "exception"))
+
+
 class Response(object):
     __attrs__ = [
         "_content",
@@ -31,10 +68,12 @@ class Response(object):
         #: Integer Code of responded HTTP Status, e.g. 404 or 200.
         self.status_code = None
 
-        #: Case-insensitive Dictionary of Response Headers.
+        #: Case-insensitive :class:`HTTPHeaders <httpsec.headers.HTTPHeaders>`
+        #: of the response, repeated fields included.
         #: For example, ``headers['content-encoding']`` will return the
-        #: value of a ``'Content-Encoding'`` response header.
-        self.headers = OrderedDict()
+        #: value of a ``'Content-Encoding'`` response header and
+        #: ``headers.getall('set-cookie')`` every cookie sent.
+        self.headers = HTTPHeaders()
 
         #: File-like object representation of response (for advanced usage).
         #: Use of ``raw`` requires that ``stream=True`` be set on the request.
@@ -70,13 +109,30 @@ class Response(object):
         #: is a response.
         self.request = None
 
+    def __getstate__(self):
+        # Consume everything; accessing the content attribute makes
+        # sure the content has been fully read.
+        if not self._content_consumed:
+            self.content
+        return {attr: getattr(self, attr, None) for attr in self.__attrs__}
+
+    def __setstate__(self, state):
+        self.__init__()
+        for name, value in state.items():
+            setattr(self, name, value)
+
+        # pickled objects do not have .raw
+        self._content_consumed = True
+        self.raw = None
+
     @classmethod
     def from_http_response(cls, url, http_response: HTTPResponse) -> "Response":
         response = cls()
         response.url = url
         response.status_code = http_response.status
 
-        response.headers = OrderedDict(http_response.headers)
+        # the parser's own object, no copy
+        response.headers = http_response.headers
         response.cookies = {}
         response.raw = http_response
         response.reason = response.raw.reason
@@ -151,6 +207,17 @@ class Response(object):
 
             if self.status_code == 0 or self.raw is None:
                 self._content = None
+            elif not hasattr(self.raw, "stream"):
+                # one read: sized from Content-Length when there is one,
+                # rather than joining CONTENT_CHUNK_SIZE pieces
+                try:
+                    self._content = self.raw.read() or b""
+                except IncompleteRead as e:
+                    if getattr(self.raw, "chunked", False):
+                        raise
+                    # the connection closed short of Content-Length: keep
+                    # what came, as reading it in pieces always has
+                    self._content = e.partial
             else:
                 self._content = b"".join(self.iter_content(CONTENT_CHUNK_SIZE)) or b""
 
@@ -0,0 +1,431 @@
+"""
+httpsec.parser
+~~~~~~~~~~~~~~
+
+Incremental HTTP/1.x response parser that does no I/O.
+
+Feed it whatever the transport received and it returns events::
+
+    >>> p = ResponseParser("GET")
+    >>> p.feed(b"HTTP/1.1 200 OK\\r\\nContent-Length: 2\\r\\n\\r\\nok")
+    [Status(version=11, status=200, reason='OK'), Headers(headers=<...>), Data(data=b'ok'), EndOfMessage()]
+
+The asyncio and selector transports and ``HTTPConnection.pipeline`` run
+on it. The blocking ``HTTPResponse`` only shares the status line, framing
+and chunk-size helpers: it reads straight from the connection's buffered
+reader, which must stop at the last byte of the response so the next one
+finds the rest, and it serves ``readinto``/``peek``/``readline`` from that
+buffer without going through events.
+"""
+from collections import namedtuple
+from http import HTTPStatus
+from http.client import BadStatusLine, HTTPException, IncompleteRead, LineTooLong, RemoteDisconnected, \
+    UnknownProtocol
+
+from httpsec.headers import HTTPHeaders
+
+# maximal line length when calling readline().
+_MAX_LINE = 65536
+_MAX_HEADERS = 100
+
+Status = namedtuple("Status", ("version", "status", "reason"))
+Headers = namedtuple("Headers", ("headers",))
+Data = namedtuple("Data", ("data",))
+EndOfMessage = namedtuple("EndOfMessage", ())
+
+# parser states
+_PS_STATUS = "Status"
+_PS_CONTINUE = "Continue"
+_PS_HEADERS = "Headers"
+_PS_BODY = "Body"
+_PS_UNTIL_CLOSE = "Until-close"
+_PS_CHUNK_SIZE = "Chunk-size"
+_PS_CHUNK_DATA = "Chunk-data"
+_PS_CHUNK_END = "Chunk-end"
+_PS_TRAILERS = "Trailers"
+_PS_DONE = "Done"
+_PS_ERROR = "Error"
+
+
+def parse_status_line(line):
+    """Split a decoded status line into ``(version, status, reason)``."""
+    if not line:
+        # Presumably, the server closed the connection before
+        # sending a valid response.
+        raise RemoteDisconnected("Remote end closed connection without"
+                                 " response")
+    status = ""
+    reason = ""
+    try:
+        version, status, reason = line.split(None, 2)
+    except ValueError:
+        try:
+            version, status = line.split(None, 1)
+            reason = ""
+        except ValueError:
+            # empty version will cause next test to fail.
+            version = ""
+    if not version.startswith("HTTP/"):
+        raise BadStatusLine(line)
+
+    # The status code is a three-digit number
+    try:
+        status = int(status)
+        if status < 100 or status > 999:
+            raise BadStatusLine(line)
+    except ValueError:
+        raise BadStatusLine(line)
+    return version, status, reason
+
+
+def parse_version(version):
+    if version in ("HTTP/1.0", "HTTP/0.9"):
+        # Some servers might still return "0.9", treat it as 1.0 anyway
+        return 10
+    elif version.startswith("HTTP/1."):
+        return 11  # use HTTP/1.1 code for HTTP/1.x where x>=1
+    raise UnknownProtocol(version)
+
+
+def parse_chunk_size(line):
+    """Size in a chunk-size line, extensions ignored; :class:`ValueError`
+    if it is not a hexadecimal number."""
+    i = line.find(b";")
+    if i >= 0:
+        line = line[:i]  # strip chunk-extensions
+    size = int(line, 16)
+    if size < 0:
+        raise ValueError("negative chunk size %r" % line)
+    return size
+
+
+def parse_header_lines(lines, strict=False):
+    """Build the :class:`~httpsec.headers.HTTPHeaders` of raw header lines
+    (terminator included)."""
+    return HTTPHeaders.parse(b"".join(lines), strict)
+
+
+def connection_will_close(version, headers):
+    conn = headers.get("connection")
+    if version == 11:
+        # An HTTP/1.1 proxy is assumed to stay open unless
+        # explicitly closed.
+        if conn and "close" in conn.lower():
+            return True
+        return False
+
+    # Some HTTP/1.0 implementations have support for persistent
+    # connections, using rules different than HTTP/1.1.
+
+    # For older HTTP, Keep-Alive indicates persistent connection.
+    if headers.get("keep-alive"):
+        return False
+
+    # At least Akamai returns a "Connection: Keep-Alive" header,
+    # which was supposed to be sent by the client.
+    if conn and "keep-alive" in conn.lower():
+        return False
+
+    # Proxy-Connection is a netscape hack.
+    pconn = headers.get("proxy-connection")
+    if pconn and "keep-alive" in pconn.lower():
+        return False
+
+    # otherwise, assume it will close
+    return True
+
+
+def body_framing(version, status, method, headers):
+    """How the body of a response is delimited.
+
+    Returns ``(chunked, length, will_close)``; ``length`` is ``None`` when
+    the body is chunked or runs until the connection closes.
+    """
+    # are we using the chunked-style of transfer encoding?
+    tr_enc = headers.get("transfer-encoding")
+    chunked = bool(tr_enc and tr_enc.lower() == "chunked")
+
+    # will the connection close at the end of the response?
+    will_close = connection_will_close(version, headers)
+
+    # do we have a Content-Length?
+    # NOTE: RFC 2616, S4.4, #3 says we ignore this if tr_enc is "chunked"
+    length = None
+    content_length = headers.get("content-length")
+    if content_length and not chunked:
+        try:
+            length = int(content_length)
+        except ValueError:
+            length = None
+        else:
+            if length < 0:  # ignore nonsensical negative lengths
+                length = None
+
+    # does the body have a fixed length? (of zero)
+    if (status == HTTPStatus.NO_CONTENT or status == HTTPStatus.NOT_MODIFIED or
+            100 <= status < 200 or  # 1xx codes
+            method == "HEAD"):
+        length = 0
+
+    # if the connection remains open, and we aren't using chunked, and
+    # a content-length was not provided, then assume that the connection
+    # WILL close.
+    if not will_close and not chunked and length is None:
+        will_close = True
+    return chunked, length, will_close
+
+
+class ResponseParser(object):
+    """
+    HTTP/1.x response state machine.
+
+    :meth:`feed` takes any slice of the byte stream and returns the events
+    it completed: one :class:`Status`, one :class:`Headers`, any number of
+    :class:`Data` and a final :class:`EndOfMessage`. Interim ``100 Continue``
+    responses are skipped. Errors are the :mod:`http.client` exceptions the
+    blocking response raises.
+
+    Bytes that arrive after the end of the message stay buffered (see
+    :attr:`trailing_data`); :meth:`next_response` starts parsing them as the
+    next response on the same connection.
+
+    :param method: Request method, a ``HEAD`` response has no body.
+    :param strict_headers: Reject malformed header lines instead of skipping
+        them, see :meth:`HTTPHeaders.parse <httpsec.headers.HTTPHeaders.parse>`.
+    """
+
+    def __init__(self, method="GET", max_line=_MAX_LINE, max_headers=_MAX_HEADERS, strict_headers=False):
+        self.max_line = max_line
+        self.max_headers = max_headers
+        self.strict_headers = strict_headers
+        self._buf = bytearray()
+        self._pos = 0
+        self._eof = False
+        self.next_response(method)
+
+    def next_response(self, method="GET"):
+        """Reset for the next response on the connection."""
+        self.method = method
+        self.version = self.status = self.reason = None
+        self.headers = None
+        self.chunked = False
+        self.length = None
+        self.will_close = True
+        self._left = None
+        self._state = _PS_STATUS
+
+    @property
+    def done(self):
+        return self._state == _PS_DONE
+
+    @property
+    def trailing_data(self):
+        """Bytes received but not consumed by the current message."""
+        return bytes(self._buf[self._pos:])
+
+    def feed(self, data):
+        """Add received bytes and return the list of new events."""
+        if self._state == _PS_ERROR:
+            raise HTTPException("parser is in an error state")
+        if data:
+            self._buf += data
+        events = []
+        try:
+            while self._state != _PS_DONE and self._step(events):
+                pass
+        except BaseException:
+            self._state = _PS_ERROR
+            raise
+        finally:
+            if self._pos:
+                del self._buf[:self._pos]
+                self._pos = 0
+        return events
+
+    def feed_eof(self):
+        """The peer closed the connection; return the last events or raise
+        if the message was cut short."""
+        self._eof = True
+        events = self.feed(b"")
+        if self._state == _PS_UNTIL_CLOSE:
+            self._state = _PS_DONE
+            events.append(EndOfMessage())
+        elif self._state != _PS_DONE:
+            left = self._left if self._state in (_PS_BODY, _PS_CHUNK_DATA) else None
+            self._state = _PS_ERROR
+            raise IncompleteRead(b"", left)
+        return events
+
+    def _line(self, what):
+        buf = self._buf
+        end = buf.find(b"\n", self._pos)
+        if end < 0:
+            if len(buf) - self._pos > self.max_line:
+                raise LineTooLong(what)
+            if not self._eof:
+                return None
+            # like readline() at EOF, hand out what is left
+            end = len(buf)
+        else:
+            end += 1
+        if end - self._pos > self.max_line:
+            raise LineTooLong(what)
+        line = bytes(buf[self._pos:end])
+        self._pos = end
+        return line
+
+    def _body(self, events):
+        avail = len(self._buf) - self._pos
+        if not avail:
+            return False
+        n = avail if self._left is None else min(avail, self._left)
+        events.append(Data(bytes(self._buf[self._pos:self._pos + n])))
+        self._pos += n
+        if self._left is not None:
+            self._left -= n
+        return True
+
+    def _step(self, events):
+        state = self._state
+        if state in (_PS_CHUNK_SIZE, _PS_CHUNK_DATA, _PS_CHUNK_END):
+            return self._chunked(events)
+
+        if state == _PS_BODY:
+            if not self._body(events):
+                return False
+            if not self._left:
+                self._finish(events)
+            return True
+
+        if state == _PS_UNTIL_CLOSE:
+            self._body(events)
+            return False
+
+        if state == _PS_STATUS:
+            line = self._line("status line")
+            if line is None:
+                return False
+            version, status, reason = parse_status_line(str(line, "iso-8859-1"))
+            if status == HTTPStatus.CONTINUE:
+                # skip the header from the 100 response
+                self._state = _PS_CONTINUE
+                return True
+            self.version = parse_version(version)
+            self.status = status
+            self.reason = reason.strip()
+            events.append(Status(self.version, self.status, self.reason))
+            self._state = _PS_HEADERS
+            return True
+
+        if state == _PS_HEADERS:
+            return self._headers(events)
+
+        line = self._line("header line")
+        if line is None:
+            return False
+        blank = line in (b'\r\n', b'\n', b'')
+
+        if state == _PS_CONTINUE:
+            if not line.strip():
+                self._state = _PS_STATUS
+        elif state == _PS_TRAILERS:
+            if blank:
+                self._finish(events)
+        return True
+
+    def _chunked(self, events):
+        # all complete chunks in the buffer become a single Data event
+        buf = self._buf
+        pieces = []
+        state = self._state
+        try:
+            while state != _PS_TRAILERS:
+                if state == _PS_CHUNK_DATA:
+                    n = min(len(buf) - self._pos, self._left)
+                    if not n:
+                        return False
+                    pieces.append(buf[self._pos:self._pos + n])
+                    self._pos += n
+                    self._left -= n
+                    if self._left:
+                        return False
+                    state = _PS_CHUNK_END
+                    continue
+                if state == _PS_CHUNK_END and buf.startswith(b"\r\n", self._pos):
+                    self._pos += 2
+                    state = _PS_CHUNK_SIZE
+                    continue
+                end = buf.find(b"\n", self._pos)
+                if 0 <= end < self._pos + self.max_line:
+                    line = buf[self._pos:end]
+                    self._pos = end + 1
+                else:
+                    # incomplete or too long, let _line sort it out
+                    line = self._line("chunk size")
+                    if line is None:
+                        return False
+                if state == _PS_CHUNK_END:
+                    state = _PS_CHUNK_SIZE
+                    continue
+                try:
+                    size = parse_chunk_size(line)
+                except ValueError:
+                    raise IncompleteRead(b"")
+                if size:
+                    self._left = size
+                    state = _PS_CHUNK_DATA
+                else:
+                    state = _PS_TRAILERS
+            return True
+        finally:
+            self._state = state
+            if pieces:
+                events.append(Data(b"".join(pieces)))
+
+    def _headers(self, events):
+        # take the whole header block at once rather than line by line
+        buf, pos = self._buf, self._pos
+        if buf.startswith(b"\n", pos) or buf.startswith(b"\r\n", pos):
+            end = buf.find(b"\n", pos) + 1
+        else:
+            end = buf.find(b"\n\r\n", pos)
+            lf = buf.find(b"\n\n", pos, None if end < 0 else end)
+            if lf >= 0:
+                end = lf + 2
+            elif end >= 0:
+                end = end + 3
+            elif self._eof:
+                end = len(buf)
+        if end < 0:
+            # incomplete, but enforce the limits on what is there
+            if buf.count(b"\n", pos) > self.max_headers:
+                raise HTTPException("got more than %d headers" % self.max_headers)
+            if len(buf) - (buf.rfind(b"\n", pos) + 1 or pos) > self.max_line:
+                raise LineTooLong("header line")
+            return False
+        block = bytes(buf[pos:end])
+        lines = block.split(b"\n")
+        # the block ends with a newline, or at EOF with a partial line
+        if len(lines) - (block[-1:] == b"\n") > self.max_headers:
+            raise HTTPException("got more than %d headers" % self.max_headers)
+        if len(max(lines, key=len)) >= self.max_line:
+            raise LineTooLong("header line")
+        self._pos = end
+        self.headers = HTTPHeaders.parse(block, self.strict_headers)
+        framing = body_framing(self.version, self.status, self.method, self.headers)
+        self.chunked, self.length, self.will_close = framing
+        events.append(Headers(self.headers))
+        if self.chunked:
+            self._state = _PS_CHUNK_SIZE
+        elif self.length is None:
+            self._state = _PS_UNTIL_CLOSE
+        elif self.length == 0:
+            self._finish(events)
+        else:
+            self._left = self.length
+            self._state = _PS_BODY
+        return True
+
+    def _finish(self, events):
+        self._state = _PS_DONE
+        events.append(EndOfMessage())
@@ -0,0 +1,271 @@
+import errno
+import os
+import selectors
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from httpsec.utils import RecentlyUsedContainer
+
+#: Seconds to wait for a connection attempt before starting the next one
+#: (RFC 8305 "Connection Attempt Delay").
+HAPPY_EYEBALLS_DELAY = 0.25
+
+_CONNECT_IN_PROGRESS = {errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EAGAIN}
+
+# getaddrinfo errors meaning "this name does not exist", safe to cache
+_NEGATIVE_ERRNOS = {getattr(socket, name) for name in ("EAI_NONAME", "EAI_NODATA") if hasattr(socket, name)}
+
+
+class Resolver(object):
+    """
+    Caching front end for :func:`socket.getaddrinfo`.
+
+    Answers are cached per host for ``ttl`` seconds, names that do not exist
+    for ``negative_ttl`` seconds. Temporary failures are never cached.
+
+    :param ttl: Seconds a successful lookup is reused.
+    :param negative_ttl: Seconds a NXDOMAIN answer is reused.
+    :param maxsize: Maximum number of cached hosts.
+    :param overrides: curl ``--resolve`` style entries, ``"host:port:addr[,addr]"``.
+        A ``*`` port pins the host on every port.
+    """
+
+    def __init__(self, ttl=60, negative_ttl=30, maxsize=100000, overrides=None):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._cache = RecentlyUsedContainer(maxsize)
+        self._overrides = {}
+        # address family that last won the connection race, per host
+        self._preferred_family = RecentlyUsedContainer(maxsize)
+        for entry in overrides or ():
+            host, port, addresses = entry.split(":", 2)
+            self.add_override(host, addresses.split(","), None if port == "*" else int(port))
+
+    def add_override(self, host, addresses, port=None):
+        """
+        Pin ``host`` (on ``port``, or on every port) to the given IP addresses
+        without asking DNS.
+        """
+        if isinstance(addresses, str):
+            addresses = [addresses]
+        infos = []
+        for address in addresses:
+            address = address.strip("[]")
+            infos.extend(socket.getaddrinfo(address, None, 0, socket.SOCK_STREAM, 0, socket.AI_NUMERICHOST))
+        self._overrides[(host.lower(), port)] = infos
+
+    def _lookup(self, host, family):
+        # names are case-insensitive, one entry serves every spelling
+        key = (host.lower(), family)
+        now = time.monotonic()
+        entry = self._cache.get(key)
+        if entry is not None and entry[0] > now:
+            result = entry[1]
+        else:
+            try:
+                result = socket.getaddrinfo(host, None, family, socket.SOCK_STREAM)
+                self._cache[key] = (now + self.ttl, result)
+            except socket.gaierror as e:
+                if e.errno in _NEGATIVE_ERRNOS and self.negative_ttl:
+                    self._cache[key] = (now + self.negative_ttl, e)
+                raise
+        if isinstance(result, socket.gaierror):
+            raise socket.gaierror(*result.args)
+        return result
+
+    def resolve(self, host, port, family=socket.AF_UNSPEC):
+        """
+        Return ``getaddrinfo``-style tuples for ``host`` with ``port`` filled in.
+        """
+        if self._overrides:
+            lower = host.lower()
+            infos = self._overrides.get((lower, port)) or self._overrides.get((lower, None))
+            if infos is not None:
+                return [_with_port(info, port) for info in infos if family in (socket.AF_UNSPEC, info[0])]
+        return [_with_port(info, port) for info in self._lookup(host, family)]
+
+    def cached(self, host, port, family=socket.AF_UNSPEC):
+        """
+        Like :meth:`resolve`, but only answers from overrides and the cache;
+        returns ``None`` instead of asking DNS.
+        """
+        if self._overrides:
+            lower = host.lower()
+            infos = self._overrides.get((lower, port)) or self._overrides.get((lower, None))
+            if infos is not None:
+                return [_with_port(info, port) for info in infos if family in (socket.AF_UNSPEC, info[0])]
+        entry = self._cache.get((host.lower(), family))
+        if entry is None or entry[0] <= time.monotonic():
+            return None
+        if isinstance(entry[1], socket.gaierror):
+            raise socket.gaierror(*entry[1].args)
+        return [_with_port(info, port) for info in entry[1]]
+
+    def sorted_for_connect(self, host, infos):
+        """
+        Interleave address families (RFC 8305 section 4), starting with the
+        family that last connected to ``host``.
+        """
+        first = self._preferred_family.get(host)
+        by_family = {}
+        for info in infos:
+            by_family.setdefault(info[0], []).append(info)
+        if len(by_family) < 2:
+            return infos
+        families = list(by_family)
+        if first in by_family:
+            families.remove(first)
+            families.insert(0, first)
+        ordered = []
+        queues = [by_family[f] for f in families]
+        while queues:
+            for q in list(queues):
+                ordered.append(q.pop(0))
+                if not q:
+                    queues.remove(q)
+        return ordered
+
+    def remember_family(self, host, family):
+        self._preferred_family[host] = family
+
+    def resolve_many(self, hosts, max_workers=32):
+        """
+        Resolve ``hosts`` in parallel, warming the cache.
+
+        Returns a dict mapping each host to its list of addresses, or to the
+        :class:`socket.gaierror` raised for it.
+        """
+
+        def resolve_one(host):
+            try:
+                return host, sorted({info[4][0] for info in self.resolve(host, 0)})
+            except socket.gaierror as e:
+                return host, e
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return dict(executor.map(resolve_one, set(hosts)))
+
+    def clear(self):
+        self._cache.clear()
+
+
+def _with_port(info, port):
+    af, socktype, proto, canonname, sa = info
+    return af, socktype, proto, canonname, (sa[0], port) + sa[2:]
+
+
+default_resolver = Resolver()
+
+
+def create_connection(address, timeout=getattr(socket, "_GLOBAL_DEFAULT_TIMEOUT"), source_address=None,
+                      resolver=None, happy_eyeballs_delay=HAPPY_EYEBALLS_DELAY):
+    """
+    Same as :func:`socket.create_connection`, but the name is looked up
+    through ``resolver`` and, when it has several addresses, they are raced
+    Happy Eyeballs style: a new attempt starts every ``happy_eyeballs_delay``
+    seconds (or as soon as one fails) and the first to connect wins.
+    ``happy_eyeballs_delay=None`` tries the addresses one after another.
+    """
+    host, port = address
+    resolver = resolver or default_resolver
+    infos = resolver.sorted_for_connect(host, resolver.resolve(host, port))
+    if timeout is getattr(socket, "_GLOBAL_DEFAULT_TIMEOUT"):
+        timeout = socket.getdefaulttimeout()
+
+    if happy_eyeballs_delay is None or len(infos) < 2:
+        sock = _connect_sequential(infos, timeout, source_address)
+    else:
+        sock = _connect_race(infos, timeout, source_address, happy_eyeballs_delay)
+    resolver.remember_family(host, sock.family)
+    return sock
+
+
+def _connect_sequential(infos, timeout, source_address):
+    err = None
+    for af, socktype, proto, canonname, sa in infos:
+        sock = None
+        try:
+            sock = socket.socket(af, socktype, proto)
+            sock.settimeout(timeout)
+            if source_address:
+                sock.bind(source_address)
+            sock.connect(sa)
+            # Break explicitly a reference cycle
+            err = None
+            return sock
+        except OSError as e:
+            err = e
+            if sock is not None:
+                sock.close()
+
+    if err is not None:
+        try:
+            raise err
+        finally:
+            # Break explicitly a reference cycle
+            err = None
+    raise OSError("getaddrinfo returns an empty list")
+
+
+def _connect_race(infos, timeout, source_address, delay):
+    deadline = None if timeout is None else time.monotonic() + timeout
+    infos = list(infos)
+    pending = {}
+    errors = []
+    selector = selectors.DefaultSelector()
+    next_attempt = time.monotonic()
+    try:
+        while infos or pending:
+            now = time.monotonic()
+            if infos and now >= next_attempt:
+                af, socktype, proto, canonname, sa = infos.pop(0)
+                sock = None
+                try:
+                    sock = socket.socket(af, socktype, proto)
+                    sock.setblocking(False)
+                    if source_address:
+                        sock.bind(source_address)
+                    err = sock.connect_ex(sa)
+                    if err == 0:
+                        sock.settimeout(timeout)
+                        return sock
+                    if err not in _CONNECT_IN_PROGRESS:
+                        raise OSError(err, os.strerror(err))
+                except OSError as e:
+                    errors.append(e)
+                    if sock is not None:
+                        sock.close()
+                    continue
+                pending[sock] = sa
+                selector.register(sock, selectors.EVENT_WRITE)
+                next_attempt = now + delay
+
+            wait = next_attempt - now if infos else None
+            if deadline is not None:
+                if now >= deadline:
+                    raise socket.timeout("timed out")
+                wait = deadline - now if wait is None else min(wait, deadline - now)
+            if not pending:
+                continue
+
+            for key, _ in selector.select(wait):
+                sock = key.fileobj
+                selector.unregister(sock)
+                del pending[sock]
+                err = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+                if err == 0:
+                    sock.settimeout(timeout)
+                    return sock
+                errors.append(OSError(err, os.strerror(err)))
+                sock.close()
+                # a failed attempt lets the next one start right away
+                next_attempt = now
+    finally:
+        for sock in pending:
+            sock.close()
+        selector.close()
+
+    if errors:
+        raise errors[-1]
+    raise OSError("getaddrinfo returns an empty list")
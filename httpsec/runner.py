@@ -0,0 +1,285 @@
+"""
+httpsec.runner
+~~~~~~~~~~~~~~
+
+Spreads a batch of requests over worker processes, so response parsing and
+decoding are not serialized by one interpreter's GIL.
+"""
+import multiprocessing
+import os
+import pickle
+import queue
+import signal
+import threading
+import traceback
+import zlib
+
+from httpsec.model import Request, Result
+from httpsec.url import split_origin
+from httpsec.utils import REORDER_WINDOW, ReorderBuffer
+
+
+class _Numbered(Request):
+    """A request with its position in the input, which comes back with its
+    result: the same Request sent twice in a batch unpickles as one object."""
+    __slots__ = ("index",)
+
+
+class ProcessRunner(object):
+    """
+    Shards requests across worker processes by host and merges their results
+    into one iterator.
+
+    Each worker runs its own :class:`~httpsec.sessions.Session` (or
+    :class:`~httpsec.engine.Engine`) with its own pools; all requests to a
+    host go to the same worker so its keep-alive connections get reused.
+    Requests and results cross the process boundary in pickled batches.
+
+    Basic Usage::
+
+      >>> runner = ProcessRunner(processes=8, max_workers=64, timeout=(5, 10))
+      >>> for result in runner.imap(urls):
+      ...     print(result.request.url, result.response and result.response.status_code)
+
+    :param processes: Number of worker processes, one per CPU by default.
+    :param max_workers: Requests in flight per worker: threads for
+        ``Session.imap``, connections for the engine.
+    :param use_engine: Run :class:`~httpsec.engine.Engine` in the workers
+        instead of ``Session.imap``.
+    :param batch_size: Requests or results sent per pipe message.
+    :param flush_interval: Seconds a worker holds results back to fill a batch.
+    :param mp_context: (optional) :mod:`multiprocessing` context, the
+        platform default if not given.
+    :param \\*\\*kwargs: Default arguments for :meth:`Session.request
+        <httpsec.sessions.Session.request>`, or for the :class:`Engine
+        <httpsec.engine.Engine>` constructor with ``use_engine``.
+    """
+
+    def __init__(self, processes=None, max_workers=32, use_engine=False, batch_size=64, flush_interval=0.05,
+                 mp_context=None, **kwargs):
+        self.processes = processes or os.cpu_count() or 1
+        self.max_workers = max_workers
+        self.use_engine = use_engine
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.mp_context = mp_context or multiprocessing.get_context()
+        self.kwargs = kwargs
+
+    def shard_of(self, request):
+        """Index of the worker that sends ``request``."""
+        try:
+            host = split_origin(request.url)[1] or ""
+        except (TypeError, ValueError):
+            return 0
+        return zlib.crc32(host.lower().encode("utf-8", "replace")) % self.processes
+
+    def imap(self, requests, ordered=False):
+        """Sends ``requests`` from the worker processes and yields a
+        :class:`~httpsec.model.Result` for each as it completes.
+
+        ``requests`` is consumed lazily by a feeder thread; at most a few
+        batches per worker are queued at a time. With ``ordered``, the feeder
+        also waits while ``REORDER_WINDOW * processes * max_workers`` results
+        wait on an earlier one.
+
+        :param requests: Iterable of :class:`~httpsec.model.Request` objects,
+            dicts of their arguments, or bare URLs (sent as ``GET``).
+        :param ordered: Yield results in input order rather than as they
+            complete.
+        """
+        ctx = self.mp_context
+        results = ctx.Queue()
+        inboxes = [ctx.Queue(maxsize=4) for _ in range(self.processes)]
+        workers = []
+        for inbox in inboxes:
+            worker = ctx.Process(target=_work, args=(inbox, results, self.max_workers, self.use_engine,
+                                                     self.batch_size, self.flush_interval, self.kwargs),
+                                 name="httpsec-runner", daemon=True)
+            worker.start()
+            workers.append(worker)
+
+        stop = threading.Event()
+        # index -> the caller's Request, results come back with a copy
+        sent = {}
+        # what reading ``requests`` raised in the feeder thread
+        failed = []
+        # cleared while the ordered results held back fill the window
+        room = threading.Event()
+        room.set()
+        feeder = threading.Thread(target=self._feed, args=(iter(requests), inboxes, sent, stop, failed, room),
+                                  name="httpsec-runner-feeder", daemon=True)
+        feeder.start()
+
+        order = ReorderBuffer(max_held=REORDER_WINDOW * self.processes * self.max_workers)
+        running = len(workers)
+        try:
+            while running:
+                if failed:
+                    raise failed[0]
+                try:
+                    kind, payload = results.get(timeout=1)
+                except queue.Empty:
+                    for worker in workers:
+                        if worker.exitcode not in (None, 0):
+                            raise RuntimeError("runner worker %s died with exit code %s"
+                                               % (worker.pid, worker.exitcode))
+                    continue
+                if kind == "done":
+                    running -= 1
+                    continue
+                if kind == "error":
+                    raise RuntimeError("runner worker failed:\n%s" % payload)
+                for index, result in payload:
+                    result = Result(sent.pop(index), result.response, result.exception)
+                    if not ordered:
+                        yield result
+                        continue
+                    ready = order.add(index, result)
+                    if order.full:
+                        room.clear()
+                    else:
+                        room.set()
+                    yield from ready
+        finally:
+            stop.set()
+            for worker in workers:
+                # finished workers exit by themselves once their queue is flushed
+                worker.join(timeout=0 if running else 5)
+                if worker.is_alive():
+                    worker.terminate()
+            for worker in workers:
+                worker.join()
+            results.close()
+            for inbox in inboxes:
+                inbox.close()
+
+    def map(self, requests):
+        """Like :meth:`imap`, but returns the list of results in input order.
+
+        :rtype: list
+        """
+        return list(self.imap(requests, ordered=True))
+
+    def _feed(self, requests, inboxes, sent, stop, failed, room):
+        batches = [[] for _ in inboxes]
+        try:
+            for index, spec in enumerate(requests):
+                request = Request.from_spec(spec)
+                sent[index] = request
+                shard = self.shard_of(request)
+                batch = batches[shard]
+                batch.append((index, request))
+                if len(batch) >= self.batch_size:
+                    if not _put(inboxes[shard], batch, stop):
+                        return
+                    batches[shard] = []
+                if not room.is_set():
+                    # the request the results wait on may be in a part-filled
+                    # batch, or in flight on a worker blocked reading its
+                    # inbox: send what is queued, then an empty batch so every
+                    # worker finishes its requests before reading on
+                    for shard, batch in enumerate(batches):
+                        if batch and not _put(inboxes[shard], batch, stop):
+                            return
+                        if not _put(inboxes[shard], [], stop):
+                            return
+                        batches[shard] = []
+                    while not room.wait(0.1):
+                        if stop.is_set():
+                            return
+        except BaseException as e:
+            # raised again by imap() in the consuming thread
+            failed.append(e)
+            return
+        for inbox, batch in zip(inboxes, batches):
+            if batch and not _put(inbox, batch, stop):
+                return
+            if not _put(inbox, None, stop):
+                return
+
+
+def _put(inbox, item, stop):
+    while not stop.is_set():
+        try:
+            inbox.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def _portable(result):
+    """``result`` with an exception that survives pickling."""
+    if result.exception is None:
+        return result
+    try:
+        pickle.loads(pickle.dumps(result.exception))
+    except Exception:
+        exception = RuntimeError("%s: %s" % (type(result.exception).__name__, result.exception))
+        return Result(result.request, result.response, exception)
+    return result
+
+
+def _work(inbox, results, max_workers, use_engine, batch_size, flush_interval, kwargs):
+    # the parent handles Ctrl-C and tears the workers down
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    try:
+        # set by the None that ends the input; an empty batch only ends a round
+        ended = []
+
+        def source():
+            while True:
+                batch = inbox.get()
+                if batch is None:
+                    ended.append(True)
+                    return
+                if not batch:
+                    return
+                for index, request in batch:
+                    numbered = _Numbered(request.url, request.method, request.headers, request.data,
+                                         **request.kwargs)
+                    numbered.index = index
+                    yield numbered
+
+        out = []
+        lock = threading.Lock()
+        finished = threading.Event()
+
+        def flush():
+            with lock:
+                if out:
+                    results.put(("results", out[:]))
+                    del out[:]
+
+        def flush_forever():
+            while not finished.wait(flush_interval):
+                flush()
+
+        flusher = threading.Thread(target=flush_forever, daemon=True)
+        flusher.start()
+
+        if use_engine:
+            from httpsec.engine import Engine
+            client = Engine(max_connections=max_workers, **kwargs)
+
+            def send_round():
+                return client.imap(source())
+        else:
+            from httpsec.sessions import Session
+            client = Session()
+
+            def send_round():
+                return client.imap(source(), max_workers=max_workers, **kwargs)
+        with client:
+            while not ended:
+                for result in send_round():
+                    with lock:
+                        out.append((result.request.index, _portable(result)))
+                        full = len(out) >= batch_size
+                    if full:
+                        flush()
+        finished.set()
+        flush()
+        results.put(("done", None))
+    except BaseException:
+        results.put(("error", traceback.format_exc()))
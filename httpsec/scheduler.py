@@ -0,0 +1,144 @@
+"""
+httpsec.scheduler
+~~~~~~~~~~~~~~~~~
+
+Per-host queues between a batch of requests and the workers sending them,
+so a few slow hosts cannot take every worker.
+"""
+from collections import deque
+
+
+class _HostQueue(object):
+    __slots__ = ("key", "items", "in_flight", "weight", "turn", "latency", "slow")
+
+    def __init__(self, key, weight):
+        self.key = key
+        self.items = deque()
+        self.in_flight = 0
+        self.weight = weight
+        self.turn = 0
+        self.latency = None
+        self.slow = False
+
+
+class HostScheduler(object):
+    """
+    Queues requests per host and hands them out round-robin.
+
+    A host gets up to its weight in consecutive turns, then goes to the back
+    of the rotation. Hosts holding ``max_per_host`` workers are skipped
+    until one of their requests finishes. A request slower than
+    ``slow_threshold`` sends its host to the back of the rotation and limits
+    it to ``slow_max_per_host`` workers until one of its requests is fast
+    again.
+
+    Not thread-safe: :meth:`Session.imap <httpsec.sessions.Session.imap>`
+    calls it from the consuming thread only.
+
+    Usage::
+
+      >>> scheduler = HostScheduler(max_per_host=4, slow_threshold=5)
+      >>> for result in s.imap(urls, max_workers=64, scheduler=scheduler):
+      ...     pass
+
+    :param max_per_host: Requests in flight per host, unlimited if ``None``.
+    :param weights: (optional) ``{host: weight}``, consecutive turns a host
+        gets; hosts not listed get ``1``.
+    :param slow_threshold: Seconds after which a request marks its host slow,
+        never if ``None``.
+    :param slow_max_per_host: Requests in flight for a slow host.
+    :param max_pending: Requests read ahead of the workers to find hosts
+        that are not busy.
+    """
+
+    def __init__(self, max_per_host=None, weights=None, slow_threshold=None, slow_max_per_host=1,
+                 max_pending=4096):
+        self.max_per_host = max_per_host
+        self.weights = weights or {}
+        self.slow_threshold = slow_threshold
+        self.slow_max_per_host = slow_max_per_host
+        self.max_pending = max_pending
+        self._hosts = {}
+        # hosts with queued requests, next turn first
+        self._rotation = deque()
+        self._pending = 0
+
+    def __len__(self):
+        return self._pending
+
+    @property
+    def full(self):
+        """Whether :attr:`max_pending` requests are queued."""
+        return self._pending >= self.max_pending
+
+    def _cap(self, host):
+        if host.slow:
+            if self.max_per_host is None:
+                return self.slow_max_per_host
+            return min(self.slow_max_per_host, self.max_per_host)
+        return self.max_per_host
+
+    def push(self, key, item):
+        """Queue ``item`` for the host ``key`` (a :class:`~httpsec.adapters.PoolKey`
+        or anything hashable with a ``host`` attribute)."""
+        host = self._hosts.get(key)
+        if host is None:
+            host = self._hosts[key] = _HostQueue(key, self.weights.get(getattr(key, "host", key), 1))
+        if not host.items:
+            self._rotation.append(host)
+        host.items.append(item)
+        self._pending += 1
+
+    def pop(self):
+        """
+        Next ``(key, item)`` to send, ``None`` if every host with queued
+        requests is at its cap.
+        """
+        rotation = self._rotation
+        for _ in range(len(rotation)):
+            host = rotation[0]
+            cap = self._cap(host)
+            if cap is not None and host.in_flight >= cap:
+                host.turn = 0
+                rotation.rotate(-1)
+                continue
+            item = host.items.popleft()
+            self._pending -= 1
+            host.in_flight += 1
+            host.turn += 1
+            if not host.items:
+                host.turn = 0
+                rotation.popleft()
+            elif host.turn >= host.weight:
+                host.turn = 0
+                rotation.rotate(-1)
+            return host.key, item
+        return None
+
+    def done(self, key, elapsed=None):
+        """A request to ``key`` finished after ``elapsed`` seconds."""
+        host = self._hosts.get(key)
+        if host is None:
+            return
+        host.in_flight -= 1
+        if elapsed is not None:
+            host.latency = elapsed if host.latency is None else host.latency * 0.8 + elapsed * 0.2
+            threshold = self.slow_threshold
+            if threshold is not None:
+                if elapsed > threshold:
+                    if host.items and host is not self._rotation[-1]:
+                        self._rotation.remove(host)
+                        self._rotation.append(host)
+                        host.turn = 0
+                    host.slow = True
+                else:
+                    host.slow = False
+        if not host.in_flight and not host.items:
+            del self._hosts[key]
+
+    def stats(self):
+        """``{key: {"queued", "in_flight", "latency", "slow"}}`` per known
+        host, latency being a moving average in seconds."""
+        return {key: {"queued": len(host.items), "in_flight": host.in_flight, "latency": host.latency,
+                      "slow": host.slow}
+                for key, host in self._hosts.items()}
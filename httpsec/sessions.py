@@ -5,18 +5,27 @@ requests.sessions
 This module provides a Session object to manage and persist settings across
 requests (cookies, auth, proxies).
 """
+import io
+import itertools
 import os
-from collections import OrderedDict
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from datetime import timedelta
 from urllib.parse import urlparse
 
 from requests.exceptions import InvalidSchema
 
-from httpsec.adapters import HTTPAdapter
-from httpsec.model import Response
+from httpsec.adapters import HTTPAdapter, DEFAULT_NUM_POOLS, DEFAULT_POOLSIZE, DEFAULT_POOLBLOCK, \
+    DEFAULT_IDLE_TIMEOUT, DEFAULT_PRECONNECT_TIMEOUT, DEFAULT_REAP_INTERVAL
+from httpsec.model import Request, Response, Result
+from httpsec.url import URL
+from httpsec.utils import REORDER_WINDOW, ReorderBuffer
 
 DEFAULT_REDIRECT_LIMIT = 3
 
+_Null = object()
+
 
 def merge_setting(request_setting, session_setting, dict_class=OrderedDict):
     """Determines appropriate setting for a given request, taking into account
@@ -329,6 +338,21 @@ class Session(SessionRedirectMixin):
       >>> with requests.Session() as s:
       ...     s.get('https://httpbin.org/get')
       <Response [200]>
+
+    :param num_pools: The number of host pools to keep open.
+    :param pool_maxsize: The maximum number of connections to save per host.
+    :param pool_block: Whether to wait for a free connection instead of
+        opening one beyond ``pool_maxsize``.
+    :param limiter: (optional) :class:`~httpsec.limits.Limiter` capping
+        requests per host and per second, shared by all threads using the
+        session.
+    :param idle_timeout: Seconds an unused connection is kept open, ``None``
+        to keep it until the server closes it.
+    :param max_requests: (optional) Requests sent on one socket before it is
+        reopened.
+    :param reap_interval: Seconds between sweeps closing idle connections
+        past ``idle_timeout``, ``None`` for no background sweep.
+    :param read_buffer_size: Bytes of receive buffer each connection keeps.
     """
     responseCls = Response
     __attrs__ = [
@@ -346,7 +370,9 @@ class Session(SessionRedirectMixin):
         "max_redirects",
     ]
 
-    def __init__(self):
+    def __init__(self, num_pools=DEFAULT_NUM_POOLS, pool_maxsize=DEFAULT_POOLSIZE, pool_block=DEFAULT_POOLBLOCK,
+                 limiter=None, idle_timeout=DEFAULT_IDLE_TIMEOUT, max_requests=None,
+                 reap_interval=DEFAULT_REAP_INTERVAL, read_buffer_size=io.DEFAULT_BUFFER_SIZE):
         self.headers = OrderedDict()
 
         #: Default Authentication tuple or object to attach to
@@ -400,7 +426,9 @@ class Session(SessionRedirectMixin):
         self.cookies = OrderedDict()
 
         # Default connection adapters.
-        self.adapter = HTTPAdapter()
+        self.adapter = HTTPAdapter(num_pools=num_pools, pool_maxsize=pool_maxsize, pool_block=pool_block,
+                                   limiter=limiter, idle_timeout=idle_timeout, max_requests=max_requests,
+                                   reap_interval=reap_interval, read_buffer_size=read_buffer_size)
 
     def __enter__(self):
         return self
@@ -426,7 +454,9 @@ class Session(SessionRedirectMixin):
             verify=None,
             cert=None,
             json=None,
-            url_encode=True
+            url_encode=True,
+            deadline=None,
+            min_rate=None,
     ):
         """Constructs a :class:`Request <Request>`, prepares it and sends it.
         Returns :class:`Response <Response>` object.
@@ -467,6 +497,11 @@ class Session(SessionRedirectMixin):
             may be useful during local development or testing.
         :param cert: (optional) if String, path to ssl client cert file (.pem).
             If Tuple, ('cert', 'key') pair.
+        :param deadline: (optional) Seconds for the whole request, from
+            connecting to the last byte of the body, whatever the server's
+            pace; :class:`~httpsec.timeouts.DeadlineExceeded` is raised past it.
+        :param min_rate: (optional) Bytes per second the response must arrive
+            at on average once it has started.
         :rtype: requests.Response
         """
         # 处理所有参数
@@ -474,7 +509,8 @@ class Session(SessionRedirectMixin):
             pass
         if isinstance(timeout, (int, float)):
             timeout = (timeout, timeout)
-        resp = self.send(method, url=url, proxies=proxies,timeout=timeout)
+        resp = self.send(method, url=url, data=data, headers=headers, proxies=proxies, timeout=timeout,
+                         stream=stream, verify=verify, cert=cert, deadline=deadline, min_rate=min_rate)
         return resp
 
     def get(self, url, **kwargs):
@@ -573,18 +609,38 @@ class Session(SessionRedirectMixin):
              stream=None,
              verify=None,
              cert=None,
-             json=None, ):
+             json=None,
+             deadline=None,
+             min_rate=None, ):
         """Send a given PreparedRequest.
 
         :rtype: requests.Response
         """
         proxies = proxies or self.proxies
+        if isinstance(url, URL):
+            url = url.url
         # 解析URL
         parsed = urlparse(url)
         proxy = proxies.get(parsed.scheme)
         # 这里可以判断是否需要使用代理
-        response = self.adapter.send(method, url=url, proxy=proxy,timeout=timeout)
-        return self.build_response(url, response)
+        if verify is None:
+            verify = self.verify
+        if cert is None:
+            cert = self.cert
+        if not isinstance(timeout, tuple):
+            # None (no timeout) or a float for both
+            timeout = (timeout, timeout)
+        if self.headers:
+            headers = OrderedDict(self.headers, **(headers or {}))
+        response = self.adapter.send(method, url=url, proxy=proxy, timeout=timeout, verify=verify, cert=cert,
+                                     body=data, headers=headers, deadline=deadline, min_rate=min_rate)
+        r = self.build_response(url, response)
+        if stream is None:
+            stream = self.stream
+        if not stream:
+            # Read the body so the connection goes back to the pool.
+            r.content
+        return r
 
     def build_response(self, url, http_response):
         return self.responseCls.from_http_response(url, http_response)
@@ -620,6 +676,259 @@ class Session(SessionRedirectMixin):
 
         return {"proxies": proxies, "stream": stream, "verify": verify, "cert": cert}
 
+    def imap(self, requests, max_workers=32, ordered=False, scheduler=None, **kwargs):
+        r"""Sends many requests on a thread pool and yields a
+        :class:`~httpsec.model.Result` for each as it completes.
+
+        ``requests`` is consumed lazily: at most ``2 * max_workers`` requests
+        are in flight or waiting, so it may be an arbitrarily long iterator.
+        All workers share this session's connection pools.
+
+        :param requests: Iterable of :class:`~httpsec.model.Request` objects,
+            dicts of their arguments, or bare URLs (sent as ``GET``).
+        :param max_workers: Number of worker threads.
+        :param ordered: Yield results in input order rather than as they
+            complete.
+        :param scheduler: (optional) :class:`~httpsec.scheduler.HostScheduler`
+            that picks the next request per host, reading up to its
+            ``max_pending`` requests ahead instead of sending them in order.
+            With ``ordered``, input stops being read while
+            ``REORDER_WINDOW * max_workers`` results wait on an earlier one.
+        :param \*\*kwargs: Default arguments for :meth:`request`, overridden by
+            each request's own.
+        """
+        if scheduler is not None:
+            yield from self._imap_scheduled(requests, max_workers, ordered, scheduler, kwargs)
+            return
+        requests = iter(requests)
+        backlog = max_workers * 2
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        pending = deque()
+        exhausted = False
+        try:
+            while True:
+                while not exhausted and len(pending) < backlog:
+                    spec = next(requests, _Null)
+                    if spec is _Null:
+                        exhausted = True
+                        break
+                    pending.append(executor.submit(self._send_batched, Request.from_spec(spec), kwargs))
+                if not pending:
+                    return
+                if ordered:
+                    yield pending.popleft().result()
+                else:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        pending.remove(future)
+                        yield future.result()
+        finally:
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=False)
+
+    def _imap_scheduled(self, requests, max_workers, ordered, scheduler, defaults):
+        requests = iter(requests)
+        index = itertools.count()
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        # future -> host key it was scheduled for
+        running = {}
+        order = ReorderBuffer(max_held=REORDER_WINDOW * max_workers)
+        exhausted = False
+        try:
+            while True:
+                while not exhausted and not scheduler.full and not order.full:
+                    spec = next(requests, _Null)
+                    if spec is _Null:
+                        exhausted = True
+                        break
+                    request = Request.from_spec(spec)
+                    scheduler.push(self._host_key(request), (next(index), request))
+                while len(running) < max_workers:
+                    task = scheduler.pop()
+                    if task is None:
+                        break
+                    key, (i, request) = task
+                    running[executor.submit(self._send_timed, i, request, defaults)] = key
+                if not running:
+                    return
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    key = running.pop(future)
+                    i, result, elapsed = future.result()
+                    scheduler.done(key, elapsed)
+                    if not ordered:
+                        yield result
+                        continue
+                    yield from order.add(i, result)
+        finally:
+            for future in running:
+                future.cancel()
+            executor.shutdown(wait=False)
+
+    def _host_key(self, request):
+        """The :class:`~httpsec.adapters.PoolKey` of the target host, not of a proxy."""
+        url = request.url.url if isinstance(request.url, URL) else request.url
+        try:
+            parsed = urlparse(url)
+            return self.adapter.pool_key_for(parsed.scheme, parsed.hostname, parsed.port)
+        except (AttributeError, TypeError, ValueError):
+            # sent anyway, so the error ends up in its Result
+            return None
+
+    def map(self, requests, max_workers=32, **kwargs):
+        """Like :meth:`imap`, but returns the list of results in input order.
+
+        :rtype: list
+        """
+        return list(self.imap(requests, max_workers=max_workers, ordered=True, **kwargs))
+
+    def _send_batched(self, request, defaults):
+        kwargs = dict(defaults, **request.kwargs)
+        try:
+            response = self.request(request.method, request.url, headers=request.headers, data=request.data,
+                                    **kwargs)
+        except Exception as e:
+            return Result(request, None, e)
+        return Result(request, response, None)
+
+    def _send_timed(self, index, request, defaults):
+        start = time.monotonic()
+        result = self._send_batched(request, defaults)
+        return index, result, time.monotonic() - start
+
+    def pipeline(self, requests, depth=10, max_workers=1, timeout=None, verify=None, cert=None, proxies=None):
+        """Sends requests with HTTP/1.1 pipelining and yields a
+        :class:`~httpsec.model.Result` for each as its batch completes.
+
+        Requests are grouped by origin as they come in; each group of
+        ``depth`` requests is written back to back on one connection before
+        the responses are read, which saves a round trip per request against
+        servers that tolerate it. Requests the server left unanswered are
+        resent on a new connection. Bodies are always read in full.
+
+        Usage::
+
+          >>> s = Session()
+          >>> for result in s.pipeline(("http://example.com/" + w for w in words), depth=20):
+          ...     print(result.request.url, result.response.status_code)
+
+        :param requests: Iterable of :class:`~httpsec.model.Request` objects,
+            dicts of their arguments, or bare URLs (sent as ``GET``). Only
+            their method, URL, headers and data are used.
+        :param depth: Requests written on a connection before reading.
+        :param max_workers: Number of batches sent in parallel, each on its
+            own connection.
+        :param timeout: (optional) A float or a ``(connect timeout, read
+            timeout)`` tuple.
+        """
+        if not isinstance(timeout, tuple):
+            timeout = (timeout, timeout)
+        if verify is None:
+            verify = self.verify
+        if cert is None:
+            cert = self.cert
+        proxies = proxies or self.proxies
+
+        def batches():
+            groups = OrderedDict()
+            for spec in requests:
+                request = Request.from_spec(spec)
+                url = request.url.url if isinstance(request.url, URL) else request.url
+                parsed = urlparse(url)
+                group = groups.setdefault((parsed.scheme, parsed.netloc), [])
+                group.append((request, url))
+                if len(group) >= depth:
+                    yield groups.pop((parsed.scheme, parsed.netloc))
+            yield from groups.values()
+
+        def send(batch):
+            proxy = proxies.get(urlparse(batch[0][1]).scheme)
+            specs = []
+            for request, url in batch:
+                headers = request.headers
+                if self.headers:
+                    headers = OrderedDict(self.headers, **(headers or {}))
+                specs.append((request.method, url, request.data, headers))
+            try:
+                answers = self.adapter.pipeline(specs, proxy=proxy, timeout=timeout, verify=verify, cert=cert)
+            except Exception as e:
+                return [Result(request, None, e) for request, _ in batch]
+            results = []
+            for (request, url), (raw, exception) in zip(batch, answers):
+                if exception is not None:
+                    results.append(Result(request, None, exception))
+                    continue
+                response = self.build_response(url, raw)
+                response.raw = None
+                response._content = raw.body
+                response._content_consumed = True
+                results.append(Result(request, response, None))
+            return results
+
+        source = batches()
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        pending = set()
+        exhausted = False
+        try:
+            while True:
+                while not exhausted and len(pending) < max_workers * 2:
+                    batch = next(source, _Null)
+                    if batch is _Null:
+                        exhausted = True
+                        break
+                    pending.add(executor.submit(send, batch))
+                if not pending:
+                    return
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield from future.result()
+        finally:
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=False)
+
+    def preconnect(self, urls, per_host=1, timeout=DEFAULT_PRECONNECT_TIMEOUT, verify=None, cert=None, proxies=None,
+                   max_workers=32):
+        """Opens ``per_host`` connections to each of ``urls`` in parallel,
+        including the TLS handshake for https, and keeps them in the pools
+        for the requests that follow.
+
+        :param urls: :class:`SafeURL` objects, URLs or bare hosts.
+        :param timeout: Connect timeout covering the TLS handshake, a float
+            or a ``(connect timeout, read timeout)`` tuple; ``None`` waits
+            as long as the server takes.
+        :return: The number of connections opened.
+        :rtype: int
+        """
+        if isinstance(timeout, tuple):
+            timeout = timeout[0]
+        if verify is None:
+            verify = self.verify
+        if cert is None:
+            cert = self.cert
+        proxies = proxies or self.proxies
+
+        # proxies are picked per scheme, like in send()
+        by_proxy = OrderedDict()
+        for url in urls:
+            scheme, sep, _ = str(url).partition("://")
+            by_proxy.setdefault(proxies.get(scheme if sep else "http"), []).append(url)
+
+        opened = 0
+        for proxy, group in by_proxy.items():
+            opened += self.adapter.preconnect(group, per_host=per_host, proxy=proxy, timeout=timeout,
+                                              verify=verify, cert=cert, max_workers=max_workers)
+        return opened
+
+    def resolve_many(self, hosts, max_workers=32):
+        """Resolves ``hosts`` in parallel before a run, so connections
+        find their addresses (or cached NXDOMAIN answers) in the cache.
+
+        :rtype: dict
+        """
+        return self.adapter.resolver.resolve_many(hosts, max_workers=max_workers)
+
     def get_adapter(self, url):
         """
         Returns the appropriate connection adapter for the given URL.
@@ -0,0 +1,122 @@
+"""
+httpsec.timeouts
+~~~~~~~~~~~~~~~~
+
+A deadline for a whole request, from connect to the last byte of the body,
+and an optional minimum transfer rate.
+"""
+import socket
+import time
+from contextlib import contextmanager
+
+#: Request phases a deadline can run out in.
+PHASES = ("connect", "tls", "send", "headers", "body")
+
+
+class DeadlineExceeded(socket.timeout):
+    """
+    A request ran past its deadline, or received its response slower than
+    its minimum rate.
+
+    :ivar phase: One of :data:`PHASES`.
+    :ivar elapsed: Seconds since the request started.
+    :ivar reason: ``"deadline"`` or ``"rate"``.
+    """
+
+    def __init__(self, phase, elapsed, reason="deadline"):
+        if reason == "rate":
+            message = "transfer too slow during %s after %.2fs" % (phase, elapsed)
+        else:
+            message = "deadline exceeded during %s after %.2fs" % (phase, elapsed)
+        super(DeadlineExceeded, self).__init__(message)
+        self.phase = phase
+        self.elapsed = elapsed
+        self.reason = reason
+
+    def __reduce__(self):
+        return self.__class__, (self.phase, self.elapsed, self.reason)
+
+
+class Deadline(object):
+    """
+    Time budget of one request, shared by every blocking call made for it.
+
+    Each call gets the smaller of its own timeout and what is left of the
+    budget, so a server dripping a byte at a time cannot keep the request
+    alive past ``total`` seconds. With ``min_rate``, the response must also
+    keep arriving at ``min_rate`` bytes per second on average once its first
+    byte is in, after a ``grace`` period.
+
+    :param total: Seconds for the whole request, unlimited if ``None``.
+    :param min_rate: Bytes per second the response must average, unchecked
+        if ``None``.
+    :param grace: Seconds after the first byte before ``min_rate`` applies.
+    """
+
+    def __init__(self, total=None, min_rate=None, grace=1.0):
+        self.start = time.monotonic()
+        self.expires = None if total is None else self.start + total
+        self.min_rate = min_rate
+        self.grace = grace
+        self.phase = PHASES[0]
+        self.received = 0
+        self._first_byte = None
+        # what capped the last timeout handed out: None, "deadline" or "rate"
+        self._bound = None
+
+    def _exceeded(self, reason, now=None):
+        now = time.monotonic() if now is None else now
+        return DeadlineExceeded(self.phase, now - self.start, reason)
+
+    def timeout(self, limit, phase):
+        """
+        Socket timeout for the next blocking call in ``phase``: ``limit``
+        capped by what is left. Raises :class:`DeadlineExceeded` if nothing is.
+        """
+        self.phase = phase
+        if not isinstance(limit, (int, float)):
+            # None or the socket module's default sentinel
+            limit = None
+        self._bound = None
+        now = time.monotonic()
+        if self.expires is not None:
+            left = self.expires - now
+            if left <= 0:
+                raise self._exceeded("deadline", now)
+            if limit is None or left < limit:
+                limit, self._bound = left, "deadline"
+        if self.min_rate and self._first_byte is not None:
+            left = self._first_byte + self.grace + self.received / self.min_rate - now
+            if left <= 0:
+                raise self._exceeded("rate", now)
+            if limit is None or left < limit:
+                limit, self._bound = left, "rate"
+        return limit
+
+    def check(self, phase=None):
+        """Raise :class:`DeadlineExceeded` if the deadline has passed."""
+        if phase is not None:
+            self.phase = phase
+        if self.expires is not None and time.monotonic() >= self.expires:
+            raise self._exceeded("deadline")
+
+    @contextmanager
+    def watch(self):
+        """Report a socket timeout raised in the block as
+        :class:`DeadlineExceeded` when the deadline or rate had set it."""
+        try:
+            yield
+        except socket.timeout as e:
+            if self._bound is None or isinstance(e, DeadlineExceeded):
+                raise
+            raise self._exceeded(self._bound) from e
+
+    def recv_into(self, sock, buffer, idle_timeout):
+        """``sock.recv_into(buffer)`` within the budget and the idle timeout."""
+        sock.settimeout(self.timeout(idle_timeout, self.phase))
+        with self.watch():
+            n = sock.recv_into(buffer)
+        if n and self._first_byte is None:
+            self._first_byte = time.monotonic()
+        self.received += n
+        return n
@@ -8,7 +8,7 @@ class URL(object):
 
     def __init__(self, base_url=None, scheme=None, auth=None, host=None, query=None, port=None, path=None,
                  fragment=None):
-        self.auth = self.scheme = self.host = self.port = self.query = self.path = None
+        self.auth = self.scheme = self.host = self.port = self.query = self.path = self.fragment = None
         if base_url:
             parsed = urllib.parse.urlparse(base_url)
             self.scheme = parsed.scheme
@@ -31,7 +31,7 @@ class URL(object):
         if path is not None:
             self.path = path
 
-        if self.fragment is not None:
+        if fragment is not None:
             self.fragment = fragment
 
     @property
@@ -93,3 +93,33 @@ class URL(object):
 
 class SafeURL(URL):
     pass
+
+
+def split_origin(url):
+    """
+    ``(scheme, host, port)`` of ``url``, a :class:`URL` or a string. ``port``
+    is ``None`` when the URL does not name one.
+    """
+    if isinstance(url, URL):
+        return url.scheme, url.host, url.port
+    parsed = urllib.parse.urlparse(url)
+    return parsed.scheme, parsed.hostname, parsed.port
+
+
+def request_target(url):
+    """
+    The part of ``url`` after the authority, exactly as given, for the
+    request line.
+    """
+    if isinstance(url, URL):
+        target = url.request_uri
+        if url.fragment:
+            target += "#" + url.fragment
+        return target
+    _, sep, rest = url.partition("://")
+    if not sep:
+        return url or "/"
+    for i, char in enumerate(rest):
+        if char in "/?#":
+            return rest[i:] if char == "/" else "/" + rest[i:]
+    return "/"
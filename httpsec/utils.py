@@ -1,12 +1,34 @@
+import functools
+import os
+import ssl
 import typing
+import weakref
+from collections import OrderedDict
 from collections.abc import MutableMapping
-from multiprocessing import RLock
+from threading import RLock
 
 import socks
 from urllib3.util import parse_url
 
 _Null = object()
 
+#: Results per worker an ordered ``imap`` holds back behind a slow request
+#: before it stops reading input.
+REORDER_WINDOW = 4
+
+# Containers whose lock is replaced in a forked child: a lock held by
+# another thread at fork time would never be released there.
+_fork_reinit_containers = weakref.WeakValueDictionary()
+
+
+def _reinit_container_locks():
+    for container in list(_fork_reinit_containers.values()):
+        container.lock = RLock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reinit_container_locks)
+
 
 def iterkeys(d, **kw):
     return iter(d.keys(**kw))
@@ -28,9 +50,12 @@ class RecentlyUsedContainer(MutableMapping):
     :param dispose_func:
         Every time an item is evicted from the container,
         ``dispose_func(value)`` is called.  Callback which will get called
+
+    The ``hits``, ``misses`` and ``evictions`` counters tell whether
+    ``maxsize`` is large enough for the working set.
     """
 
-    ContainerCls = typing.OrderedDict
+    ContainerCls = OrderedDict
 
     def __init__(self, maxsize=10, dispose_func=None):
         self._maxsize = maxsize
@@ -38,13 +63,19 @@ class RecentlyUsedContainer(MutableMapping):
 
         self._container = self.ContainerCls()
         self.lock = RLock()
+        _fork_reinit_containers[id(self)] = self
+        self.hits = self.misses = self.evictions = 0
 
     def __getitem__(self, key):
-        # Re-insert the item, moving it to the end of the eviction line.
+        # Move the item to the end of the eviction line.
         with self.lock:
-            item = self._container.pop(key)
-            self._container[key] = item
-            return item
+            try:
+                self._container.move_to_end(key)
+            except KeyError:
+                self.misses += 1
+                raise
+            self.hits += 1
+            return self._container[key]
 
     def __setitem__(self, key, value):
         evicted_value = _Null
@@ -57,6 +88,7 @@ class RecentlyUsedContainer(MutableMapping):
             # least recently used item from the beginning of the container.
             if len(self._container) > self._maxsize:
                 _key, evicted_value = self._container.popitem(last=False)
+                self.evictions += 1
 
         if self.dispose_func and evicted_value is not _Null:
             self.dispose_func(evicted_value)
@@ -91,6 +123,132 @@ class RecentlyUsedContainer(MutableMapping):
         with self.lock:
             return list(iterkeys(self._container))
 
+    def values(self):
+        with self.lock:
+            return list(itervalues(self._container))
+
+
+class ReorderBuffer(object):
+    """
+    Puts results that complete out of order back in input order.
+
+    A slow request at the head holds back everything after it; callers stop
+    reading input while the buffer is :attr:`full` so it cannot grow
+    without bound.
+
+    Usage::
+
+      >>> order = ReorderBuffer(max_held=128)
+      >>> order.add(1, "b")
+      []
+      >>> order.add(0, "a")
+      ['a', 'b']
+
+    :param max_held: Results held back before :attr:`full`, unlimited if
+        ``None``.
+    """
+    __slots__ = ("_held", "_next", "max_held")
+
+    def __init__(self, max_held=None):
+        # input position -> result waiting for the ones before it
+        self._held = {}
+        self._next = 0
+        self.max_held = max_held
+
+    def __len__(self):
+        return len(self._held)
+
+    @property
+    def full(self):
+        """Whether :attr:`max_held` results are waiting."""
+        return self.max_held is not None and len(self._held) >= self.max_held
+
+    def add(self, index, result):
+        """Take the result at input position ``index`` and return the
+        results now due, in order."""
+        held = self._held
+        held[index] = result
+        ready = []
+        while self._next in held:
+            ready.append(held.pop(self._next))
+            self._next += 1
+        return ready
+
+
+@functools.lru_cache(maxsize=64)
+def create_ssl_context(verify=True, cert=None, minimum_version=None, ciphers=None):
+    """
+    Build the :class:`ssl.SSLContext` for a TLS configuration.
+
+    Results are cached, so every HTTPS connection with the same settings
+    shares one context instead of reloading the CA store.
+
+    :param verify: ``True`` to verify against the system CA store, a path to
+        a CA bundle file or directory, or ``False`` to skip verification
+        (no CA store is loaded at all).
+    :param cert: Client certificate, a path to a .pem file or a
+        ``(cert, key)`` tuple.
+    :param minimum_version: Lowest :class:`ssl.TLSVersion` to offer.
+    :param ciphers: OpenSSL cipher string.
+    """
+    if verify is False:
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+    elif verify is True:
+        context = ssl.create_default_context()
+    elif os.path.isdir(verify):
+        context = ssl.create_default_context(capath=verify)
+    else:
+        context = ssl.create_default_context(cafile=verify)
+
+    if cert:
+        if isinstance(cert, str):
+            context.load_cert_chain(cert)
+        else:
+            context.load_cert_chain(*cert)
+    # enable PHA for TLS 1.3 connections if available
+    if context.post_handshake_auth is not None:
+        context.post_handshake_auth = True
+    if minimum_version is not None:
+        context.minimum_version = minimum_version
+    if ciphers:
+        context.set_ciphers(ciphers)
+    return context
+
+
+class TLSSessionCache(object):
+    """
+    Keeps the last :class:`ssl.SSLSession` per (context, host, port, SNI)
+    so new connections can resume it and skip the full handshake.
+
+    ``hits`` counts resumed handshakes and ``misses`` full ones.
+    """
+
+    def __init__(self, maxsize=10000):
+        self._sessions = RecentlyUsedContainer(maxsize)
+        self.hits = self.misses = 0
+
+    def get(self, context, key):
+        return self._sessions.get((context, key))
+
+    def update(self, context, key, sock):
+        """Record the outcome of a handshake on ``sock`` and keep its session."""
+        if sock.session_reused:
+            self.hits += 1
+        else:
+            self.misses += 1
+        self.save(context, key, sock)
+
+    def save(self, context, key, sock):
+        session = sock.session
+        # a TLS 1.3 session is only resumable once its ticket has arrived
+        if session is not None and session.has_ticket:
+            self._sessions[(context, key)] = session
+
+    def clear(self):
+        self._sessions.clear()
+
 
 def get_environ_proxies(url, no_proxy=None):
     return {
@@ -0,0 +1,141 @@
+import os
+import shutil
+import socket
+import ssl
+import subprocess
+import threading
+
+import pytest
+
+
+class ScriptedServer(object):
+    """
+    Loopback server answering every request it reads with the next bytes
+    of ``replies``, verbatim, on whichever connection the request came in.
+    A ``None`` reply, or any reply with ``close_after_reply``, ends the
+    connection. With an ``ssl_context`` every connection is TLS. Request
+    lines go to ``requests`` and bodies to ``bodies``.
+    """
+
+    def __init__(self, replies, close_after_reply=False, ssl_context=None):
+        self.replies = list(replies)
+        self.close_after_reply = close_after_reply
+        self.ssl_context = ssl_context
+        self.requests = []
+        self.bodies = []
+        self.connections = 0
+        self._sock = socket.socket()
+        self._sock.bind(("127.0.0.1", 0))
+        self._sock.listen(16)
+        self.port = self._sock.getsockname()[1]
+        self.url = "%s://127.0.0.1:%d" % ("https" if ssl_context else "http", self.port)
+        threading.Thread(target=self._serve, daemon=True).start()
+
+    def _serve(self):
+        while True:
+            try:
+                conn, _ = self._sock.accept()
+            except OSError:
+                return
+            self.connections += 1
+            threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+
+    def _handle(self, conn):
+        if self.ssl_context is not None:
+            try:
+                conn = self.ssl_context.wrap_socket(conn, server_side=True)
+            except (OSError, ssl.SSLError):
+                conn.close()
+                return
+        fp = conn.makefile("rb")
+        try:
+            while True:
+                line = fp.readline()
+                if not line:
+                    return
+                length, chunked = 0, False
+                while True:
+                    header = fp.readline()
+                    if header in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = header.partition(b":")
+                    name = name.strip().lower()
+                    if name == b"content-length":
+                        length = int(value)
+                    elif name == b"transfer-encoding":
+                        chunked = b"chunked" in value.lower()
+                self.requests.append(line)
+                self.bodies.append(self._read_chunked(fp) if chunked else fp.read(length))
+                if not self.replies:
+                    return
+                reply = self.replies.pop(0)
+                if reply is None:
+                    return
+                conn.sendall(reply)
+                if self.close_after_reply:
+                    return
+        except OSError:
+            pass
+        finally:
+            fp.close()
+            conn.close()
+
+    @staticmethod
+    def _read_chunked(fp):
+        chunks = []
+        while True:
+            size = int(fp.readline().split(b";")[0], 16)
+            if not size:
+                while fp.readline() not in (b"\r\n", b"\n", b""):
+                    pass
+                return b"".join(chunks)
+            chunks.append(fp.read(size))
+            fp.readline()
+
+    def close(self):
+        self._sock.close()
+
+
+@pytest.fixture
+def scripted():
+    servers = []
+
+    def start(*replies, **kwargs):
+        server = ScriptedServer(replies, **kwargs)
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.close()
+
+
+@pytest.fixture(scope="session")
+def certificate(tmp_path_factory):
+    """Self-signed ``(cert, key)`` paths for 127.0.0.1, made by the
+    ``openssl`` command line tool."""
+    if shutil.which("openssl") is None:
+        pytest.skip("needs the openssl command")
+    directory = tmp_path_factory.mktemp("tls")
+    cert, key = os.path.join(directory, "cert.pem"), os.path.join(directory, "key.pem")
+    subprocess.run(["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+                    "-subj", "/CN=127.0.0.1", "-addext", "subjectAltName=IP:127.0.0.1",
+                    "-keyout", key, "-out", cert], check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return cert, key
+
+
+@pytest.fixture
+def server_context(certificate):
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(*certificate)
+    return context
+
+
+@pytest.fixture
+def silent_server():
+    """A listening socket that accepts connections and never answers."""
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    sock.listen(16)
+    yield "http://127.0.0.1:%d" % sock.getsockname()[1]
+    sock.close()
@@ -0,0 +1,306 @@
+import gc
+import io
+import os
+import socket
+import struct
+import threading
+import time
+
+import pytest
+from urllib3.exceptions import EmptyPoolError
+from urllib3.util.wait import wait_for_read
+
+from httpsec import httpclient
+from httpsec.adapters import HTTPAdapter
+from httpsec.connection import HTTPConnection, HTTPSConnection
+from httpsec.connectionpool import HostConnectionPool
+from httpsec.resolver import Resolver
+from httpsec.sessions import Session
+from httpsec.utils import create_ssl_context
+
+OK = b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\nok"
+
+
+def new_pool(server, **kwargs):
+    key = HTTPAdapter().pool_key_for("http", "127.0.0.1", server.port)
+    return HostConnectionPool(key, lambda: HTTPConnection("127.0.0.1", server.port, timeout=2), **kwargs)
+
+
+def request_on(conn):
+    conn.request("GET", "/")
+    return conn.getresponse().read()
+
+
+def test_pooled_connection_is_checked_out_again(scripted):
+    server = scripted(OK, OK)
+    pool = new_pool(server)
+    conn = pool._get_conn()
+    assert request_on(conn) == b"ok"
+    sock = conn.sock
+    pool._put_conn(conn)
+    conn = pool._get_conn()
+    assert conn.sock is sock
+    assert request_on(conn) == b"ok"
+    assert server.connections == 1
+
+
+def test_dropped_pooled_connection_is_reset_on_checkout(scripted):
+    server = scripted(OK, OK, close_after_reply=True)
+    pool = new_pool(server)
+    conn = pool._get_conn()
+    assert request_on(conn) == b"ok"
+    pool._put_conn(conn)
+    time.sleep(0.1)
+    conn = pool._get_conn()
+    assert conn.sock is None
+    assert request_on(conn) == b"ok"
+    assert server.connections == 2
+
+
+def test_unused_tls_connection_is_not_reset_by_its_session_tickets(scripted, server_context, certificate):
+    server = scripted(OK, ssl_context=server_context)
+    key = HTTPAdapter().pool_key_for("https", "127.0.0.1", server.port)
+    context = create_ssl_context(certificate[0])
+    pool = HostConnectionPool(key, lambda: HTTPSConnection("127.0.0.1", server.port, timeout=2, context=context))
+    conn = pool._get_conn()
+    conn.connect()
+    sock = conn.sock
+    pool._put_conn(conn)
+    # TLS 1.3 sends its tickets after the handshake
+    assert wait_for_read(sock, timeout=1)
+    assert pool._get_conn().sock is sock
+    assert request_on(conn) == b"ok"
+
+
+def test_pool_hands_out_the_most_recently_returned_connection(scripted):
+    pool = new_pool(scripted(), maxsize=2)
+    first, second = pool._get_conn(), pool._get_conn()
+    pool._put_conn(first)
+    pool._put_conn(second)
+    assert pool._get_conn() is second
+    assert pool._get_conn() is first
+
+
+def test_pool_without_block_opens_extra_connections_and_drops_them(scripted):
+    pool = new_pool(scripted(), maxsize=1)
+    first, extra = pool._get_conn(), pool._get_conn()
+    assert extra is not first and pool.num_connections == 2
+    pool._put_conn(first)
+    closed = []
+    extra.close = lambda: closed.append(extra)
+    pool._put_conn(extra)
+    assert closed == [extra]
+    assert pool._get_conn() is first
+
+
+def test_pool_block_waits_for_a_connection(scripted):
+    pool = new_pool(scripted(), maxsize=1, block=True)
+    conn = pool._get_conn()
+    with pytest.raises(EmptyPoolError):
+        pool._get_conn(timeout=0.05)
+    threading.Timer(0.1, pool._put_conn, (conn,)).start()
+    assert pool._get_conn(timeout=2) is conn
+    assert pool.num_connections == 1
+
+
+def test_idle_connection_past_the_servers_keep_alive_timeout_is_retired(scripted):
+    # retired a second early, or at half of a short timeout
+    server = scripted(b"HTTP/1.1 200 OK\r\nKeep-Alive: timeout=1.2, max=50\r\nContent-Length: 2\r\n\r\nok", OK)
+    pool = new_pool(server, idle_timeout=30)
+    conn = pool._get_conn()
+    assert request_on(conn) == b"ok"
+    assert (conn.keep_alive_timeout, conn.keep_alive_max) == (1.2, 50)
+    pool._put_conn(conn)
+    assert pool._get_conn().sock is not None
+    pool._put_conn(conn)
+    conn.idle_since -= 0.6
+    assert pool._get_conn().sock is None
+    assert request_on(conn) == b"ok"
+    assert server.connections == 2
+
+
+def test_connection_is_retired_after_max_requests(scripted):
+    server = scripted(OK, OK)
+    pool = new_pool(server, max_requests=1)
+    conn = pool._get_conn()
+    assert request_on(conn) == b"ok"
+    pool._put_conn(conn)
+    assert pool._get_conn().sock is None
+
+
+def test_reap_closes_expired_idle_sockets(scripted):
+    server = scripted(OK, OK)
+    pool = new_pool(server, maxsize=2, idle_timeout=0.2)
+    conns = [pool._get_conn(), pool._get_conn()]
+    for conn in conns:
+        assert request_on(conn) == b"ok"
+        pool._put_conn(conn)
+    assert pool.reap() == 0
+    time.sleep(0.3)
+    assert pool.reap() == 2
+    assert [conn.sock for conn in conns] == [None, None]
+
+
+def test_new_tls_connections_resume_the_session(scripted, server_context, certificate):
+    server = scripted(OK, OK, OK, close_after_reply=True, ssl_context=server_context)
+    s = Session()
+    for _ in range(3):
+        assert s.get(server.url + "/", timeout=(2, 2), verify=certificate[0]).content == b"ok"
+    assert server.connections == 3
+    sessions = s.adapter.tls_sessions
+    assert (sessions.misses, sessions.hits) == (1, 2)
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="needs fork()")
+def test_forked_child_drops_inherited_pools(scripted):
+    server = scripted(OK, OK, OK)
+    s = Session()
+    assert s.get(server.url + "/", timeout=(2, 2)).content == b"ok"
+    assert len(s.adapter.pools) == 1
+    pid = os.fork()
+    if pid == 0:
+        try:
+            fresh = len(s.adapter.pools) == 0
+            body = s.get(server.url + "/", timeout=(2, 2)).content
+            os._exit(0 if (fresh, body) == (True, b"ok") else 1)
+        except BaseException:
+            os._exit(2)
+    _, status = os.waitpid(pid, 0)
+    assert status == 0
+    # the parent's pooled connection is untouched
+    assert len(s.adapter.pools) == 1
+    assert s.get(server.url + "/", timeout=(2, 2)).content == b"ok"
+
+
+def test_reused_connection_sends_within_the_connect_timeout(scripted, monkeypatch):
+    server = scripted(OK, OK)
+    seen = []
+    send = httpclient.HTTPConnection.send
+
+    def recording_send(self, data):
+        # None before the first request connects
+        seen.append(self.sock and self.sock.gettimeout())
+        return send(self, data)
+
+    monkeypatch.setattr(httpclient.HTTPConnection, "send", recording_send)
+    s = Session()
+    s.get(server.url + "/", timeout=(2, 5))
+    s.get(server.url + "/", timeout=(3, 5))
+    assert server.connections == 1
+    assert seen == [None, 3]
+
+
+class SocksServer(object):
+    """
+    SOCKS4/4a/5 proxy on loopback that records the destination it is asked
+    for and then answers the HTTP request itself.
+    """
+
+    def __init__(self):
+        self.destinations = []
+        self._sock = socket.socket()
+        self._sock.bind(("127.0.0.1", 0))
+        self._sock.listen(4)
+        self.port = self._sock.getsockname()[1]
+        threading.Thread(target=self._serve, daemon=True).start()
+
+    def _serve(self):
+        while True:
+            try:
+                conn, _ = self._sock.accept()
+            except OSError:
+                return
+            with conn, conn.makefile("rb") as fp:
+                self._handshake(conn, fp)
+                while fp.readline() not in (b"\r\n", b""):
+                    pass
+                conn.sendall(OK)
+
+    def _handshake(self, conn, fp):
+        version = fp.read(1)
+        if version == b"\x04":
+            _, port, ip = struct.unpack("!BH4s", fp.read(7))
+            while fp.read(1) != b"\x00":
+                pass
+            host = socket.inet_ntoa(ip)
+            if host.startswith("0.0.0."):
+                host = b"".join(iter(lambda: fp.read(1), b"\x00")).decode()
+            conn.sendall(b"\x00\x5a" + b"\x00" * 6)
+        else:
+            fp.read(fp.read(1)[0])
+            conn.sendall(b"\x05\x00")
+            _, _, _, atyp = fp.read(4)
+            if atyp == 1:
+                host = socket.inet_ntop(socket.AF_INET, fp.read(4))
+            elif atyp == 4:
+                host = socket.inet_ntop(socket.AF_INET6, fp.read(16))
+            else:
+                host = fp.read(fp.read(1)[0]).decode()
+            port = struct.unpack("!H", fp.read(2))[0]
+            conn.sendall(b"\x05\x00\x00\x01" + b"\x00" * 6)
+        self.destinations.append((host, port))
+
+    def close(self):
+        self._sock.close()
+
+
+@pytest.mark.parametrize("scheme, destination", [
+    # SOCKS4 only takes IPv4: skip the IPv6 address listed first
+    ("socks4", "127.0.0.1"),
+    ("socks4a", "dual.test"),
+    ("socks5", "::1"),
+    ("socks5h", "dual.test"),
+])
+def test_request_through_socks_proxy(scheme, destination):
+    proxy = SocksServer()
+    try:
+        s = Session()
+        s.adapter = HTTPAdapter(resolver=Resolver(overrides=["dual.test:*:::1,127.0.0.1"]))
+        proxies = {"http": "%s://127.0.0.1:%d" % (scheme, proxy.port)}
+        r = s.get("http://dual.test:8080/", proxies=proxies, timeout=(2, 2))
+        assert r.content == b"ok"
+        assert proxy.destinations == [(destination, 8080)]
+    finally:
+        proxy.close()
+
+
+def test_idle_connections_are_reaped_by_default(scripted):
+    server = scripted(OK)
+    s = Session(idle_timeout=0.05, reap_interval=0.05)
+    assert s.adapter.idle_timeout == 0.05 and s.adapter._reaper is not None
+    s.get(server.url + "/", timeout=2)
+    (pool,) = s.adapter.pools.values()
+    (conn,) = [c for c in pool.pool.queue if c]
+    assert conn.sock is not None
+    time.sleep(0.3)
+    assert conn.sock is None
+
+
+def test_reaper_does_not_keep_the_adapter_alive():
+    adapter = HTTPAdapter(reap_interval=0.05)
+    reaper = adapter._reaper
+    del adapter
+    gc.collect()
+    reaper.join(1)
+    assert not reaper.is_alive()
+
+
+def test_dropped_reused_connection_resends_a_file_body_from_its_start(scripted):
+    server = scripted(OK, None, OK)
+    s = Session()
+    s.get(server.url + "/a", timeout=(2, 2))
+    body = io.BytesIO(b"--abcd")
+    body.seek(2)
+    assert s.put(server.url + "/b", data=body, timeout=(2, 2)).content == b"ok"
+    assert server.requests[1:] == [b"PUT /b HTTP/1.1\r\n"] * 2
+    assert server.bodies[1:] == [b"abcd", b"abcd"]
+
+
+def test_dropped_reused_connection_does_not_resend_a_spent_iterator(scripted):
+    server = scripted(OK, None, OK)
+    s = Session()
+    s.get(server.url + "/a", timeout=(2, 2))
+    with pytest.raises(ConnectionResetError):
+        s.put(server.url + "/b", data=iter([b"ab", b"cd"]), timeout=(2, 2))
+    assert server.requests == [b"GET /a HTTP/1.1\r\n", b"PUT /b HTTP/1.1\r\n"]
+    assert server.bodies[1:] == [b"abcd"]
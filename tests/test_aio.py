@@ -0,0 +1,35 @@
+import asyncio
+import time
+
+import pytest
+
+from httpsec.aio import AsyncConnection, AsyncSession
+from httpsec.limits import Limiter
+from httpsec.resolver import Resolver
+
+OK = b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\nok"
+
+
+def test_connect_timeout_covers_every_address(monkeypatch):
+    async def hang(*args, **kwargs):
+        await asyncio.sleep(60)
+
+    monkeypatch.setattr(asyncio, "open_connection", hang)
+    resolver = Resolver(overrides=["slow.test:*:127.0.0.2,127.0.0.3,127.0.0.4,127.0.0.5"])
+    conn = AsyncConnection("slow.test", 80, resolver=resolver)
+    start = time.monotonic()
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(conn.connect(0.2))
+    assert time.monotonic() - start < 0.6
+
+
+def test_session_made_outside_the_loop_waits_on_its_limiter(scripted):
+    server = scripted(OK, OK, OK)
+    s = AsyncSession(limiter=Limiter(max_per_host=1))
+
+    async def main():
+        responses = await asyncio.gather(*[s.get(server.url + "/", timeout=2) for _ in range(3)])
+        await s.close()
+        return [r.content for r in responses]
+
+    assert asyncio.run(main()) == [b"ok"] * 3
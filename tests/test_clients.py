@@ -0,0 +1,43 @@
+import asyncio
+
+import pytest
+
+from httpsec.aio import AsyncSession
+from httpsec.engine import Engine
+from httpsec.sessions import Session
+
+OK = b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\nok"
+
+
+def session_get(url):
+    Session().get(url, timeout=2)
+
+
+def session_pipeline(url):
+    list(Session().pipeline([url], timeout=2))
+
+
+def engine_imap(url):
+    with Engine(timeout=(2, 2)) as engine:
+        list(engine.imap([url]))
+
+
+def async_get(url):
+    async def main():
+        async with AsyncSession() as s:
+            await s.get(url, timeout=2)
+
+    asyncio.run(main())
+
+
+@pytest.mark.parametrize("send", [session_get, session_pipeline, engine_imap, async_get])
+@pytest.mark.parametrize("path, target", [
+    ("/a/../b", b"/a/../b"),
+    ("/a?x=1", b"/a?x=1"),
+    ("/a#frag", b"/a#frag"),
+    ("", b"/"),
+])
+def test_every_client_sends_the_same_request_line(scripted, send, path, target):
+    server = scripted(OK)
+    send(server.url + path)
+    assert server.requests == [b"GET " + target + b" HTTP/1.1\r\n"]
@@ -0,0 +1,137 @@
+import socket
+import ssl
+import time
+
+import pytest
+
+from httpsec.engine import Engine
+from httpsec.utils import REORDER_WINDOW
+
+OK = b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\nok"
+
+
+@pytest.fixture
+def engine():
+    with Engine(max_connections=1, timeout=(2, 2)) as engine:
+        yield engine
+
+
+@pytest.fixture
+def broken_first_reuse(monkeypatch):
+    """Make the first send on a reused connection fail as if the server had
+    just closed it."""
+    send = Engine._send
+    broken = []
+
+    def flaky_send(self, conn):
+        if conn.reused and not broken:
+            broken.append(conn)
+            raise BrokenPipeError(32, "Broken pipe")
+        return send(self, conn)
+
+    monkeypatch.setattr(Engine, "_send", flaky_send)
+    return broken
+
+
+def test_send_error_on_reused_connection_is_retried(scripted, engine, broken_first_reuse):
+    server = scripted(OK, OK)
+    results = engine.map([server.url + "/a", server.url + "/b"])
+    assert broken_first_reuse
+    assert [(r.exception, r.response.content) for r in results] == [(None, b"ok"), (None, b"ok")]
+    assert server.connections == 2
+
+
+def test_send_error_on_reused_connection_fails_a_post_alone(scripted, engine, broken_first_reuse):
+    server = scripted(OK, OK)
+    results = engine.map([server.url + "/a", {"url": server.url + "/b", "method": "POST", "data": b"x"},
+                          server.url + "/c"])
+    assert results[0].response.content == b"ok"
+    assert isinstance(results[1].exception, BrokenPipeError)
+    assert results[2].response.content == b"ok"
+
+
+def test_keep_alive_connection_is_reused(scripted, engine):
+    server = scripted(OK, OK, OK)
+    results = engine.map([server.url + "/a", server.url + "/b", server.url + "/c"])
+    assert [r.response.content for r in results] == [b"ok", b"ok", b"ok"]
+    assert server.connections == 1
+
+
+def test_dropped_keep_alive_connection_is_retried(scripted, engine):
+    # the server answers /a, then closes the kept-alive socket on /b
+    server = scripted(OK, None, OK)
+    results = engine.map([server.url + "/a", server.url + "/b"])
+    assert [(r.exception, r.response.content) for r in results] == [(None, b"ok"), (None, b"ok")]
+    assert server.requests == [b"GET /a HTTP/1.1\r\n", b"GET /b HTTP/1.1\r\n", b"GET /b HTTP/1.1\r\n"]
+    assert server.connections == 2
+
+
+def test_dropped_keep_alive_connection_does_not_resend_a_post(scripted, engine):
+    server = scripted(OK, None, OK)
+    results = engine.map([server.url + "/a", {"url": server.url + "/b", "method": "POST", "data": b"x"}])
+    assert results[0].response.content == b"ok"
+    assert isinstance(results[1].exception, ConnectionResetError)
+    assert server.requests == [b"GET /a HTTP/1.1\r\n", b"POST /b HTTP/1.1\r\n"]
+
+
+def test_chunked_body(scripted, engine):
+    server = scripted(b"HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n"
+                      b"2\r\nab\r\n3\r\ncde\r\n0\r\n\r\n", OK)
+    results = engine.map([server.url + "/a", server.url + "/b"])
+    assert [r.response.content for r in results] == [b"abcde", b"ok"]
+    assert server.connections == 1
+
+
+def test_close_delimited_body(scripted, engine):
+    server = scripted(b"HTTP/1.1 200 OK\r\n\r\nuntil close", OK, close_after_reply=True)
+    results = engine.map([server.url + "/a", server.url + "/b"])
+    assert [r.response.content for r in results] == [b"until close", b"ok"]
+    assert server.connections == 2
+
+
+def test_tls(scripted, server_context, certificate):
+    server = scripted(OK, OK, ssl_context=server_context)
+    with Engine(max_connections=1, timeout=(2, 2), verify=certificate[0]) as engine:
+        results = engine.map([server.url + "/a", server.url + "/b"])
+    assert [(r.exception, r.response.content) for r in results] == [(None, b"ok"), (None, b"ok")]
+    assert server.connections == 1
+
+
+def test_tls_verify_failure(scripted, server_context):
+    server = scripted(OK, ssl_context=server_context)
+    with Engine(max_connections=1, timeout=(2, 2)) as engine:
+        result, = engine.map([server.url])
+    assert isinstance(result.exception, ssl.SSLCertVerificationError)
+
+
+def test_per_request_timeout(engine, silent_server):
+    start = time.monotonic()
+    result, = engine.map([{"url": silent_server, "timeout": 0.2}])
+    assert isinstance(result.exception, socket.timeout)
+    assert time.monotonic() - start < 1.5
+
+
+@pytest.mark.parametrize("ordered", [False, True])
+def test_ordered(scripted, silent_server, ordered):
+    server = scripted(OK)
+    requests = [{"url": silent_server, "timeout": 0.2}, server.url]
+    with Engine(max_connections=2, timeout=(2, 2)) as engine:
+        urls = [r.request.url for r in engine.imap(requests, ordered=ordered)]
+    assert urls == ([silent_server, server.url] if ordered else [server.url, silent_server])
+
+
+def test_ordered_stops_reading_behind_a_slow_request(scripted, silent_server):
+    server = scripted(*[OK] * 50)
+    read = []
+
+    def requests():
+        yield {"url": silent_server, "timeout": 0.5}
+        for i in range(49):
+            read.append(i)
+            yield server.url + "/%d" % i
+
+    with Engine(max_connections=2, timeout=(2, 2)) as engine:
+        results = engine.imap(requests(), ordered=True)
+        assert next(results).request.url == silent_server
+        assert len(read) <= REORDER_WINDOW * 2 + 2
+        assert [r.request.url for r in results] == [server.url + "/%d" % i for i in range(49)]
@@ -0,0 +1,62 @@
+import pickle
+
+from httpsec import headers
+from httpsec.headers import HTTPHeaders
+
+BLOCK = (b"Content-Type: text/html\r\n"
+         b"Set-Cookie: a=1\r\n"
+         b"X-Folded: one\r\n"
+         b"  two\r\n"
+         b"set-cookie: b=2\r\n"
+         b"\r\n")
+
+
+def test_fields_keep_order_casing_and_duplicates():
+    h = HTTPHeaders.parse(BLOCK)
+    assert h.items() == [("Content-Type", "text/html"), ("Set-Cookie", "a=1"), ("X-Folded", "one two"),
+                         ("set-cookie", "b=2")]
+    assert list(h) == ["Content-Type", "Set-Cookie", "X-Folded", "set-cookie"]
+    assert len(h) == 4
+    assert h.raw == BLOCK
+
+
+def test_lookups_are_case_insensitive_and_return_the_first_field():
+    h = HTTPHeaders.parse(BLOCK)
+    assert h["SET-COOKIE"] == h.get("set-cookie") == "a=1"
+    assert "content-type" in h and "Content-Length" not in h
+    assert h.get("Content-Length", "0") == "0"
+
+
+def test_getall():
+    h = HTTPHeaders.parse(BLOCK)
+    assert h.getall("Set-Cookie") == ["a=1", "b=2"]
+    assert h.getall("Content-Length") == []
+    assert h.get_all("Content-Length") is None
+
+
+def test_values_are_latin1():
+    h = HTTPHeaders.parse(b"X-Name: caf\xe9\r\n\r\n")
+    assert h["x-name"] == "caf\xe9"
+    assert h.raw_items() == [(b"X-Name", b"caf\xe9")]
+
+
+def test_names_are_interned_up_to_the_cap(monkeypatch):
+    monkeypatch.setattr(headers, "_NAMES", {})
+    monkeypatch.setattr(headers, "_KEYS", {})
+    monkeypatch.setattr(headers, "_MAX_NAMES", 2)
+    block = b"X-One: 1\r\nX-Two: 2\r\nX-Three: 3\r\n\r\n"
+    first, second = HTTPHeaders.parse(block), HTTPHeaders.parse(block)
+    assert set(headers._NAMES) == {b"X-One", b"X-Two"}
+    a1, b1, c1 = (name for name, _ in first.raw_items())
+    a2, b2, c2 = (name for name, _ in second.raw_items())
+    assert a1 is a2 and b1 is b2
+    assert c1 is not c2
+
+
+def test_pickle_round_trip():
+    h = HTTPHeaders.parse(BLOCK + b"bogus\r\n")
+    h["set-cookie"]  # build the index, it is not pickled
+    clone = pickle.loads(pickle.dumps(h))
+    assert clone.items() == h.items()
+    assert clone.raw == h.raw and clone.defects == h.defects
+    assert clone.getall("set-cookie") == ["a=1", "b=2"]
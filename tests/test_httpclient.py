@@ -0,0 +1,81 @@
+from http.client import IncompleteRead
+
+import pytest
+
+from httpsec.httpclient import HTTPConnection, parse_keep_alive
+from httpsec.sessions import Session
+
+
+def test_leftover_bytes_after_head_are_not_read_as_next_response(scripted):
+    # a HEAD answered with a body: those bytes must not become the status
+    # line of the next response on the connection
+    server = scripted(b"HTTP/1.1 200 OK\r\nContent-Length: 4\r\n\r\nxxxx",
+                      b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\nok")
+    s = Session()
+    assert s.request("HEAD", server.url + "/", timeout=(2, 2)).content == b""
+    r = s.get(server.url + "/", timeout=(2, 2))
+    assert (r.status_code, r.content) == (200, b"ok")
+    assert server.connections == 2
+
+
+def test_bytes_past_content_length_close_the_connection(scripted):
+    server = scripted(b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\nokHTTP/1.1 500 junk\r\n\r\n",
+                      b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\nok")
+    conn = HTTPConnection("127.0.0.1", server.port, timeout=2)
+    for _ in range(2):
+        conn.request("GET", "/")
+        response = conn.getresponse()
+        assert (response.status, response.read()) == (200, b"ok")
+    assert server.connections == 2
+
+
+def test_keep_alive_reuses_the_connection(scripted):
+    server = scripted(*[b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\nok"] * 3)
+    conn = HTTPConnection("127.0.0.1", server.port, timeout=2)
+    for _ in range(3):
+        conn.request("GET", "/")
+        assert conn.getresponse().read() == b"ok"
+    assert server.connections == 1
+
+
+def test_huge_content_length_is_not_preallocated(scripted):
+    server = scripted(b"HTTP/1.1 200 OK\r\nContent-Length: 100000000000000\r\n\r\nhello", close_after_reply=True)
+    r = Session().get(server.url + "/", timeout=(2, 2))
+    assert r.content == b"hello"
+
+
+def test_large_body_read_in_full(scripted):
+    body = bytes(range(256)) * 12289
+    server = scripted(b"HTTP/1.1 200 OK\r\nContent-Length: %d\r\n\r\n%s" % (len(body), body))
+    conn = HTTPConnection("127.0.0.1", server.port, timeout=2)
+    conn.request("GET", "/")
+    assert conn.getresponse().read() == body
+
+
+def test_short_body_raises_incomplete_read(scripted):
+    server = scripted(b"HTTP/1.1 200 OK\r\nContent-Length: 3000000\r\n\r\nhello", close_after_reply=True)
+    conn = HTTPConnection("127.0.0.1", server.port, timeout=2)
+    conn.request("GET", "/")
+    with pytest.raises(IncompleteRead) as e:
+        conn.getresponse().read()
+    assert e.value.partial == b"hello"
+
+
+def test_negative_chunk_size_raises(scripted):
+    server = scripted(b"HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n-1\r\nx\r\n0\r\n\r\n")
+    conn = HTTPConnection("127.0.0.1", server.port, timeout=2)
+    conn.request("GET", "/")
+    response = conn.getresponse()
+    with pytest.raises(IncompleteRead):
+        response.read()
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("timeout=5, max=100", (5.0, 100)),
+    ("Max=3,TIMEOUT=2.5", (2.5, 3)),
+    ("timeout=5", (5.0, None)),
+    ("timeout=soon, max=", (None, None)),
+    ("", (None, None)),
+])
+def test_parse_keep_alive(value, expected):
+    assert parse_keep_alive(value) == expected
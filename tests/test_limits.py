@@ -0,0 +1,84 @@
+import email.utils
+import time
+
+import pytest
+
+from httpsec.limits import AdaptiveLimiter, Limiter, parse_retry_after
+from httpsec.sessions import Session
+
+
+def test_wait_time_of_unknown_host_keeps_no_state():
+    limiter = AdaptiveLimiter(max_hosts=2)
+    limiter.acquire("a")
+    limiter.acquire("b")
+    limiter.release("a")
+    assert limiter.wait_time("c") == 0.0
+    assert set(limiter.metrics()) == {"a", "b"}
+    assert Limiter(max_per_host=1).wait_time("c") == 0.0
+
+
+def test_least_recently_used_idle_host_is_forgotten():
+    limiter = AdaptiveLimiter(max_hosts=3)
+    for host in ("a", "b", "c"):
+        limiter.acquire(host)
+    limiter.release("b")
+    limiter.release("c")
+    limiter.acquire("b")
+    limiter.release("b")
+    # "a" is busy and "c" was used before "b"
+    limiter.acquire("d")
+    assert set(limiter.metrics()) == {"a", "b", "d"}
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("120", 120.0),
+    (" 5 ", 5.0),
+    (email.utils.formatdate(1000030, usegmt=True), 30.0),
+    (email.utils.formatdate(999000, usegmt=True), 0.0),
+    ("soon", None),
+    ("-1", None),
+    ("", None),
+    (None, None),
+])
+def test_parse_retry_after(value, expected):
+    assert parse_retry_after(value, now=1000000) == expected
+
+
+def test_refusals_double_the_backoff_until_a_success():
+    limiter = Limiter(backoff=10)
+    limiter.observe("a", 429)
+    assert 9 < limiter.paused()["a"] <= 10
+    limiter.observe("a", 503)
+    assert 19 < limiter.paused()["a"] <= 20
+    limiter.observe("a", 200)
+    limiter.observe("b", 429)
+    limiter.observe("b", 200)
+    limiter.observe("b", 429)
+    assert 9 < limiter.paused()["b"] <= 10
+
+
+def test_retry_after_is_honoured_up_to_max_backoff():
+    limiter = Limiter(backoff=1, max_backoff=60)
+    limiter.observe("a", 429, {"Retry-After": "30"})
+    limiter.observe("b", 503, {"Retry-After": "3600"})
+    paused = limiter.paused()
+    assert 29 < paused["a"] <= 30
+    assert 59 < paused["b"] <= 60
+
+
+def test_acquire_waits_out_the_pause():
+    limiter = Limiter(backoff=0.2)
+    limiter.observe("a", 429)
+    assert 0 < limiter.wait_time("a") <= 0.2
+    start = time.monotonic()
+    limiter.acquire("a")
+    assert time.monotonic() - start >= 0.15
+    limiter.release("a")
+
+
+def test_session_pauses_a_host_that_answers_429(scripted):
+    server = scripted(b"HTTP/1.1 429 Too Many Requests\r\nretry-after: 30\r\nContent-Length: 0\r\n\r\n")
+    limiter = Limiter()
+    assert Session(limiter=limiter).get(server.url + "/", timeout=(2, 2)).status_code == 429
+    pauses = list(limiter.paused().values())
+    assert len(pauses) == 1 and 29 < pauses[0] <= 30
@@ -0,0 +1,114 @@
+from http.client import HTTPException, IncompleteRead, LineTooLong
+
+import pytest
+
+from httpsec.parser import Data, EndOfMessage, Headers, ResponseParser, Status
+
+CHUNKED = (b"HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n"
+           b"5;ext=1\r\nhello\r\n6\r\n world\r\n0\r\nX-Trailer: 1\r\n\r\n")
+LENGTH = b"HTTP/1.1 200 OK\r\nContent-Length: 5\r\n\r\nhello"
+
+
+def body(events):
+    return b"".join(event.data for event in events if type(event) is Data)
+
+
+def feed_bytewise(parser, data):
+    events = []
+    for i in range(len(data)):
+        events += parser.feed(data[i:i + 1])
+    return events
+
+
+@pytest.mark.parametrize("response, expected", [
+    (LENGTH, b"hello"),
+    (CHUNKED, b"hello world"),
+])
+def test_split_feeds_give_the_same_message(response, expected):
+    whole = ResponseParser().feed(response)
+    parser = ResponseParser()
+    split = feed_bytewise(parser, response)
+    assert parser.done
+    assert body(whole) == body(split) == expected
+    assert [type(e) for e in split if type(e) is not Data] == [Status, Headers, EndOfMessage]
+    assert split[0] == Status(11, 200, "OK")
+
+
+def test_interim_continue_is_skipped():
+    events = ResponseParser().feed(b"HTTP/1.1 100 Continue\r\n\r\n" + LENGTH)
+    assert events[0] == Status(11, 200, "OK")
+    assert body(events) == b"hello"
+
+
+def test_trailing_data_starts_the_next_response():
+    parser = ResponseParser()
+    events = parser.feed(LENGTH + CHUNKED[:20])
+    assert body(events) == b"hello" and parser.done
+    assert parser.trailing_data == CHUNKED[:20]
+    parser.next_response()
+    events = parser.feed(CHUNKED[20:])
+    assert body(events) == b"hello world" and parser.done
+    assert parser.trailing_data == b""
+
+
+def test_head_response_has_no_body():
+    parser = ResponseParser("HEAD")
+    events = parser.feed(LENGTH)
+    assert type(events[-1]) is EndOfMessage
+    assert parser.trailing_data == b"hello"
+
+
+def test_body_until_close():
+    parser = ResponseParser()
+    events = parser.feed(b"HTTP/1.0 200 OK\r\n\r\nabc")
+    events += parser.feed(b"def")
+    events += parser.feed_eof()
+    assert body(events) == b"abcdef"
+    assert type(events[-1]) is EndOfMessage
+
+
+def test_cut_short_body_raises():
+    parser = ResponseParser()
+    parser.feed(LENGTH[:-2])
+    with pytest.raises(IncompleteRead) as info:
+        parser.feed_eof()
+    assert info.value.expected == 2
+
+
+def test_bad_chunk_size_raises():
+    with pytest.raises(IncompleteRead):
+        ResponseParser().feed(b"HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n-1\r\n")
+
+
+def test_error_state_sticks():
+    parser = ResponseParser()
+    with pytest.raises(HTTPException):
+        parser.feed(b"FTP/1.0 200 OK\r\n\r\n")
+    with pytest.raises(HTTPException):
+        parser.feed(LENGTH)
+
+
+def test_line_limit_without_a_newline():
+    parser = ResponseParser(max_line=100)
+    with pytest.raises(LineTooLong):
+        feed_bytewise(parser, b"HTTP/1.1 200 OK\r\nX-Long: " + b"a" * 200)
+
+
+def test_header_limit_on_an_incomplete_block():
+    parser = ResponseParser(max_headers=3)
+    with pytest.raises(HTTPException, match="more than 3 headers"):
+        parser.feed(b"HTTP/1.1 200 OK\r\n" + b"A: 1\r\n" * 5)
+
+
+def test_lenient_headers_keep_defects():
+    parser = ResponseParser()
+    parser.feed(b"HTTP/1.1 200 OK\r\nbogus line\r\nX-A : 1\r\nContent-Length: 0\r\n\r\n")
+    assert parser.done
+    assert parser.headers.defects == [b"bogus line"]
+    assert parser.headers["x-a"] == "1"
+
+
+def test_strict_headers_reject_malformed_lines():
+    parser = ResponseParser(strict_headers=True)
+    with pytest.raises(HTTPException, match="malformed header line"):
+        parser.feed(b"HTTP/1.1 200 OK\r\nbogus line\r\nContent-Length: 0\r\n\r\n")
@@ -0,0 +1,82 @@
+import io
+
+from httpsec.adapters import HTTPAdapter
+from httpsec.httpclient import HTTPConnection
+from httpsec.limits import Limiter
+from httpsec.sessions import Session
+
+
+def reply(body):
+    return b"HTTP/1.1 200 OK\r\nContent-Length: %d\r\n\r\n%s" % (len(body), body)
+
+
+class RecordingLimiter(Limiter):
+
+    def __init__(self, **kwargs):
+        super(RecordingLimiter, self).__init__(**kwargs)
+        self.observed = []
+
+    def observe(self, host, status, headers=None, elapsed=None):
+        self.observed.append((status, elapsed))
+        super(RecordingLimiter, self).observe(host, status, headers, elapsed)
+
+
+def test_pipelined_batch_takes_a_token_per_request(scripted):
+    server = scripted(*[reply(b"%d" % i) for i in range(5)])
+    # refills too slowly to matter here
+    limiter = RecordingLimiter(rate_per_host=0.001, burst=5)
+    adapter = HTTPAdapter(limiter=limiter)
+    requests = [("GET", server.url + "/%d" % i, None, None) for i in range(5)]
+    answers = adapter.pipeline(requests, timeout=(2, 2))
+    assert [response.body for response, _ in answers] == [b"0", b"1", b"2", b"3", b"4"]
+    assert limiter._hosts["127.0.0.1"].bucket.tokens < 0.01
+    assert limiter.wait_time("127.0.0.1") > 0
+    assert [status for status, _ in limiter.observed] == [200] * 5
+    assert all(elapsed is not None and elapsed > 0 for _, elapsed in limiter.observed)
+
+
+def test_connection_pipeline_answers_in_order(scripted):
+    server = scripted(*[reply(b"%d" % i) for i in range(3)])
+    conn = HTTPConnection("127.0.0.1", server.port, timeout=2)
+    responses = conn.pipeline([("GET", "/%d" % i, None, None) for i in range(3)])
+    assert [(r.status, r.body) for r in responses] == [(200, b"0"), (200, b"1"), (200, b"2")]
+    assert server.connections == 1
+
+
+def test_session_pipeline_yields_every_result(scripted):
+    server = scripted(*[reply(b"%d" % i) for i in range(6)])
+    results = list(Session().pipeline([server.url + "/%d" % i for i in range(6)], depth=3, timeout=2))
+    assert sorted((r.request.url, r.response.content) for r in results) == \
+        [(server.url + "/%d" % i, b"%d" % i) for i in range(6)]
+    # the second batch goes out on the pooled connection
+    assert server.connections == 1
+
+
+def test_unanswered_requests_are_resent_but_not_a_post(scripted):
+    # the server answers two requests, then drops the connection on the third
+    server = scripted(reply(b"0"), reply(b"1"), None, reply(b"3"), reply(b"4"))
+    requests = [("GET", server.url + "/0", None, None),
+                ("GET", server.url + "/1", None, None),
+                ("POST", server.url + "/2", b"x", None),
+                ("GET", server.url + "/3", None, None),
+                ("GET", server.url + "/4", None, None)]
+    answers = HTTPAdapter().pipeline(requests, timeout=(2, 2))
+    assert [response.body for response, _ in answers[:2]] == [b"0", b"1"]
+    response, error = answers[2]
+    assert response is None and error is not None
+    assert [response.body for response, _ in answers[3:]] == [b"3", b"4"]
+    assert server.requests.count(b"POST /2 HTTP/1.1\r\n") == 1
+    assert server.connections == 2
+
+
+def test_unanswered_file_body_is_rewound_and_an_iterator_is_not_resent(scripted):
+    server = scripted(reply(b"0"), None, reply(b"2"))
+    requests = [("GET", server.url + "/0", None, None),
+                ("PUT", server.url + "/1", iter([b"ab", b"cd"]), None),
+                ("PUT", server.url + "/2", io.BytesIO(b"xy"), None)]
+    answers = HTTPAdapter().pipeline(requests, timeout=(2, 2))
+    assert answers[0][0].body == b"0"
+    assert answers[1][0] is None and answers[1][1] is not None
+    assert answers[2][0].body == b"2"
+    assert server.requests == [b"GET /0 HTTP/1.1\r\n", b"PUT /1 HTTP/1.1\r\n", b"PUT /2 HTTP/1.1\r\n"]
+    assert server.bodies == [b"", b"abcd", b"xy"]
@@ -0,0 +1,61 @@
+import socket
+import time
+
+from httpsec.resolver import Resolver, create_connection
+
+
+def test_cache_ignores_the_case_of_host_names(monkeypatch):
+    lookups = []
+
+    def getaddrinfo(host, port, family=0, type=0, proto=0, flags=0):
+        lookups.append(host)
+        return [(socket.AF_INET, socket.SOCK_STREAM, 6, "", ("127.0.0.1", 0))]
+
+    monkeypatch.setattr(socket, "getaddrinfo", getaddrinfo)
+    resolver = Resolver()
+    assert resolver.resolve("Example.TEST", 80)[0][4] == ("127.0.0.1", 80)
+    assert resolver.cached("example.test", 443)[0][4] == ("127.0.0.1", 443)
+    resolver.resolve("EXAMPLE.test", 80)
+    assert lookups == ["Example.TEST"]
+
+
+class StubResolver(Resolver):
+    """Answers every name with ``infos``, ports included."""
+
+    def __init__(self, infos):
+        super(StubResolver, self).__init__()
+        self.infos = infos
+
+    def resolve(self, host, port, family=socket.AF_UNSPEC):
+        return list(self.infos)
+
+
+def listener(backlog=16):
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    sock.listen(backlog)
+    return sock
+
+
+def test_connect_race_moves_on_from_an_address_that_never_answers():
+    # a full accept queue drops the SYNs of further connects
+    blackhole = listener(0)
+    fillers = []
+    for _ in range(4):
+        filler = socket.socket()
+        filler.setblocking(False)
+        filler.connect_ex(blackhole.getsockname())
+        fillers.append(filler)
+    good = listener()
+    infos = [(socket.AF_INET, socket.SOCK_STREAM, 6, "", sock.getsockname()) for sock in (blackhole, good)]
+    try:
+        start = time.monotonic()
+        sock = create_connection(("stub.test", 0), timeout=5, resolver=StubResolver(infos),
+                                 happy_eyeballs_delay=0.2)
+        elapsed = time.monotonic() - start
+        assert sock.getpeername() == good.getsockname()
+        assert 0.2 <= elapsed < 1.0
+        sock.close()
+    finally:
+        for sock in fillers + [blackhole, good]:
+            sock.close()
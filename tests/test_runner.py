@@ -0,0 +1,48 @@
+import pytest
+
+from httpsec.model import Request
+from httpsec.runner import ProcessRunner
+from httpsec.utils import REORDER_WINDOW
+
+OK = b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\nok"
+
+
+def test_same_request_sent_several_times(scripted):
+    server = scripted(*[OK] * 3)
+    request = Request(server.url + "/")
+    results = ProcessRunner(processes=1, max_workers=1, timeout=(2, 2)).map([request] * 3)
+    assert [result.request for result in results] == [request] * 3
+    assert [result.response.status_code for result in results] == [200] * 3
+
+
+def test_error_reading_requests_is_raised():
+    def requests():
+        yield "http://127.0.0.1:1/"
+        raise ValueError("bad input")
+
+    with pytest.raises(ValueError, match="bad input"):
+        list(ProcessRunner(processes=1, timeout=(1, 1)).imap(requests()))
+
+
+def test_bad_request_spec_is_raised():
+    with pytest.raises(TypeError):
+        list(ProcessRunner(processes=1).imap([{"method": "GET"}]))
+
+
+@pytest.mark.parametrize("use_engine", [False, True])
+def test_ordered_stops_reading_behind_a_slow_request(scripted, silent_server, use_engine):
+    server = scripted(*[OK] * 100)
+    read = []
+
+    def requests():
+        yield {"url": silent_server, "timeout": 0.5}
+        for i in range(99):
+            read.append(i)
+            yield server.url + "/%d" % i
+
+    runner = ProcessRunner(processes=1, max_workers=2, use_engine=use_engine, batch_size=1, timeout=(2, 2))
+    results = runner.imap(requests(), ordered=True)
+    assert next(results).exception is not None
+    # the reorder window, the worker's read-ahead and its inbox
+    assert len(read) <= REORDER_WINDOW * 2 + 2 * 2 + 4 + 2
+    assert [r.request.url for r in results] == [server.url + "/%d" % i for i in range(99)]
@@ -0,0 +1,75 @@
+from httpsec.scheduler import HostScheduler
+
+
+def drain(scheduler):
+    items = []
+    while True:
+        task = scheduler.pop()
+        if task is None:
+            return items
+        items.append(task)
+
+
+def test_hosts_take_turns():
+    scheduler = HostScheduler()
+    for item in ("a1", "a2", "a3"):
+        scheduler.push("a", item)
+    for item in ("b1", "b2"):
+        scheduler.push("b", item)
+    assert [item for _, item in drain(scheduler)] == ["a1", "b1", "a2", "b2", "a3"]
+    assert len(scheduler) == 0
+
+
+def test_weights_give_consecutive_turns():
+    scheduler = HostScheduler(weights={"a": 2})
+    for item in ("a1", "a2", "a3"):
+        scheduler.push("a", item)
+    for item in ("b1", "b2"):
+        scheduler.push("b", item)
+    assert [item for _, item in drain(scheduler)] == ["a1", "a2", "b1", "a3", "b2"]
+
+
+def test_max_per_host_skips_busy_hosts():
+    scheduler = HostScheduler(max_per_host=1)
+    for item in ("a1", "a2"):
+        scheduler.push("a", item)
+    scheduler.push("b", "b1")
+    assert drain(scheduler) == [("a", "a1"), ("b", "b1")]
+    scheduler.done("a")
+    assert drain(scheduler) == [("a", "a2")]
+
+
+def test_slow_host_is_limited_until_fast_again():
+    scheduler = HostScheduler(max_per_host=4, slow_threshold=1.0, slow_max_per_host=1)
+    for item in ("a1", "a2", "a3", "a4"):
+        scheduler.push("a", item)
+    key, _ = scheduler.pop()
+    scheduler.done(key, 2.0)
+    assert scheduler.stats()["a"]["slow"]
+    assert [item for _, item in drain(scheduler)] == ["a2"]
+    scheduler.done("a", 0.1)
+    assert not scheduler.stats()["a"]["slow"]
+    assert [item for _, item in drain(scheduler)] == ["a3", "a4"]
+
+
+def test_slow_host_goes_to_the_back_of_the_rotation():
+    scheduler = HostScheduler(slow_threshold=1.0, max_per_host=1)
+    for item in ("a1", "a2"):
+        scheduler.push("a", item)
+    scheduler.push("b", "b1")
+    assert scheduler.pop() == ("a", "a1")
+    scheduler.push("c", "c1")
+    scheduler.done("a", 2.0)
+    assert [item for _, item in drain(scheduler)] == ["b1", "c1", "a2"]
+
+
+def test_full_and_forgetting_idle_hosts():
+    scheduler = HostScheduler(max_pending=2)
+    scheduler.push("a", 1)
+    assert not scheduler.full
+    scheduler.push("b", 2)
+    assert scheduler.full
+    drain(scheduler)
+    assert not scheduler.full
+    scheduler.done("a", 0.5)
+    assert set(scheduler.stats()) == {"b"}
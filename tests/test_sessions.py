@@ -0,0 +1,89 @@
+import time
+
+from httpsec import connection
+from httpsec.adapters import DEFAULT_PRECONNECT_TIMEOUT
+from httpsec.scheduler import HostScheduler
+from httpsec.sessions import Session
+from httpsec.utils import REORDER_WINDOW
+
+OK = b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\nok"
+
+
+def test_request_without_timeout(scripted):
+    server = scripted(OK)
+    assert Session().get(server.url + "/").content == b"ok"
+
+
+def test_map_and_imap_without_timeout(scripted):
+    server = scripted(*[OK] * 4)
+    s = Session()
+    results = s.map([server.url + "/a", server.url + "/b"], max_workers=2)
+    assert [(r.exception, r.response.status_code) for r in results] == [(None, 200)] * 2
+    results = list(s.imap([server.url + "/c", server.url + "/d"], max_workers=2))
+    assert [r.exception for r in results] == [None, None]
+
+
+def test_ordered_imap_stops_reading_behind_a_slow_request(scripted, silent_server):
+    server = scripted(*[OK] * 100)
+    read = []
+
+    def requests():
+        yield {"url": silent_server, "timeout": 0.5}
+        for i in range(99):
+            read.append(i)
+            yield server.url + "/%d" % i
+
+    results = Session().imap(requests(), max_workers=2, ordered=True, scheduler=HostScheduler(max_pending=2))
+    first = next(results)
+    assert first.request.url == silent_server and first.exception is not None
+    # the reorder window, the scheduler's queue and the workers
+    assert len(read) <= REORDER_WINDOW * 2 + 2 + 2 + 1
+    assert [r.request.url for r in results] == [server.url + "/%d" % i for i in range(99)]
+
+
+def test_preconnect_parks_connections_for_the_requests_that_follow(scripted):
+    server = scripted(OK, OK)
+    s = Session(pool_maxsize=2)
+    host = "127.0.0.1:%d" % server.port
+    assert s.preconnect([server.url + "/a", server.url + "/b", host], per_host=2) == 2
+    assert s.map([server.url + "/a", server.url + "/b"], max_workers=2)[1].response.content == b"ok"
+    assert server.connections == 2
+
+
+def test_preconnect_completes_the_tls_handshake(scripted, server_context, certificate):
+    server = scripted(OK, ssl_context=server_context)
+    s = Session()
+    assert s.preconnect([server.url], verify=certificate[0]) == 1
+    assert s.adapter.tls_sessions.misses == 1
+    assert s.get(server.url + "/", timeout=(2, 2), verify=certificate[0]).content == b"ok"
+    assert server.connections == 1
+
+
+def test_preconnect_gives_up_on_a_stalled_handshake(silent_server):
+    start = time.monotonic()
+    assert Session().preconnect([silent_server.replace("http:", "https:")], timeout=0.2, verify=False) == 0
+    assert time.monotonic() - start < 1.5
+
+
+def test_preconnect_has_a_finite_default_timeout(scripted, monkeypatch):
+    server = scripted()
+    timeouts = []
+    connect = connection.HTTPConnection.connect
+
+    def recording_connect(self):
+        timeouts.append(self.timeout)
+        return connect(self)
+
+    monkeypatch.setattr(connection.HTTPConnection, "connect", recording_connect)
+    assert Session().preconnect([server.url]) == 1
+    assert timeouts == [DEFAULT_PRECONNECT_TIMEOUT]
+
+
+def test_response_headers_keep_duplicates_and_ignore_case(scripted):
+    server = scripted(b"HTTP/1.1 200 OK\r\nSet-Cookie: a=1\r\ncontent-type: text/plain\r\nset-cookie: b=2\r\n"
+                      b"Content-Length: 2\r\n\r\nok")
+    r = Session().get(server.url + "/", timeout=(2, 2))
+    assert r.headers["Content-Type"] == r.headers.get("CONTENT-TYPE") == "text/plain"
+    assert r.headers.getall("Set-Cookie") == ["a=1", "b=2"]
+    assert r.headers.items() == [("Set-Cookie", "a=1"), ("content-type", "text/plain"), ("set-cookie", "b=2"),
+                                 ("Content-Length", "2")]
@@ -0,0 +1,95 @@
+import socket
+import threading
+import time
+
+import pytest
+
+from httpsec.sessions import Session
+from httpsec.timeouts import DeadlineExceeded
+
+
+class DripServer(object):
+    """
+    Loopback server that reads one request, sends ``head`` at once, then
+    ``drip`` a byte at a time, ``interval`` seconds apart.
+    """
+
+    def __init__(self, head, drip, interval=0.05):
+        self.head = head
+        self.drip = drip
+        self.interval = interval
+        self._sock = socket.socket()
+        self._sock.bind(("127.0.0.1", 0))
+        self._sock.listen(4)
+        self.url = "http://127.0.0.1:%d/" % self._sock.getsockname()[1]
+        threading.Thread(target=self._serve, daemon=True).start()
+
+    def _serve(self):
+        try:
+            conn, _ = self._sock.accept()
+        except OSError:
+            return
+        try:
+            fp = conn.makefile("rb")
+            while fp.readline() not in (b"\r\n", b"\n", b""):
+                pass
+            conn.sendall(self.head)
+            for i in range(len(self.drip)):
+                time.sleep(self.interval)
+                conn.sendall(self.drip[i:i + 1])
+        except OSError:
+            pass
+        finally:
+            conn.close()
+
+    def close(self):
+        self._sock.close()
+
+
+@pytest.fixture
+def drip():
+    servers = []
+
+    def start(head, drip, **kwargs):
+        server = DripServer(head, drip, **kwargs)
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.close()
+
+
+def get(url, **kwargs):
+    start = time.monotonic()
+    with pytest.raises(DeadlineExceeded) as info:
+        Session().get(url, timeout=(5, 5), **kwargs)
+    return info.value, time.monotonic() - start
+
+
+def test_deadline_during_tls_handshake(silent_server):
+    e, elapsed = get(silent_server.replace("http:", "https:"), verify=False, deadline=0.3)
+    assert (e.phase, e.reason) == ("tls", "deadline")
+    assert elapsed < 1.5
+
+
+def test_deadline_while_headers_drip(drip):
+    server = drip(b"", b"HTTP/1.1 200 OK\r\n" + b"X-Slow: " + b"x" * 200 + b"\r\n\r\n")
+    e, elapsed = get(server.url, deadline=0.3)
+    assert (e.phase, e.reason) == ("headers", "deadline")
+    assert elapsed < 1.5
+
+
+def test_deadline_while_body_drips(drip):
+    server = drip(b"HTTP/1.1 200 OK\r\nContent-Length: 200\r\n\r\n", b"x" * 200)
+    e, elapsed = get(server.url, deadline=0.3)
+    assert (e.phase, e.reason) == ("body", "deadline")
+    assert elapsed < 1.5
+
+
+def test_min_rate_while_body_drips(drip):
+    server = drip(b"HTTP/1.1 200 OK\r\nContent-Length: 200\r\n\r\n", b"x" * 200)
+    e, elapsed = get(server.url, min_rate=1000)
+    assert (e.phase, e.reason) == ("body", "rate")
+    # the rate applies after a second's grace from the first byte
+    assert 1.0 <= elapsed < 3
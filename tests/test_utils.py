@@ -0,0 +1,34 @@
+import ssl
+
+from httpsec.utils import ReorderBuffer, create_ssl_context
+
+
+def test_reorder_buffer_releases_results_in_input_order():
+    order = ReorderBuffer()
+    assert order.add(2, "c") == []
+    assert order.add(1, "b") == []
+    assert order.add(0, "a") == ["a", "b", "c"]
+    assert order.add(4, "e") == []
+    assert order.add(3, "d") == ["d", "e"]
+
+
+def test_reorder_buffer_is_full_at_max_held():
+    order = ReorderBuffer(max_held=2)
+    order.add(1, "b")
+    assert not order.full
+    order.add(2, "c")
+    assert order.full and len(order) == 2
+    assert order.add(0, "a") == ["a", "b", "c"]
+    assert not order.full
+    assert not ReorderBuffer().full
+
+
+def test_ssl_contexts_are_shared_per_configuration(certificate):
+    cert, key = certificate
+    assert create_ssl_context() is create_ssl_context()
+    assert create_ssl_context(cert) is create_ssl_context(cert)
+    assert create_ssl_context(cert) is not create_ssl_context()
+    assert create_ssl_context(False) is not create_ssl_context(False, minimum_version=ssl.TLSVersion.TLSv1_3)
+    unverified = create_ssl_context(False)
+    assert (unverified.verify_mode, unverified.check_hostname) == (ssl.CERT_NONE, False)
+    assert create_ssl_context(cert, (cert, key)) is create_ssl_context(cert, (cert, key))